@@ -0,0 +1,404 @@
+"""
+Mode de service asynchrone (ASGI) de l'API Gateway
+
+Les routes relayées sans état partagé (/auth/*, /users*, /orders*) sont
+servies nativement avec un client HTTP non bloquant (aiohttp), de sorte
+qu'un seul processus puisse garder des milliers d'appels amont en cours.
+Elles passent par les mêmes couches que les routes Flask, en réutilisant
+leurs objets (seaux de jetons, disjoncteurs, budget de relances, registre
+de métriques) : limitation de débit, vérification du token, disjoncteur,
+relances des GET, métriques, X-Request-Id/Server-Timing, capture et
+compression. Seul le hedging des GET n'existe pas dans ce mode.
+
+Toutes les autres routes (/products* avec cache et regroupement des GET,
+/batch, /me/overview, /health, /metrics, pages HTML) restent servies par
+l'application Flask, montée en repli : une seule application, créée une
+seule fois (threads d'arrière-plan compris).
+
+Lancement : uvicorn app.asgi_app:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import time
+from functools import wraps
+import aiohttp
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from .auth_middleware import verify_token, AUTH_SERVICE_URL, USER_SERVICE_URL, ORDERS_SERVICE_URL
+from .service_client import UPSTREAM_TIMEOUT
+from .load_balancer import get_upstream
+from .upstream_pool import UPSTREAM_POOL_IDLE_TIMEOUT
+from .circuit_breaker import get_breaker, route_key
+from .retry import RETRY_MAX_ATTEMPTS, retry_budget, is_retryable, budget_allows, backoff
+from .rate_limit import RATE_LIMIT_ENABLED, check as rate_limit_check, rejected_body, resolve_client_ip
+from .compression import COMPRESSION_ENABLED, compress_body
+from .capture import writer as capture_writer, capture, capture_body
+from .passthrough import PASSTHROUGH_HEADERS
+from .metrics import registry
+from .tracing import REQUEST_ID_HEADER, start_trace, finish_trace
+
+
+class UpstreamResponse:
+    """Réponse amont lue en entier (statut, headers, corps)"""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+def _json_body(payload):
+    """Même encodage que flask.jsonify (clés triées, ASCII, compact)"""
+    return (json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _error(error, status):
+    """Erreur générée par la gateway (même forme que passthrough.error_response)"""
+    return _json_body({'success': False, 'error': error}), status, {}
+
+
+def _passthrough(result, error, status):
+    """Équivalent de passthrough_response : (corps, statut, headers)"""
+    if error:
+        return _error(error, status)
+
+    content_type = result.headers.get('Content-Type', '').split(';')[0].strip()
+    if content_type != 'application/json':
+        try:
+            return _json_body(json.loads(result.body)), result.status, {}
+        except ValueError as e:
+            return _error({'error': f'Erreur de communication avec le service: {str(e)}'}, 503)
+
+    # Corps JSON relayé octet pour octet
+    headers = {name: result.headers[name] for name in PASSTHROUGH_HEADERS if name in result.headers}
+    return result.body, result.status, headers
+
+
+async def _get_json(request):
+    """Équivalent de request.get_json(silent=True)"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+class AsyncServiceClient:
+    """Client non bloquant pour communiquer avec les microservices (voir ServiceClient)"""
+
+    _clients = {}
+
+    @classmethod
+    def client(cls, service_url):
+        """Session aiohttp partagée (pool keep-alive) pour une instance de service"""
+        client = cls._clients.get(service_url)
+        if client is None:
+            # Pas de limite de connexions : le nombre d'appels en vol n'est borné que par la boucle
+            connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=UPSTREAM_POOL_IDLE_TIMEOUT)
+            client = aiohttp.ClientSession(
+                base_url=service_url,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT)
+            )
+            cls._clients[service_url] = client
+        return client
+
+    @classmethod
+    async def close(cls):
+        for client in cls._clients.values():
+            await client.close()
+        cls._clients.clear()
+
+    @classmethod
+    async def send_request(cls, service_url, path, method='GET', data=None, headers=None, trace=None):
+        """
+        Envoie une requête vers un service
+
+        Retourne: (UpstreamResponse, error, status)
+        """
+        request_headers = {'Content-Type': 'application/json'}
+
+        if headers:
+            request_headers.update(headers)
+
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+            return None, {'error': 'Méthode HTTP non supportée'}, 405
+
+        if trace is not None:
+            request_headers.setdefault(REQUEST_ID_HEADER, trace.request_id)
+
+        if method != 'GET':
+            # Jamais de relance pour les méthodes non idempotentes
+            return await cls._send(service_url, path, method, data, request_headers, trace)
+
+        # GET idempotent : relances bornées par le budget global (voir retry.call_with_retries)
+        upstream = get_upstream(service_url)
+        retry_budget.deposit()
+        attempt = 1
+        while True:
+            result = await cls._send(service_url, path, method, None, request_headers, trace)
+            if (attempt >= RETRY_MAX_ATTEMPTS or not is_retryable(result)
+                    or not budget_allows('retry', upstream)):
+                return result
+            registry.inc('upstream_retries_total', (('upstream', upstream.name),))
+            await asyncio.sleep(backoff(attempt))
+            attempt += 1
+
+    @classmethod
+    async def _send(cls, service_url, path, method, data, request_headers, trace):
+        """Effectue l'appel HTTP vers une instance du service, derrière son disjoncteur"""
+        upstream = get_upstream(service_url)
+        route = route_key(method, path)
+        instance, allowed = upstream.acquire(route)
+        labels = (('instance', instance.url), ('upstream', upstream.name))
+        latency = None
+        try:
+            breaker = get_breaker(instance.url)
+            if not allowed:
+                # Aucun circuit n'accepte l'appel : échec immédiat au lieu d'attendre le timeout
+                registry.inc('upstream_requests_total', labels + (('outcome', 'circuit_open'),))
+                return None, {'error': 'Service temporairement indisponible (circuit ouvert)'}, 503
+
+            # Issue enregistrée quoi qu'il arrive (None : exception ou annulation côté gateway)
+            outcome = None
+            try:
+                registry.inc('upstream_requests_in_flight', labels, 1)
+                start = time.perf_counter()
+                attrs = {'instance': instance.url, 'method': method, 'path': path}
+                try:
+                    kwargs = {'json': data} if method in ('POST', 'PUT') else {}
+                    async with cls.client(instance.url).request(
+                            method, path, headers=request_headers,
+                            timeout=aiohttp.ClientTimeout(total=breaker.timeout(route)), **kwargs) as response:
+                        result = UpstreamResponse(response.status, response.headers, await response.read())
+                    attrs['status'] = result.status
+                except asyncio.TimeoutError as e:
+                    outcome = 'timeout'
+                    return None, {'error': f'Le service n\'a pas répondu à temps: {str(e)}'}, 504
+                except aiohttp.ClientError as e:
+                    outcome = 'network_error'
+                    return None, {'error': f'Erreur de communication avec le service: {str(e)}'}, 503
+                finally:
+                    elapsed = time.perf_counter() - start
+                    registry.inc('upstream_requests_in_flight', labels, -1)
+                    registry.observe('upstream_request_duration_seconds', labels, elapsed)
+                    if trace is not None:
+                        trace.add_span(f'upstream.{upstream.name}', start, elapsed, attrs)
+
+                if trace is not None and 'Server-Timing' in result.headers:
+                    trace.add_upstream_timing(upstream.name, result.headers['Server-Timing'])
+
+                if result.status >= 500:
+                    outcome = 'server_error'
+                else:
+                    outcome = 'success'
+                    latency = elapsed
+                return result, None, result.status
+            finally:
+                breaker.record(outcome, route, latency)
+                if outcome is not None:
+                    registry.inc('upstream_requests_total', labels + (('outcome', outcome),))
+        finally:
+            upstream.release(instance, latency)
+
+
+def _bearer_token(request):
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return auth_header.split(' ', 1)[1].strip()
+    return None
+
+
+def _request_claims(request, trace):
+    """Équivalent de request_claims : token vérifié une seule fois par requête"""
+    if not hasattr(request.state, 'token_claims'):
+        token = _bearer_token(request)
+        request.state.token_claims = None
+        if token:
+            start = time.perf_counter()
+            request.state.token_claims = verify_token(token)
+            trace.add_span('auth.verify_token', start, time.perf_counter() - start)
+    return request.state.token_claims
+
+
+async def _authenticate(request, trace):
+    """Équivalent de token_required : None si le token est valide, sinon la réponse 401"""
+    if not _bearer_token(request):
+        return _error({'code': 'MISSING_TOKEN',
+                       'message': 'Token manquant. Ajoutez un header Authorization: Bearer <token>.'}, 401)
+
+    payload = _request_claims(request, trace)
+    if not payload:
+        return _error({'code': 'INVALID_TOKEN', 'message': 'Token invalide ou expiré.'}, 401)
+
+    # Équivalent de g.current_user / g.token_payload
+    request.state.current_user = payload.get('sub')
+    request.state.token_payload = payload
+    return None
+
+
+def gateway_route(rule, policy, protected=False):
+    """
+    Route native : mêmes couches, dans le même ordre, que les routes Flask
+
+    rule est la règle Flask équivalente, utilisée comme label des métriques
+    et dans la capture (mêmes séries quel que soit le mode).
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def endpoint(request):
+            start = time.perf_counter()
+            registry.inc('http_requests_in_flight', (), 1)
+            try:
+                trace = start_trace(request.headers.get(REQUEST_ID_HEADER, ''), 'api-gateway')
+                request.state.current_user = None
+                data = await _get_json(request) if request.method in ('POST', 'PUT') else None
+
+                body, status, headers = await _handle(request, handler, trace, data, policy, protected)
+                headers['Content-Type'] = 'application/json'
+
+                # after_request de Flask, dans le même ordre : compression, capture, trace, métriques
+                if COMPRESSION_ENABLED and request.method != 'HEAD' and status == 200:
+                    headers['Vary'] = 'Accept-Encoding'
+                    body, encoding = compress_body(body, request.headers.get('Accept-Encoding', ''),
+                                                   rule, trace)
+                    if encoding is not None:
+                        headers['Content-Encoding'] = encoding
+                        etag = headers.get('ETag')
+                        if etag and not etag.startswith('W/'):
+                            headers['ETag'] = f'W/{etag}'
+
+                if capture_writer is not None:
+                    path = request.url.path + (f'?{request.url.query}' if request.url.query else '')
+                    capture(request.method, rule, path, 'Authorization' in request.headers,
+                            request.state.current_user,
+                            capture_body(data, request.headers.get('Content-Type', '').startswith('application/json'),
+                                         int(request.headers['Content-Length'])
+                                         if 'Content-Length' in request.headers else None),
+                            status, trace)
+
+                headers[REQUEST_ID_HEADER] = trace.request_id
+                headers['Server-Timing'] = finish_trace(trace, request.method, request.url.path, rule, status)
+
+                labels = (('method', request.method), ('route', rule))
+                registry.observe('http_request_duration_seconds', labels, time.perf_counter() - start)
+                registry.inc('http_requests_total', labels + (('status', str(status)),))
+                return Response(body, status_code=status, headers=headers)
+            finally:
+                registry.inc('http_requests_in_flight', (), -1)
+
+        return endpoint
+    return decorator
+
+
+async def _authenticated(request, handler, trace, data, protected):
+    """token_required, puis la route elle-même"""
+    if protected:
+        rejected = await _authenticate(request, trace)
+        if rejected is not None:
+            return rejected
+    return await handler(request, trace, data)
+
+
+async def _handle(request, handler, trace, data, policy, protected):
+    """rate_limit puis token_required, puis la route elle-même"""
+    if not RATE_LIMIT_ENABLED:
+        return await _authenticated(request, handler, trace, data, protected)
+
+    # Token absent ou invalide : la clé est l'IP, comme sur les routes publiques
+    claims = _request_claims(request, trace) if protected else None
+    client = request.client.host if request.client else None
+    allowed, limit_headers = rate_limit_check(policy, claims.get('sub') if claims else None,
+                                              resolve_client_ip(client, request.headers.get('X-Forwarded-For', '')))
+    if allowed:
+        body, status, headers = await _authenticated(request, handler, trace, data, protected)
+    else:
+        body, status, headers = _error(rejected_body(limit_headers)['error'], 429)
+    headers.update(limit_headers)
+    return body, status, headers
+
+
+# ========== Routes Auth Service ==========
+def _auth_forward(path, policy, protected=False):
+    @gateway_route(path, policy, protected)
+    async def endpoint(request, trace, data):
+        return _passthrough(*await AsyncServiceClient.send_request(
+            AUTH_SERVICE_URL, path, 'POST', data or {}, trace=trace))
+    return endpoint
+
+
+auth_login = _auth_forward('/auth/login', 'login')
+auth_refresh = _auth_forward('/auth/refresh', 'auth')
+auth_verify = _auth_forward('/auth/verify', 'auth')
+auth_register = _auth_forward('/auth/register', 'login')
+auth_logout = _auth_forward('/auth/logout', 'auth', protected=True)
+
+
+# ========== Routes User Service (protégées) ==========
+@gateway_route('/users', 'api', protected=True)
+async def users(request, trace, data):
+    headers = {'X-User-Id': request.state.current_user}
+    return _passthrough(*await AsyncServiceClient.send_request(
+        USER_SERVICE_URL, '/users', request.method, data, headers, trace))
+
+
+@gateway_route('/users/<int:user_id>', 'api', protected=True)
+async def user_detail(request, trace, data):
+    user_id = request.path_params['user_id']
+    headers = {'X-User-Id': request.state.current_user}
+    return _passthrough(*await AsyncServiceClient.send_request(
+        USER_SERVICE_URL, f'/users/{user_id}', request.method, data, headers, trace))
+
+
+@gateway_route('/users/profile', 'api', protected=True)
+async def user_profile(request, trace, data):
+    headers = {'X-User-Id': request.state.current_user}
+    return _passthrough(*await AsyncServiceClient.send_request(
+        USER_SERVICE_URL, '/users/profile', 'GET', None, headers, trace))
+
+
+# ========== Routes Orders Service (protégées) ==========
+@gateway_route('/orders', 'api', protected=True)
+async def orders(request, trace, data):
+    headers = {'X-User-Id': request.state.current_user}
+    return _passthrough(*await AsyncServiceClient.send_request(
+        ORDERS_SERVICE_URL, '/orders', request.method, data, headers, trace))
+
+
+@gateway_route('/orders/<int:order_id>', 'api', protected=True)
+async def order_detail(request, trace, data):
+    order_id = request.path_params['order_id']
+    headers = {'X-User-Id': request.state.current_user}
+    return _passthrough(*await AsyncServiceClient.send_request(
+        ORDERS_SERVICE_URL, f'/orders/{order_id}', request.method, data, headers, trace))
+
+
+routes = [
+    Route('/auth/login', auth_login, methods=['POST']),
+    Route('/auth/refresh', auth_refresh, methods=['POST']),
+    Route('/auth/verify', auth_verify, methods=['POST']),
+    Route('/auth/logout', auth_logout, methods=['POST']),
+    Route('/auth/register', auth_register, methods=['POST']),
+    Route('/users', users, methods=['GET', 'POST']),
+    Route('/users/profile', user_profile, methods=['GET']),
+    Route('/users/{user_id:int}', user_detail, methods=['GET', 'PUT', 'DELETE']),
+    Route('/orders', orders, methods=['GET', 'POST']),
+    Route('/orders/{order_id:int}', order_detail, methods=['GET', 'PUT']),
+]
+
+
+def create_asgi_app():
+    """
+    Factory pour créer l'application ASGI
+
+    L'application Flask (créée ici, une seule fois) sert toutes les autres routes
+    et démarre les threads d'arrière-plan.
+    """
+    from .main import create_app
+    app_routes = list(routes)
+    app_routes.append(Mount('/', app=WSGIMiddleware(create_app())))
+    return Starlette(routes=app_routes, on_shutdown=[AsyncServiceClient.close])
+
+
+app = create_asgi_app()
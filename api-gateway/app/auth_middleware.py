@@ -2,6 +2,10 @@
 Middleware pour la validation des tokens Authlib
 """
 from authlib.jose import jwt, JoseError
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 import requests
 from functools import wraps
 from flask import request, jsonify, g
@@ -12,30 +16,123 @@ SECRET_KEY = 'votre-cle-secrete-super-secure-2024-microservices'
 # URLs des services (utilise les noms de services Docker par défaut,
 # ou localhost en fallback pour l'exécution locale hors Docker)
 import os
+from .tracing import span
 
 AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL', 'http://localhost:8001')
 USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://localhost:8002')
 ORDERS_SERVICE_URL = os.getenv('ORDERS_SERVICE_URL', 'http://localhost:8003')
 
+# Nombre maximal de tokens vérifiés gardés en cache (0 pour désactiver)
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+
+class VerifiedClaimsCache:
+    """Cache LRU borné des claims déjà vérifiés, indexé par empreinte du token"""
+    
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+    
+    def get(self, key):
+        """Retourne les claims si présents et non expirés, sinon None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, exp = entry
+            # Même règle que claims.validate() : expiré dès que now > exp
+            if int(time.time()) > exp:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+    
+    def put(self, key, claims):
+        exp = claims.get('exp')
+        if self.maxsize <= 0 or not isinstance(exp, (int, float)):
+            return
+        with self._lock:
+            self._entries[key] = (claims, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+claims_cache = VerifiedClaimsCache()
+
 def verify_token(token):
     """Vérifie et décode un token JWT"""
+    # Un token déjà vérifié et non expiré évite la vérification de signature
+    key = VerifiedClaimsCache.key(token)
+    claims = claims_cache.get(key)
+    if claims is not None:
+        return claims
+    
     try:
         claims = jwt.decode(token, SECRET_KEY)
         claims.validate()
-        return claims
     except JoseError:
         return None
+    
+    claims_cache.put(key, claims)
+    return claims
+
+def bearer_token():
+    """Token du header Authorization: Bearer <token> (None si absent)"""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return auth_header.split(' ', 1)[1].strip() or None
+    return None
+
+def request_claims():
+    """
+    Claims du token de la requête (None si absent ou invalide)
+
+    Vérifié une seule fois par requête : @rate_limit, placé au-dessus de
+    @token_required, s'en sert pour choisir la clé de limitation.
+    """
+    if 'token_claims' not in g:
+        token = bearer_token()
+        if token:
+            with span('auth.verify_token'):
+                g.token_claims = verify_token(token)
+        else:
+            g.token_claims = None
+    return g.token_claims
 
 def token_required(f):
     """Décorateur pour protéger les routes nécessitant une authentification"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        token = None
-        
         # Récupérer le token depuis le header Authorization
-        auth_header = request.headers.get('Authorization', '')
-        if auth_header.startswith('Bearer '):
-            token = auth_header.split(' ', 1)[1].strip()
+        token = bearer_token()
         
         if not token:
             return jsonify({
@@ -47,7 +144,7 @@ def token_required(f):
             }), 401
         
         # Vérifier le token
-        payload = verify_token(token)
+        payload = request_claims()
         if not payload:
             return jsonify({
                 'success': False,
@@ -63,5 +160,7 @@ def token_required(f):
         
         return f(*args, **kwargs)
     
+    # Lu par @rate_limit : la clé de limitation est l'utilisateur, pas l'IP
+    decorated_function.requires_token = True
     return decorated_function
 
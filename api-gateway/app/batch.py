@@ -0,0 +1,82 @@
+"""
+Exécution groupée de sous-requêtes vers les routes de la gateway (POST /batch)
+"""
+import os
+from flask import current_app
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from .service_client import ServiceClient, fanout_executor
+from .tracing import bind
+
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '20'))
+
+# Routes de la gateway autorisées dans un batch, et service vers lequel elles sont relayées
+# (le chemin amont est identique au chemin de la gateway)
+BATCHABLE_ENDPOINTS = {
+    'gateway.users': ServiceClient.forward_to_user,
+    'gateway.user_detail': ServiceClient.forward_to_user,
+    'gateway.user_profile': ServiceClient.forward_to_user,
+    'gateway.products': ServiceClient.forward_to_orders,
+    'gateway.product_detail': ServiceClient.forward_to_orders,
+    'gateway.orders': ServiceClient.forward_to_orders,
+    'gateway.order_detail': ServiceClient.forward_to_orders,
+}
+
+
+def _item_error(code, message, status):
+    return status, {'success': False, 'error': {'code': code, 'message': message}}
+
+
+def _resolve(item):
+    """
+    Valide une sous-requête et retourne (forward, method, path, body)
+    ou (None, status, error_body) si elle est invalide
+    """
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        return (None,) + _item_error('INVALID_REQUEST', 'Chaque sous-requête doit avoir un champ path.', 400)
+
+    method = str(item.get('method', 'GET')).upper()
+    path = item['path']
+    if not path.startswith('/') or '?' in path:
+        return (None,) + _item_error('INVALID_PATH', f'Chemin invalide : {path}', 400)
+
+    try:
+        endpoint, _ = current_app.url_map.bind('').match(path, method=method)
+    except NotFound:
+        return (None,) + _item_error('NOT_FOUND', f'Route inconnue : {path}', 404)
+    except MethodNotAllowed:
+        return (None,) + _item_error('METHOD_NOT_ALLOWED', f'Méthode {method} non autorisée pour {path}', 405)
+
+    forward = BATCHABLE_ENDPOINTS.get(endpoint)
+    if forward is None:
+        return (None,) + _item_error('NOT_BATCHABLE', f'La route {path} ne peut pas être appelée dans un batch.', 400)
+
+    body = item.get('body') if method in ('POST', 'PUT') else None
+    return forward, method, path, body
+
+
+def run_batch(items, user):
+    """Exécute les sous-requêtes en parallèle et retourne les résultats dans l'ordre"""
+    headers = {'X-User-Id': user}
+    results = [None] * len(items)
+    futures = {}
+
+    for index, item in enumerate(items):
+        forward, *rest = _resolve(item)
+        if forward is None:
+            results[index] = tuple(rest)
+            continue
+        method, path, body = rest
+        futures[index] = fanout_executor.submit(bind(forward), path, method, body, headers)
+
+    for index, future in futures.items():
+        result, error, status = future.result()
+        results[index] = (status, {'success': False, 'error': error} if error else result)
+
+    return [
+        {
+            'id': item.get('id', index) if isinstance(item, dict) else index,
+            'status': status,
+            'body': body
+        }
+        for index, (item, (status, body)) in enumerate(zip(items, results))
+    ]
@@ -0,0 +1,184 @@
+"""
+Capture des requêtes relayées par la gateway (JSONL), pour les rejouer hors production
+
+Avec CAPTURE_FILE défini, chaque requête API est ajoutée au fichier : méthode,
+route, chemin, corps JSON, statut, durée côté gateway et utilisateur anonymisé.
+Le corps est filtré par liste blanche : seules les valeurs des champs de
+structure (KEPT_FIELDS : lignes de commande, statut, sous-requêtes de /batch)
+sont gardées telles quelles; username et email sont remplacés par un pseudonyme stable
+(HMAC avec CAPTURE_SALT : à fixer pour que plusieurs workers ou instances
+produisent les mêmes pseudonymes); toute autre valeur (mots de passe, tokens,
+nom, téléphone, adresse, champ inconnu) est masquée.
+
+Le coût sur la requête se limite à ajouter un dict en mémoire : la
+sérialisation et l'écriture (une seule par lot, O_APPEND) sont faites par un
+thread toutes les CAPTURE_FLUSH_INTERVAL secondes. Si l'écriture prend du
+retard, les enregistrements au-delà de CAPTURE_BUFFER_MAX sont abandonnés
+(compteur capture_dropped_total) plutôt que de ralentir les requêtes.
+
+Rejeu : benchmarks/replay.py
+"""
+import atexit
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from flask import g, request
+from .metrics import registry, COUNTER
+from .tracing import current_trace
+
+# Fichier JSONL de capture (vide : pas de capture)
+CAPTURE_FILE = os.getenv('CAPTURE_FILE', '')
+CAPTURE_SAMPLE_RATE = float(os.getenv('CAPTURE_SAMPLE_RATE', '1'))
+CAPTURE_BODIES = os.getenv('CAPTURE_BODIES', '1') == '1'
+CAPTURE_MAX_BODY = int(os.getenv('CAPTURE_MAX_BODY', '16384'))
+CAPTURE_FLUSH_INTERVAL = float(os.getenv('CAPTURE_FLUSH_INTERVAL', '1'))
+CAPTURE_BUFFER_MAX = int(os.getenv('CAPTURE_BUFFER_MAX', '10000'))
+# Sans sel fixé, les pseudonymes ne sont stables que dans un même processus
+CAPTURE_SALT = os.getenv('CAPTURE_SALT', '') or secrets.token_hex(16)
+
+# Champs du corps écrits en clair (sans donnée personnelle); les autres sont masqués
+REDACTED = '<redacted>'
+KEPT_FIELDS = frozenset(('product_id', 'quantity', 'status', 'method', 'path', 'id'))
+# Identifiants remplacés par un pseudonyme stable (relations conservées au rejeu)
+IDENTITY_FIELDS = frozenset(('username', 'email'))
+# Routes du blueprint qui ne sont pas relayées aux services
+EXCLUDED_ENDPOINTS = frozenset(('gateway.health',))
+
+registry.define('capture_records_total', COUNTER, 'Requêtes capturées')
+registry.define('capture_dropped_total', COUNTER, 'Requêtes non capturées (tampon plein)')
+
+
+def anonymize(value):
+    """Pseudonyme stable d'un identifiant (username, email)"""
+    digest = hmac.new(CAPTURE_SALT.encode(), str(value).encode(), hashlib.sha256).hexdigest()
+    return f'anon-{digest[:12]}'
+
+
+def scrub(value, key=None):
+    """
+    Copie du corps JSON sans donnée personnelle en clair
+
+    Dicts et listes sont parcourus; une valeur simple n'est gardée que sous
+    un champ de KEPT_FIELDS (key : champ le plus proche, None à la racine).
+    """
+    if isinstance(value, dict):
+        return {k: scrub(item, k) for k, item in value.items()}
+    if isinstance(value, list):
+        return [scrub(item, key) for item in value]
+    if value is None or key in KEPT_FIELDS:
+        return value
+    if key in IDENTITY_FIELDS and isinstance(value, str):
+        return anonymize(value)
+    return REDACTED
+
+
+class CaptureWriter:
+    """Tampon en mémoire vidé dans le fichier par un thread d'arrière-plan"""
+
+    def __init__(self, path, flush_interval=CAPTURE_FLUSH_INTERVAL, max_buffer=CAPTURE_BUFFER_MAX):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = deque()
+        self._fd = None
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def add(self, record):
+        # deque.append est atomique : aucun verrou sur le chemin de la requête
+        if len(self._buffer) >= self.max_buffer:
+            registry.inc('capture_dropped_total')
+            return
+        self._buffer.append(record)
+        registry.inc('capture_records_total')
+
+    def flush(self):
+        with self._flush_lock:
+            records = []
+            while self._buffer:
+                records.append(self._buffer.popleft())
+            if not records:
+                return
+            data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode()
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self._fd, data)
+
+    def start(self):
+        """Démarre le thread d'écriture (un par processus, après un éventuel fork)"""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except OSError as e:
+                    print(f"[API Gateway] Capture : écriture impossible dans {self.path} ({e})")
+
+        self._thread = threading.Thread(target=run, name='capture-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+        return self._thread
+
+
+writer = CaptureWriter(CAPTURE_FILE) if CAPTURE_FILE else None
+
+
+def start_capture_writer():
+    if writer is not None:
+        writer.start()
+
+
+def capture_body(data, is_json, content_length):
+    """Corps JSON de la requête tel qu'il sera capturé (None : non capturé)"""
+    if not CAPTURE_BODIES or not is_json:
+        return None
+    if content_length is not None and content_length > CAPTURE_MAX_BODY:
+        return None
+    return scrub(data)
+
+
+def capture(method, route, path, auth, user, body, status, trace):
+    """Ajoute une requête relayée au tampon (échantillonnée selon CAPTURE_SAMPLE_RATE)"""
+    if CAPTURE_SAMPLE_RATE < 1 and random.random() >= CAPTURE_SAMPLE_RATE:
+        return
+    writer.add({
+        'ts': round(trace.started_at if trace is not None else time.time(), 6),
+        'method': method,
+        'route': route,
+        'path': path,
+        'auth': auth,
+        'user': anonymize(user) if user else None,
+        'body': body,
+        'status': status,
+        'duration_ms': round((time.perf_counter() - trace.start) * 1000, 3) if trace is not None else None,
+        'request_id': trace.request_id if trace is not None else None
+    })
+
+
+def init_capture(app):
+    """Capture des requêtes API relayées (si CAPTURE_FILE est défini)"""
+    if writer is None:
+        return
+
+    @app.after_request
+    def _capture_request(response):
+        if request.blueprint != 'gateway' or request.endpoint in EXCLUDED_ENDPOINTS:
+            return response
+        capture(request.method,
+                request.url_rule.rule,
+                request.full_path if request.query_string else request.path,
+                'Authorization' in request.headers,
+                g.get('current_user'),
+                capture_body(request.get_json(silent=True), request.is_json, request.content_length),
+                response.status_code,
+                current_trace())
+        return response
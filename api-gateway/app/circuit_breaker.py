@@ -0,0 +1,231 @@
+"""
+Disjoncteur (circuit breaker) par service amont, avec timeout adaptatif
+
+États :
+- closed    : les requêtes passent; N échecs consécutifs ouvrent le circuit
+- open      : échec immédiat (pas d'attente du timeout) pendant CB_OPEN_SECONDS
+- half_open : quelques requêtes d'essai; un succès referme, un échec rouvre
+
+Erreurs réseau et réponses 5xx comptent contre l'instance. Les latences, le
+timeout et les dépassements de timeout sont suivis par route ("POST
+/auth/login", "GET /orders/<id>") : un login lent par construction ne hérite
+pas du timeout des /auth/verify, et ses dépassements n'ouvrent que sa route
+(CB_FAILURE_THRESHOLD dépassements consécutifs, pendant CB_OPEN_SECONDS).
+
+Le timeout de chaque appel est dérivé des latences observées sur sa route
+(percentile CB_TIMEOUT_PERCENTILE × CB_TIMEOUT_MULTIPLIER), borné entre
+CB_MIN_TIMEOUT et CB_MAX_TIMEOUT.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+
+CB_FAILURE_THRESHOLD = int(os.getenv('CB_FAILURE_THRESHOLD', '5'))
+CB_OPEN_SECONDS = float(os.getenv('CB_OPEN_SECONDS', '10'))
+CB_HALF_OPEN_MAX_CALLS = int(os.getenv('CB_HALF_OPEN_MAX_CALLS', '1'))
+CB_MIN_TIMEOUT = float(os.getenv('CB_MIN_TIMEOUT', '0.5'))
+CB_MAX_TIMEOUT = float(os.getenv('CB_MAX_TIMEOUT', '5'))
+CB_TIMEOUT_PERCENTILE = float(os.getenv('CB_TIMEOUT_PERCENTILE', '0.99'))
+CB_TIMEOUT_MULTIPLIER = float(os.getenv('CB_TIMEOUT_MULTIPLIER', '3'))
+# Nombre de latences gardées, et minimum avant d'adapter le timeout
+CB_LATENCY_WINDOW = int(os.getenv('CB_LATENCY_WINDOW', '200'))
+CB_LATENCY_MIN_SAMPLES = int(os.getenv('CB_LATENCY_MIN_SAMPLES', '20'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def route_key(method, path):
+    """Route d'un appel amont, identifiants numériques remplacés ("GET /orders/<id>")"""
+    return f"{method} {_ID_SEGMENT.sub('/<id>', path.split('?', 1)[0])}"
+
+
+class RouteStats:
+    """Latences et dépassements de timeout d'une route sur une instance"""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=CB_LATENCY_WINDOW)
+        self.consecutive_timeouts = 0
+        self.opened_at = None
+        self.timeouts = 0
+
+    def is_open(self, now):
+        return self.opened_at is not None and now - self.opened_at < CB_OPEN_SECONDS
+
+
+class CircuitBreaker:
+    """Disjoncteur d'une instance amont, et suivi de latence de chacune de ses routes"""
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.routes = {}
+        self._lock = threading.Lock()
+        self.counters = {'success': 0, 'failure': 0, 'timeout': 0, 'rejected': 0, 'opened': 0}
+
+    def _route(self, route):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats()
+        return stats
+
+    def allow(self, route=None):
+        """Indique si une requête peut partir (False = échec immédiat)"""
+        with self._lock:
+            if route is not None and self._route(route).is_open(time.monotonic()):
+                self.counters['rejected'] += 1
+                return False
+
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < CB_OPEN_SECONDS:
+                    self.counters['rejected'] += 1
+                    return False
+                self.state = HALF_OPEN
+                self.half_open_calls = 0
+
+            if self.state == HALF_OPEN:
+                if self.half_open_calls >= CB_HALF_OPEN_MAX_CALLS:
+                    self.counters['rejected'] += 1
+                    return False
+                self.half_open_calls += 1
+
+            return True
+
+    def is_open(self):
+        """Circuit ouvert (sans effet de bord, contrairement à allow())"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < CB_OPEN_SECONDS
+
+    def record_success(self, latency, route=None):
+        with self._lock:
+            if route is not None:
+                stats = self._route(route)
+                stats.latencies.append(latency)
+                stats.consecutive_timeouts = 0
+                stats.opened_at = None
+            self.counters['success'] += 1
+            self.consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.counters['failure'] += 1
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= CB_FAILURE_THRESHOLD:
+                if self.state != OPEN:
+                    self.counters['opened'] += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def _end_trial(self):
+        # Essai sans verdict sur l'instance : sa place est rendue
+        if self.state == HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def record_timeout(self, route):
+        """Timeout dépassé : compte contre la route seule, pas contre l'instance"""
+        with self._lock:
+            stats = self._route(route)
+            stats.timeouts += 1
+            stats.consecutive_timeouts += 1
+            if stats.consecutive_timeouts >= CB_FAILURE_THRESHOLD:
+                stats.opened_at = time.monotonic()
+            self.counters['timeout'] += 1
+            self._end_trial()
+
+    def record_abandoned(self):
+        """Appel interrompu côté gateway (exception inattendue) : ni succès ni échec"""
+        with self._lock:
+            self._end_trial()
+
+    def record(self, outcome, route, latency=None):
+        """Enregistre l'issue d'un appel autorisé par allow() (None : abandonné)"""
+        if outcome == 'success':
+            self.record_success(latency, route)
+        elif outcome == 'timeout':
+            self.record_timeout(route)
+        elif outcome is None:
+            self.record_abandoned()
+        else:
+            self.record_failure()
+
+    @staticmethod
+    def _percentile(samples, p):
+        samples = sorted(samples)
+        if not samples:
+            return None
+        return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+    def latency_samples(self, route=None):
+        """Latences récentes des appels réussis (secondes), d'une route ou de toutes"""
+        with self._lock:
+            if route is not None:
+                stats = self.routes.get(route)
+                return list(stats.latencies) if stats is not None else []
+            return [latency for stats in self.routes.values() for latency in stats.latencies]
+
+    def _timeout(self, stats):
+        if stats is None or len(stats.latencies) < CB_LATENCY_MIN_SAMPLES:
+            return CB_MAX_TIMEOUT
+        observed = self._percentile(stats.latencies, CB_TIMEOUT_PERCENTILE)
+        return min(max(observed * CB_TIMEOUT_MULTIPLIER, CB_MIN_TIMEOUT), CB_MAX_TIMEOUT)
+
+    def timeout(self, route=None):
+        """Timeout adaptatif pour le prochain appel de cette route (secondes)"""
+        with self._lock:
+            return self._timeout(self.routes.get(route))
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            state = self.state
+            if state == OPEN and now - self.opened_at >= CB_OPEN_SECONDS:
+                state = HALF_OPEN
+            routes = {}
+            for route, stats in sorted(self.routes.items()):
+                p50 = self._percentile(stats.latencies, 0.50)
+                p99 = self._percentile(stats.latencies, 0.99)
+                routes[route] = {
+                    'state': OPEN if stats.is_open(now) else CLOSED,
+                    'timeout': round(self._timeout(stats), 3),
+                    'timeouts': stats.timeouts,
+                    'latency_p50_ms': round(p50 * 1000, 2) if p50 is not None else None,
+                    'latency_p99_ms': round(p99 * 1000, 2) if p99 is not None else None
+                }
+            return dict(self.counters,
+                        state=state,
+                        consecutive_failures=self.consecutive_failures,
+                        routes=routes)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(service_url):
+    """Retourne le disjoncteur associé à une URL de service"""
+    breaker = _breakers.get(service_url)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(service_url)
+            if breaker is None:
+                breaker = CircuitBreaker(service_url)
+                _breakers[service_url] = breaker
+    return breaker
+
+
+def breaker_stats():
+    return {url: breaker.stats() for url, breaker in list(_breakers.items())}
+
+
+def any_open():
+    return any(breaker.is_open() for breaker in list(_breakers.values()))
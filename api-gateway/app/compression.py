@@ -0,0 +1,169 @@
+"""
+Compression des réponses (gzip, et brotli si le module est installé)
+
+Les réponses JSON sont compressées selon Accept-Encoding au-delà de
+COMPRESSION_MIN_SIZE octets. Les réponses relayées en flux sont compressées
+au fil de l'eau, morceau par morceau, sans jamais être lues en entier.
+Octets avant/après et temps CPU sont exposés dans /metrics pour régler le seuil.
+"""
+import gzip
+import os
+import time
+import zlib
+from flask import request
+from werkzeug.http import parse_accept_header
+from .metrics import registry, COUNTER
+from .tracing import span
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : gzip seul
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', '1') == '1'
+# En dessous de cette taille, la compression coûte plus qu'elle ne rapporte
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+# Par ordre de préférence, à qualité égale côté client
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+COMPRESSIBLE_MIMETYPES = ('application/json',)
+
+registry.define('http_compression_input_bytes_total', COUNTER, 'Octets avant compression')
+registry.define('http_compression_output_bytes_total', COUNTER, 'Octets après compression')
+registry.define('http_compression_cpu_seconds_total', COUNTER, 'Temps CPU passé à compresser')
+registry.define('http_compression_skipped_total', COUNTER, 'Réponses non compressées, par raison')
+
+
+def negotiate(encodings=ENCODINGS):
+    """Encodage à utiliser d'après Accept-Encoding (None : pas de compression)"""
+    return request.accept_encodings.best_match(encodings, default=None)
+
+
+def compress(data, encoding, static=False):
+    """
+    Compresse un corps complet
+
+    static=True : niveau maximal, pour les contenus compressés une seule fois
+    (pages et fichiers statiques gardés en mémoire)
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9 if static else GZIP_LEVEL, mtime=0)
+    raise ValueError(f'Encodage non supporté : {encoding}')
+
+
+def compressor(encoding):
+    """Compresseur incrémental : (compress(chunk), flush())"""
+    if encoding == 'br':
+        c = brotli.Compressor(quality=BROTLI_QUALITY)
+        return c.process, c.finish
+    if encoding == 'gzip':
+        c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 : format gzip
+        return c.compress, c.flush
+    raise ValueError(f'Encodage non supporté : {encoding}')
+
+
+def _record(labels, size_in, size_out, cpu):
+    registry.inc('http_compression_input_bytes_total', labels, size_in)
+    registry.inc('http_compression_output_bytes_total', labels, size_out)
+    registry.inc('http_compression_cpu_seconds_total', labels, cpu)
+
+
+def compress_stream(chunks, encoding, labels):
+    """Compresse un corps en flux; les métriques sont enregistrées en fin de flux"""
+    process, finish = compressor(encoding)
+    size_in = size_out = 0
+    cpu = 0.0
+    try:
+        for chunk in chunks:
+            start = time.thread_time()
+            out = process(chunk)
+            cpu += time.thread_time() - start
+            size_in += len(chunk)
+            size_out += len(out)
+            if out:
+                yield out
+        start = time.thread_time()
+        out = finish()
+        cpu += time.thread_time() - start
+        size_out += len(out)
+        yield out
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+        _record(labels, size_in, size_out, cpu)
+
+
+def compress_body(body, accept_encoding, route, trace=None):
+    """
+    Compresse un corps JSON complet d'après la valeur d'Accept-Encoding (mode ASGI)
+
+    Retourne: (corps, encodage), encodage valant None si le corps est laissé tel quel
+    """
+    encoding = parse_accept_header(accept_encoding).best_match(ENCODINGS, default=None)
+    if encoding is None:
+        registry.inc('http_compression_skipped_total', (('reason', 'not_accepted'),))
+        return body, None
+    if len(body) < COMPRESSION_MIN_SIZE:
+        registry.inc('http_compression_skipped_total', (('reason', 'too_small'),))
+        return body, None
+
+    started = time.perf_counter()
+    start = time.thread_time()
+    compressed = compress(body, encoding)
+    cpu = time.thread_time() - start
+    if trace is not None:
+        trace.add_span('compress', started, time.perf_counter() - started, {'encoding': encoding})
+    _record((('encoding', encoding), ('route', route)), len(body), len(compressed), cpu)
+    return compressed, encoding
+
+
+def init_compression(app):
+    """Compresse les réponses JSON de l'application selon Accept-Encoding"""
+
+    @app.after_request
+    def _compress_response(response):
+        if not COMPRESSION_ENABLED or request.method == 'HEAD':
+            return response
+        if (response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate()
+        if encoding is None:
+            registry.inc('http_compression_skipped_total', (('reason', 'not_accepted'),))
+            return response
+
+        # Taille connue (corps en mémoire, ou Content-Length amont d'un flux)
+        size = response.content_length
+        if size is not None and size < COMPRESSION_MIN_SIZE:
+            registry.inc('http_compression_skipped_total', (('reason', 'too_small'),))
+            return response
+
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (('encoding', encoding), ('route', route))
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, labels)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            with span('compress', encoding=encoding):
+                start = time.thread_time()
+                compressed = compress(body, encoding)
+                cpu = time.thread_time() - start
+            _record(labels, len(body), len(compressed), cpu)
+            response.set_data(compressed)
+
+        response.headers['Content-Encoding'] = encoding
+        # La représentation compressée n'est plus identique octet pour octet
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
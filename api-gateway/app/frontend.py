@@ -0,0 +1,158 @@
+"""
+Pages HTML et fichiers statiques du frontend, servis depuis la mémoire
+
+Les pages n'ont pas de contexte par requête : elles sont rendues une seule
+fois au démarrage. Pages et fichiers statiques sont gardés avec leurs variantes
+gzip/brotli et un ETag. Les fichiers statiques ont aussi une URL contenant un
+hash de leur contenu (/static/api.<hash>.js), utilisée par les pages et mise
+en cache un an par le navigateur; l'URL d'origine (/static/api.js) reste
+servie, avec revalidation.
+
+Avec FRONTEND_AUTO_RELOAD=1 (mode développement), les fichiers sont relus
+dès qu'ils changent sur le disque.
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from flask import Response, abort, render_template, request
+from .compression import ENCODINGS, compress, negotiate
+
+# Cache-Control des URLs avec hash (contenu immuable) et des autres
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+# Intervalle minimal entre deux vérifications des fichiers en mode développement
+FRONTEND_RELOAD_INTERVAL = float(os.getenv('FRONTEND_RELOAD_INTERVAL', '1'))
+
+
+class StaticEntry:
+    """Un contenu servi depuis la mémoire, avec ses variantes compressées"""
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {}
+        for encoding in ENCODINGS:
+            compressed = compress(body, encoding, static=True)
+            if len(compressed) < len(body):
+                self.variants[encoding] = compressed
+
+    def etag(self, encoding):
+        # ETag fort distinct par encodage : les octets envoyés diffèrent
+        return f'{self.digest}-{encoding}' if encoding else self.digest
+
+    def to_response(self, cache_control):
+        encoding = negotiate(tuple(self.variants)) if self.variants else None
+        etag = self.etag(encoding)
+
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.variants[encoding] if encoding else self.body, mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class Frontend:
+    """Pages rendues et fichiers statiques du frontend"""
+
+    def __init__(self, app, static_folder, template_folder, pages, auto_reload=False):
+        self.app = app
+        self.static_folder = static_folder
+        self.template_folder = template_folder
+        self.page_names = pages
+        self.auto_reload = auto_reload
+        self.assets = {}
+        self.hashed_assets = {}
+        self.pages = {}
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        app.add_template_global(self.asset_url)
+
+    def _files(self, folder):
+        for root, _, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, folder).replace(os.sep, '/'), path
+
+    def _take_snapshot(self):
+        snapshot = []
+        for folder in (self.static_folder, self.template_folder):
+            for _, path in self._files(folder):
+                stat = os.stat(path)
+                snapshot.append((path, stat.st_mtime_ns, stat.st_size))
+        return sorted(snapshot)
+
+    def build(self):
+        """Charge les fichiers statiques puis rend les pages (qui référencent leurs URLs)"""
+        snapshot = self._take_snapshot()
+        assets = {}
+        hashed_assets = {}
+        for name, path in self._files(self.static_folder):
+            with open(path, 'rb') as f:
+                body = f.read()
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            entry = StaticEntry(body, mimetype)
+            assets[name] = entry
+            hashed_assets[self._hashed_name(name, entry.digest)] = entry
+        self.assets = assets
+        self.hashed_assets = hashed_assets
+
+        if self.app.jinja_env.cache is not None:
+            self.app.jinja_env.cache.clear()
+        with self.app.app_context():
+            self.pages = {
+                name: StaticEntry(render_template(name).encode('utf-8'), 'text/html')
+                for name in self.page_names
+            }
+        self._snapshot = snapshot
+        print(f"[API Gateway] Frontend chargé : {len(self.pages)} pages, {len(self.assets)} fichiers statiques")
+
+    @staticmethod
+    def _hashed_name(name, digest):
+        stem, ext = os.path.splitext(name)
+        return f'{stem}.{digest[:12]}{ext}'
+
+    def _reload_if_changed(self):
+        if not self.auto_reload:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < FRONTEND_RELOAD_INTERVAL:
+            return
+        with self._lock:
+            if now - self._checked_at < FRONTEND_RELOAD_INTERVAL:
+                return
+            self._checked_at = now
+            if self._take_snapshot() != self._snapshot:
+                self.build()
+
+    def asset_url(self, name):
+        """URL avec hash du contenu (template global utilisé par les pages)"""
+        entry = self.assets.get(name)
+        if entry is None:
+            return f'/static/{name}'
+        return f'/static/{self._hashed_name(name, entry.digest)}'
+
+    def page(self, name):
+        self._reload_if_changed()
+        entry = self.pages.get(name)
+        if entry is None:
+            abort(404)
+        return entry.to_response(REVALIDATE_CACHE_CONTROL)
+
+    def static(self, filename):
+        self._reload_if_changed()
+        entry = self.hashed_assets.get(filename)
+        if entry is not None:
+            return entry.to_response(IMMUTABLE_CACHE_CONTROL)
+        entry = self.assets.get(filename)
+        if entry is None:
+            abort(404)
+        return entry.to_response(REVALIDATE_CACHE_CONTROL)
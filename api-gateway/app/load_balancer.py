@@ -0,0 +1,171 @@
+"""
+Répartition de charge entre plusieurs instances d'un même service
+
+Chaque *_SERVICE_URL accepte une liste d'URLs séparées par des virgules.
+L'instance est choisie parmi les instances saines selon LB_STRATEGY :
+- least_outstanding : le moins de requêtes en cours
+- ewma              : latence moyenne mobile × (requêtes en cours + 1)
+La meilleure instance dont le disjoncteur accepte l'appel est retenue : une
+instance ouverte, ou en half_open sans place d'essai libre, est sautée au
+profit des autres.
+
+Un thread sonde périodiquement la route /health de chaque instance : les
+instances qui échouent sont retirées, puis réintégrées quand elles répondent.
+"""
+import os
+import threading
+import time
+import requests
+from .upstream_pool import get_pool
+from .circuit_breaker import get_breaker
+
+LB_STRATEGY = os.getenv('LB_STRATEGY', 'least_outstanding')
+LB_EWMA_DECAY = float(os.getenv('LB_EWMA_DECAY', '0.3'))
+LB_HEALTH_INTERVAL = float(os.getenv('LB_HEALTH_INTERVAL', '5'))
+LB_HEALTH_TIMEOUT = float(os.getenv('LB_HEALTH_TIMEOUT', '1'))
+# Sondes consécutives nécessaires pour retirer / réintégrer une instance
+LB_UNHEALTHY_THRESHOLD = int(os.getenv('LB_UNHEALTHY_THRESHOLD', '2'))
+LB_HEALTHY_THRESHOLD = int(os.getenv('LB_HEALTHY_THRESHOLD', '1'))
+
+
+class Instance:
+    """Une instance d'un service amont"""
+
+    def __init__(self, url):
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.ewma = None
+        self.probe_failures = 0
+        self.probe_successes = 0
+        self.requests = 0
+
+    def score(self):
+        if LB_STRATEGY == 'ewma':
+            # Instance jamais mesurée : score nul pour qu'elle soit essayée
+            return (self.ewma or 0.0) * (self.outstanding + 1)
+        return self.outstanding
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'ewma_ms': round(self.ewma * 1000, 2) if self.ewma is not None else None
+        }
+
+
+class Upstream:
+    """Ensemble des instances d'un service"""
+
+    def __init__(self, name, service_url, health_path='/health'):
+        self.name = name
+        self.health_path = health_path
+        self.instances = [Instance(url.strip().rstrip('/'))
+                          for url in service_url.split(',') if url.strip()]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, route=None):
+        """
+        Choisit une instance et compte la requête comme en cours
+
+        Retourne (instance, allowed) : allowed vaut False si aucun disjoncteur
+        n'accepte l'appel (l'instance retournée sert alors aux métriques).
+        """
+        with self._lock:
+            # Rotation du point de départ : les égalités sont réparties à tour de rôle
+            self._next = (self._next + 1) % len(self.instances)
+            ordered = self.instances[self._next:] + self.instances[:self._next]
+            candidates = [i for i in ordered if i.healthy]
+            if not candidates:
+                # Aucune instance saine : on tente quand même plutôt que d'échouer d'office
+                candidates = ordered
+            # sorted est stable : l'ordre de rotation départage les égalités
+            candidates = sorted(candidates, key=Instance.score)
+            # allow() réserve la place d'essai d'un disjoncteur half_open : choix et admission d'un seul tenant
+            instance = next((i for i in candidates if get_breaker(i.url).allow(route)), None)
+            allowed = instance is not None
+            if instance is None:
+                instance = candidates[0]
+            instance.outstanding += 1
+            instance.requests += 1
+            return instance, allowed
+
+    def release(self, instance, latency=None):
+        with self._lock:
+            instance.outstanding -= 1
+            if latency is not None:
+                if instance.ewma is None:
+                    instance.ewma = latency
+                else:
+                    instance.ewma = LB_EWMA_DECAY * latency + (1 - LB_EWMA_DECAY) * instance.ewma
+
+    def probe(self):
+        """Sonde la route de santé de chaque instance"""
+        for instance in self.instances:
+            try:
+                response = get_pool(instance.url).request('GET', self.health_path, timeout=LB_HEALTH_TIMEOUT)
+                ok = response.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+
+            with self._lock:
+                if ok:
+                    instance.probe_failures = 0
+                    instance.probe_successes += 1
+                    if not instance.healthy and instance.probe_successes >= LB_HEALTHY_THRESHOLD:
+                        instance.healthy = True
+                        print(f"[API Gateway] Instance {instance.url} réintégrée ({self.name})")
+                else:
+                    instance.probe_successes = 0
+                    instance.probe_failures += 1
+                    if instance.healthy and instance.probe_failures >= LB_UNHEALTHY_THRESHOLD:
+                        instance.healthy = False
+                        print(f"[API Gateway] Instance {instance.url} retirée ({self.name})")
+
+    def stats(self):
+        with self._lock:
+            return [instance.stats() for instance in self.instances]
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def register_upstream(name, service_url, health_path='/health'):
+    """Déclare un service (et le chemin de sa route de santé)"""
+    with _upstreams_lock:
+        upstream = Upstream(name, service_url, health_path)
+        _upstreams[service_url] = upstream
+        return upstream
+
+
+def get_upstream(service_url):
+    """Retourne le groupe d'instances associé à une URL (ou liste d'URLs) de service"""
+    upstream = _upstreams.get(service_url)
+    if upstream is None:
+        with _upstreams_lock:
+            upstream = _upstreams.get(service_url)
+            if upstream is None:
+                upstream = Upstream(service_url, service_url)
+                _upstreams[service_url] = upstream
+    return upstream
+
+
+def upstream_stats():
+    return {upstream.name: upstream.stats() for upstream in list(_upstreams.values())}
+
+
+def start_health_checks(interval=LB_HEALTH_INTERVAL):
+    """Démarre le thread de sondes de santé actives"""
+    def run():
+        while True:
+            for upstream in list(_upstreams.values()):
+                upstream.probe()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='upstream-health-checks', daemon=True)
+    thread.start()
+    return thread
@@ -1,12 +1,47 @@
 """
 Point d'entrée principal de l'API Gateway
 """
-from flask import Flask, send_from_directory, render_template
+from flask import Flask
 import os
+import threading
 from .routes import bp
+from .upstream_pool import start_idle_reaper
+from .load_balancer import start_health_checks
+from .metrics import init_metrics
+from .tracing import init_tracing
+from .frontend import Frontend
+from .compression import init_compression
+from .capture import init_capture, start_capture_writer
 
-def create_app():
-    """Factory pour créer l'application Flask"""
+# Pages HTML du frontend (sans contexte par requête : rendues une fois au démarrage)
+FRONTEND_PAGES = ('login.html', 'articles.html', 'cart.html', 'admin.html', 'bank.html')
+
+_background_pid = None
+_background_lock = threading.Lock()
+
+def start_background_tasks():
+    """Threads d'arrière-plan, démarrés une seule fois dans chaque processus qui sert des requêtes"""
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+    # Fermer périodiquement les connexions keep-alive inactives vers les services
+    start_idle_reaper()
+    
+    # Sondes de santé actives des instances de chaque service
+    start_health_checks()
+    
+    # Écriture des requêtes capturées (si CAPTURE_FILE est défini)
+    start_capture_writer()
+
+def create_app(background_tasks=True):
+    """
+    Factory pour créer l'application Flask
+    
+    background_tasks=False : les threads d'arrière-plan ne sont pas démarrés
+    (gunicorn les démarre dans chaque worker, les threads ne survivant pas au fork)
+    """
     # Détection si on est dans Docker ou en local
     # Dans Docker, le frontend est monté à /frontend
     # En local, il faut remonter depuis api-gateway/app/main.py
@@ -30,14 +65,35 @@ def create_app():
     print(f"[API Gateway] Frontend templates: {frontend_templates}")
     print(f"[API Gateway] Login.html exists: {os.path.exists(os.path.join(frontend_templates, 'login.html'))}")
     
+    # Les fichiers statiques sont servis par Frontend (route /static ci-dessous)
     app = Flask(__name__, 
-                static_folder=frontend_static,
+                static_folder=None,
                 template_folder=frontend_templates)
     app.config['SECRET_KEY'] = 'api-gateway-secret-key'
     
     # Enregistrer les routes API
     app.register_blueprint(bp)
     
+    # Métriques Prometheus (GET /metrics)
+    init_metrics(app)
+    
+    # X-Request-Id, spans et Server-Timing (collecte dans TRACE_FILE si défini)
+    init_tracing(app, 'api-gateway')
+    
+    # Capture des requêtes relayées dans CAPTURE_FILE (rejeu : benchmarks/replay.py)
+    init_capture(app)
+    
+    # Compression gzip/brotli des réponses JSON (Accept-Encoding)
+    init_compression(app)
+    
+    if background_tasks:
+        start_background_tasks()
+    
+    # Pages et fichiers statiques servis depuis la mémoire (gzip/brotli, ETag, URLs avec hash)
+    frontend = Frontend(app, frontend_static, frontend_templates, FRONTEND_PAGES,
+                        auto_reload=os.getenv('FRONTEND_AUTO_RELOAD', '0') == '1')
+    frontend.build()
+    
     # Routes pour servir les pages HTML
     @app.route('/')
     def index():
@@ -48,32 +104,38 @@ def create_app():
     @app.route('/login.html')
     def login_page():
         """Page de login"""
-        return render_template('login.html')
+        return frontend.page('login.html')
     
     @app.route('/articles.html')
     def articles_page():
         """Page des articles"""
-        return render_template('articles.html')
+        return frontend.page('articles.html')
     
     @app.route('/cart.html')
     def cart_page():
         """Page du panier"""
-        return render_template('cart.html')
+        return frontend.page('cart.html')
     
     @app.route('/admin.html')
     def admin_page():
         """Page d'administration"""
-        return render_template('admin.html')
+        return frontend.page('admin.html')
     
     @app.route('/bank.html')
     def bank_page():
         """Page de paiement bancaire"""
-        return render_template('bank.html')
+        return frontend.page('bank.html')
+    
+    @app.route('/static/<path:filename>')
+    def static(filename):
+        """Fichiers statiques (JS/CSS)"""
+        return frontend.static(filename)
     
     return app
 
 if __name__ == '__main__':
-    app = create_app()
+    # Serveur de développement : pages et fichiers statiques relus quand ils changent
+    os.environ.setdefault('FRONTEND_AUTO_RELOAD', '1')
     print("[API Gateway] Démarrage sur le port 5000")
     print("[API Gateway] Point d'entrée unique pour tous les microservices")
     print("[API Gateway] Routes disponibles:")
@@ -83,5 +145,13 @@ if __name__ == '__main__':
     print("  - GET  /users/profile (protégé)")
     print("  - GET  /products (public)")
     print("  - GET  /orders (protégé)")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    if os.getenv('GATEWAY_ASYNC', '0') == '1':
+        # Mode asynchrone (ASGI) : même contrat JSON, appels amont non bloquants;
+        # l'application Flask est créée par app.asgi_app (une seule fois)
+        import uvicorn
+        print("[API Gateway] Mode asynchrone (ASGI/uvicorn)")
+        uvicorn.run('app.asgi_app:app', host='0.0.0.0', port=5000)
+    else:
+        app = create_app()
+        app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -0,0 +1,189 @@
+"""
+Métriques au format Prometheus (exposées sur /metrics)
+
+L'enregistrement se fait sans verrou : chaque thread écrit dans ses propres
+compteurs, qui ne sont additionnés qu'au moment de la lecture de /metrics.
+Les compteurs d'un thread terminé sont reportés dans un total commun : le
+serveur de dev et les revalidations de cache créent un thread par tâche.
+
+Les compteurs sont propres à chaque processus : sous gunicorn, /metrics
+répond depuis le worker qui reçoit la requête. Chaque échantillon porte un
+label worker (pid) pour que les séries de deux workers ne se mélangent pas
+(un compteur qui redémarre à zéro est une nouvelle série, pas une baisse).
+"""
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from functools import wraps
+from flask import Response, g, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+class _ThreadMarker:
+    """Rangé dans le threading.local : libéré (et donc finalisé) à la fin du thread"""
+    __slots__ = ('__weakref__',)
+
+
+def _add(totals, key, value):
+    if isinstance(value, list):
+        current = totals.setdefault(key, [0] * len(value))
+        for i, v in enumerate(value):
+            current[i] += v
+    else:
+        totals[key] = totals.get(key, 0) + value
+
+
+class MetricsRegistry:
+    """Registre de métriques agrégées par thread"""
+
+    def __init__(self):
+        self._definitions = {}
+        self._shards = []
+        # Compteurs des threads terminés
+        self._retired = {}
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+
+    def define(self, name, kind, help_text):
+        self._definitions[name] = (kind, help_text)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            marker = _ThreadMarker()
+            self._local.shard = shard
+            self._local.marker = marker
+            with self._shards_lock:
+                self._shards.append(shard)
+            weakref.finalize(marker, self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        # Retrait de la liste et report dans le total sous le même verrou : collect()
+        # compte ces valeurs une et une seule fois
+        with self._shards_lock:
+            self._shards.remove(shard)
+            for key, value in shard.items():
+                _add(self._retired, key, value)
+
+    def inc(self, name, labels=(), amount=1):
+        """Incrémente un compteur (ou une jauge, amount pouvant être négatif)"""
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        """Ajoute une observation à un histogramme"""
+        shard = self._shard()
+        key = (name, labels)
+        entry = shard.get(key)
+        if entry is None:
+            # [compteurs par bucket..., +Inf, somme]
+            entry = [0] * (len(LATENCY_BUCKETS) + 2)
+            shard[key] = entry
+        entry[bisect_left(LATENCY_BUCKETS, value)] += 1
+        entry[-1] += value
+
+    def collect(self):
+        """Additionne les compteurs de tous les threads"""
+        totals = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+            for key, value in self._retired.items():
+                _add(totals, key, value)
+        for shard in shards:
+            for key, value in list(shard.items()):
+                _add(totals, key, value)
+        return totals
+
+    def render(self):
+        """Texte au format d'exposition Prometheus"""
+        totals = self.collect()
+        worker = (('worker', str(os.getpid())),)
+        by_name = {}
+        for (name, labels), value in totals.items():
+            by_name.setdefault(name, []).append((worker + labels, value))
+
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text = self._definitions.get(name, (GAUGE, ''))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                if kind == HISTOGRAM:
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), value[:-1]):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {value[-1]}')
+                    lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+                else:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    """Échappement d'une valeur de label (format d'exposition Prometheus)"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+registry.define('http_requests_total', COUNTER, 'Requêtes HTTP traitées')
+registry.define('http_request_duration_seconds', HISTOGRAM, 'Durée de traitement des requêtes HTTP')
+registry.define('http_requests_in_flight', GAUGE, 'Requêtes HTTP en cours')
+
+
+def init_metrics(app):
+    """Instrumente les requêtes de l'application et ajoute la route /metrics"""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        registry.inc('http_requests_in_flight', (), 1)
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            labels = (('method', request.method), ('route', route))
+            registry.observe('http_request_duration_seconds', labels, time.perf_counter() - start)
+            registry.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+        return response
+
+    @app.teardown_request
+    def _end_request(exc):
+        registry.inc('http_requests_in_flight', (), -1)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Métriques au format Prometheus"""
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def timed(name, labels=()):
+    """Décorateur : histogramme de durée d'une fonction"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registry.observe(name, labels, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,98 @@
+"""
+Agrégation "vue d'ensemble du compte" (GET /me/overview)
+
+Profil, commandes et catalogue sont demandés en parallèle, puis le détail
+des commandes (avec leurs lignes) ; la latence totale est celle des deux
+appels les plus lents au lieu de la somme de tous les appels.
+
+Seules les `limit` commandes les plus récentes sont détaillées (paramètre
+orders_limit, OVERVIEW_MAX_ORDERS au plus); orders_count donne le total et
+orders_truncated indique que la liste est incomplète.
+"""
+import json
+import os
+from .service_client import ServiceClient, fanout_executor
+from .response_cache import caches
+from .tracing import bind
+
+# Nombre maximal (et par défaut) de commandes, les plus récentes, détaillées dans la vue
+OVERVIEW_MAX_ORDERS = int(os.getenv('OVERVIEW_MAX_ORDERS', '10'))
+
+
+def _fetch_catalog():
+    """Catalogue produits, servi par le cache de réponses de la gateway"""
+    def fetch(headers):
+        return ServiceClient.send_to_orders('/products', 'GET', None, headers)
+
+    entry, _, response, error, status = caches['products'].lookup('/products', fetch)
+    if entry is not None:
+        return json.loads(entry.body), None, 200
+    if error:
+        return None, error, status
+    return None, {'error': f'Catalogue indisponible (HTTP {status})'}, status
+
+
+def _section(future):
+    """(data, error) d'un appel amont; une réponse non success compte comme une erreur"""
+    result, error, status = future.result()
+    if error:
+        return None, {'status': status, **error}
+    if not result.get('success'):
+        return None, {'status': status, **(result.get('error') or {})}
+    return result.get('data'), None
+
+
+def build_overview(user, limit=OVERVIEW_MAX_ORDERS):
+    """Retourne (overview, errors); errors est vide si toutes les sections ont répondu"""
+    headers = {'X-User-Id': user}
+    errors = {}
+
+    profile_future = fanout_executor.submit(bind(ServiceClient.forward_to_user), '/users/profile', 'GET', None, headers)
+    orders_future = fanout_executor.submit(bind(ServiceClient.forward_to_orders), '/orders', 'GET', None, headers)
+    catalog_future = fanout_executor.submit(bind(_fetch_catalog))
+
+    profile, error = _section(profile_future)
+    if error:
+        errors['profile'] = error
+
+    orders, error = _section(orders_future)
+    if error:
+        errors['orders'] = error
+        orders = None
+
+    # Détail (lignes) des commandes les plus récentes, en parallèle
+    detailed = []
+    if orders:
+        detail_futures = [
+            (order, fanout_executor.submit(bind(ServiceClient.forward_to_orders), f"/orders/{order['id']}", 'GET', None, headers))
+            for order in orders[:limit]
+        ]
+        for order, future in detail_futures:
+            detail, error = _section(future)
+            if error:
+                errors.setdefault('order_details', {})[str(order['id'])] = error
+                detailed.append(dict(order, items=None))
+            else:
+                detailed.append(dict(detail, items=detail.get('items', [])))
+
+    catalog, error = _section(catalog_future)
+    if error:
+        errors['products'] = error
+    products = {product['id']: product for product in catalog or []}
+
+    # Produits référencés par les commandes
+    referenced = {}
+    for order in detailed:
+        for item in order['items'] or []:
+            product = products.get(item['product_id'])
+            if product is not None:
+                referenced[product['id']] = product
+
+    overview = {
+        'profile': profile,
+        'orders': detailed if orders is not None else None,
+        'orders_count': len(orders) if orders is not None else None,
+        'orders_truncated': len(orders) > limit if orders is not None else None,
+        'products': list(referenced.values())
+    }
+    return overview, errors
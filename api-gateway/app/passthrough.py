@@ -0,0 +1,56 @@
+"""
+Relais direct des réponses amont, sans décodage/ré-encodage JSON
+"""
+import requests
+from flask import Response, jsonify
+
+# Headers amont recopiés tels quels vers le client
+PASSTHROUGH_HEADERS = ('ETag', 'Cache-Control', 'Last-Modified')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _is_json(response):
+    return response.headers.get('Content-Type', '').split(';')[0].strip() == 'application/json'
+
+
+def error_response(error, status):
+    """Erreur générée par la gateway (même forme qu'avant le relais direct)"""
+    return jsonify({'success': False, 'error': error}), status
+
+
+def passthrough_response(response, error, status):
+    """
+    Convertit le résultat de ServiceClient.send_request en réponse Flask
+
+    Les corps JSON sont relayés octet pour octet (en flux si la réponse
+    amont n'a pas encore été lue). Un corps non JSON est décodé comme
+    avant, ce qui produit la même erreur 503 que forward_request.
+    """
+    if error:
+        return error_response(error, status)
+
+    if not _is_json(response):
+        try:
+            return jsonify(response.json()), response.status_code
+        except requests.exceptions.RequestException as e:
+            return error_response({'error': f'Erreur de communication avec le service: {str(e)}'}, 503)
+        finally:
+            response.close()
+
+    headers = {name: response.headers[name] for name in PASSTHROUGH_HEADERS if name in response.headers}
+
+    if response.raw.closed:
+        # Corps déjà lu (GET regroupés, réponse sans stream)
+        body = response.content
+    else:
+        def body():
+            try:
+                yield from response.iter_content(STREAM_CHUNK_SIZE)
+            finally:
+                response.close()
+        body = body()
+        # Corps relayé tel quel : sa taille est connue (utile au seuil de compression)
+        if 'Content-Length' in response.headers and 'Content-Encoding' not in response.headers:
+            headers['Content-Length'] = response.headers['Content-Length']
+
+    return Response(body, status=response.status_code, headers=headers, mimetype='application/json')
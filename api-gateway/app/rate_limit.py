@@ -0,0 +1,192 @@
+"""
+Limitation de débit (token bucket) par route, en mémoire
+
+Chaque politique a un seau de jetons par clé : l'utilisateur authentifié
+sur les routes protégées, l'adresse IP du client sur les routes publiques et
+pour les requêtes dont le token est absent ou invalide. Une requête consomme un jeton; les jetons se rechargent en
+continu (limite / période). Lookup en O(1) (dict), et mémoire bornée : au-delà
+de RATE_LIMIT_MAX_KEYS clés par politique, les moins récemment vues sont oubliées.
+
+Politiques configurables par variable d'environnement, au format
+"requêtes/secondes" : RATE_LIMIT_LOGIN=10/60, RATE_LIMIT_CATALOG=300/60, ...
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, jsonify, make_response, request
+from .metrics import registry, COUNTER
+from .auth_middleware import request_claims
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+# Nombre de reverse proxies de confiance devant la gateway (RATE_LIMIT_TRUST_PROXY=1 : un seul).
+# Chacun ajoute une entrée à droite de X-Forwarded-For : l'IP cliente est la N-ième en
+# partant de la droite; les entrées plus à gauche viennent du client et ne prouvent rien
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', os.getenv('RATE_LIMIT_TRUST_PROXY', '0')))
+
+# Politiques par défaut : nom -> "requêtes/secondes"
+DEFAULT_POLICIES = {
+    'login': '10/60',      # /auth/login, /auth/register (par IP)
+    'auth': '60/60',       # /auth/refresh, /auth/verify, /auth/logout
+    'catalog': '300/60',   # /products (par IP)
+    'api': '300/60',       # routes protégées (par utilisateur)
+    'batch': '30/60',      # /batch, /me/overview (plusieurs appels amont chacun)
+}
+
+registry.define('rate_limit_rejected_total', COUNTER, 'Requêtes refusées par la limitation de débit')
+
+
+def _parse_policy(value):
+    limit, period = value.split('/', 1)
+    return int(limit), float(period)
+
+
+class TokenBucketLimiter:
+    """Seaux de jetons d'une politique, un par clé"""
+
+    def __init__(self, name, limit, period, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.rate = limit / period
+        self.max_keys = max_keys
+        # clé -> (jetons restants, instant de la dernière mise à jour)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    def hit(self, key):
+        """
+        Consomme un jeton pour la clé
+
+        Retourne: (allowed, remaining, reset, retry_after) ; reset est le délai
+        avant que le seau soit plein, retry_after celui avant le prochain jeton
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = float(self.limit)
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                tokens = min(float(self.limit), bucket[0] + (now - bucket[1]) * self.rate)
+                self._buckets.move_to_end(key)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+                self.allowed += 1
+            else:
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+
+        reset = (self.limit - tokens) / self.rate
+        retry_after = 0 if allowed else (1 - tokens) / self.rate
+        return allowed, int(tokens), reset, retry_after
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'period': self.period,
+                'keys': len(self._buckets),
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'evictions': self.evictions
+            }
+
+
+limiters = {}
+for _name, _default in DEFAULT_POLICIES.items():
+    _limit, _period = _parse_policy(os.getenv(f'RATE_LIMIT_{_name.upper()}', _default))
+    limiters[_name] = TokenBucketLimiter(_name, _limit, _period)
+
+
+def client_ip():
+    return resolve_client_ip(request.remote_addr, request.headers.get('X-Forwarded-For', ''))
+
+
+def resolve_client_ip(remote_addr, forwarded):
+    """IP du client : celle de la connexion, ou X-Forwarded-For derrière des proxies de confiance"""
+    if RATE_LIMIT_TRUSTED_PROXIES:
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        # Moins d'entrées que de proxies : la requête ne vient pas de la chaîne attendue
+        if len(hops) >= RATE_LIMIT_TRUSTED_PROXIES:
+            return hops[-RATE_LIMIT_TRUSTED_PROXIES]
+    return remote_addr or 'unknown'
+
+
+def check(policy, user, ip):
+    """
+    Consomme un jeton de la politique pour l'utilisateur (sinon l'IP)
+
+    Retourne: (allowed, headers) ; headers contient les RateLimit-* et,
+    si la requête est refusée, Retry-After (secondes entières)
+    """
+    limiter = limiters[policy]
+    key = f'user:{user}' if user else f'ip:{ip}'
+    allowed, remaining, reset, retry_after = limiter.hit(key)
+    headers = {
+        'RateLimit-Limit': str(limiter.limit),
+        'RateLimit-Remaining': str(remaining),
+        'RateLimit-Reset': str(math.ceil(reset)),
+        'RateLimit-Policy': f'{limiter.limit};w={int(limiter.period)}'
+    }
+    if not allowed:
+        registry.inc('rate_limit_rejected_total', (('policy', policy),))
+        headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return allowed, headers
+
+
+def rejected_body(headers):
+    """Corps JSON de la réponse 429"""
+    return {
+        'success': False,
+        'error': {
+            'code': 'RATE_LIMITED',
+            'message': f"Trop de requêtes. Réessayez dans {headers['Retry-After']} s."
+        }
+    }
+
+
+def rate_limit(policy):
+    """
+    Décorateur de route : applique la politique donnée
+
+    À placer au-dessus de @token_required sur les routes protégées : les
+    requêtes au token absent ou invalide consomment aussi des jetons (clé :
+    l'IP du client), les autres sont limitées par utilisateur.
+    """
+    def decorator(f):
+        protected = getattr(f, 'requires_token', False)
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED:
+                return f(*args, **kwargs)
+
+            user = g.get('current_user')
+            if user is None and protected:
+                claims = request_claims()
+                user = claims.get('sub') if claims else None
+            allowed, headers = check(policy, user, client_ip())
+            if allowed:
+                response = make_response(f(*args, **kwargs))
+            else:
+                response = make_response(jsonify(rejected_body(headers)), 429)
+            response.headers.update(headers)
+            return response
+
+        return decorated_function
+    return decorator
+
+
+def rate_limit_stats():
+    return {name: limiter.stats() for name, limiter in limiters.items()}
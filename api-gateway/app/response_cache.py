@@ -0,0 +1,190 @@
+"""
+Cache de réponses de la gateway pour les routes publiques du catalogue
+
+Les réponses amont (octets bruts) sont gardées avec leur ETag :
+- fraîches pendant `ttl` secondes;
+- servies périmées pendant `stale_while_revalidate` secondes de plus,
+  pendant qu'une revalidation conditionnelle (If-None-Match) tourne en fond;
+- servies périmées jusqu'à `stale_if_error` secondes si le service est injoignable
+  ou répond 5xx (l'entrée en cache n'est pas remplacée par l'erreur).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, request
+from werkzeug.http import unquote_etag
+
+
+def _policy(prefix, ttl, maxsize):
+    """Politique de cache d'une route, surchargeable par variables d'environnement"""
+    return {
+        'ttl': float(os.getenv(f'{prefix}_TTL', str(ttl))),
+        'maxsize': int(os.getenv(f'{prefix}_MAXSIZE', str(maxsize))),
+        'stale_while_revalidate': float(os.getenv(f'{prefix}_STALE_WHILE_REVALIDATE', '60')),
+        'stale_if_error': float(os.getenv(f'{prefix}_STALE_IF_ERROR', '3600'))
+    }
+
+
+CACHE_POLICIES = {
+    'products': _policy('CACHE_PRODUCTS', ttl=30, maxsize=1),
+    'product_detail': _policy('CACHE_PRODUCT_DETAIL', ttl=60, maxsize=1000)
+}
+
+
+class CacheEntry:
+    """Réponse amont mise en cache"""
+
+    def __init__(self, body, etag, fetched_at):
+        self.body = body
+        self.etag = etag
+        self.fetched_at = fetched_at
+
+    def age(self, now):
+        return now - self.fetched_at
+
+
+class ResponseCache:
+    """Cache LRU borné à durée de vie, avec revalidation conditionnelle"""
+
+    def __init__(self, name, ttl, maxsize, stale_while_revalidate=0, stale_if_error=0):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+
+        self._entries = OrderedDict()
+        self._revalidating = set()
+        self._lock = threading.Lock()
+        self.counters = {'hit': 0, 'miss': 0, 'stale': 0, 'revalidated': 0,
+                         'refreshed': 0, 'stale_if_error': 0, 'not_modified': 0, 'evictions': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _fetch(self, key, fetch, entry):
+        """
+        Requête amont (conditionnelle si une entrée existe)
+        Retourne: (entry, response, error, status)
+        """
+        headers = {'If-None-Match': entry.etag} if entry is not None and entry.etag else None
+        response, error, status = fetch(headers)
+        if error:
+            return None, None, error, status
+
+        now = time.monotonic()
+        if response.status_code == 304 and entry is not None:
+            fresh = CacheEntry(entry.body, entry.etag, now)
+            self.put(key, fresh)
+            self._count('revalidated')
+            return fresh, response, None, 200
+
+        if response.status_code != 200:
+            # Les erreurs (404, ...) ne sont pas mises en cache
+            return None, response, None, response.status_code
+
+        body = response.content
+        etag = response.headers.get('ETag') or f'"{hashlib.sha1(body).hexdigest()}"'
+        fresh = CacheEntry(body, etag, now)
+        self.put(key, fresh)
+        self._count('refreshed')
+        return fresh, response, None, 200
+
+    def _revalidate_in_background(self, key, fetch, entry):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def run():
+            try:
+                self._fetch(key, fetch, entry)
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=run, name=f'cache-revalidate-{self.name}', daemon=True).start()
+
+    def lookup(self, key, fetch):
+        """
+        Retourne (entry, state, response, error, status)
+
+        fetch(headers) doit retourner (requests.Response, error, status).
+        Si `entry` est None, `response` (réponse amont non cacheable) ou
+        `error` décrivent ce qu'il faut renvoyer au client.
+        """
+        now = time.monotonic()
+        entry = self.get(key)
+
+        if entry is not None:
+            age = entry.age(now)
+            if age <= self.ttl:
+                self._count('hit')
+                return entry, 'HIT', None, None, 200
+            if age <= self.ttl + self.stale_while_revalidate:
+                self._count('stale')
+                self._revalidate_in_background(key, fetch, entry)
+                return entry, 'STALE', None, None, 200
+
+        self._count('miss')
+        fresh, response, error, status = self._fetch(key, fetch, entry)
+        if fresh is not None:
+            return fresh, 'MISS', None, None, 200
+
+        failed = error or (response is not None and response.status_code >= 500)
+        if failed and entry is not None and entry.age(now) <= self.ttl + self.stale_if_error:
+            # Service injoignable ou en erreur : on continue de servir la dernière version connue
+            self._count('stale_if_error')
+            return entry, 'STALE', None, None, 200
+
+        return None, 'MISS', response, error, status
+
+    def to_response(self, entry, state):
+        """Réponse client pour une entrée du cache, avec support de If-None-Match"""
+        remaining = max(int(self.ttl - entry.age(time.monotonic())), 0)
+        headers = {
+            'ETag': entry.etag,
+            'Cache-Control': f'public, max-age={remaining}',
+            'X-Cache': state
+        }
+        etag, _ = unquote_etag(entry.etag)
+        if request.if_none_match.contains_weak(etag):
+            self._count('not_modified')
+            return Response(status=304, headers=headers)
+        return Response(entry.body, status=200, headers=headers, mimetype='application/json')
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, size=len(self._entries), maxsize=self.maxsize, ttl=self.ttl)
+
+
+caches = {name: ResponseCache(name, **policy) for name, policy in CACHE_POLICIES.items()}
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in caches.items()}
+
@@ -0,0 +1,183 @@
+"""
+Relances et requêtes couvertes (hedging) pour les GET amont
+
+- Relance : un GET en échec (erreur réseau, circuit ouvert, 502/503/504) est
+  relancé après un backoff exponentiel avec jitter, RETRY_MAX_ATTEMPTS fois au plus.
+- Hedging (HEDGE_GETS=1) : si un GET n'a pas répondu après le p95 des latences
+  observées pour cette route du service, une seconde requête part (vers l'instance la moins
+  chargée); la première réponse valable est gardée, l'autre est fermée.
+
+Relances et requêtes couvertes puisent dans un budget global : chaque requête
+y dépose RETRY_BUDGET_RATIO jeton, chaque requête supplémentaire en consomme un.
+Pendant une panne, le trafic supplémentaire reste ainsi borné à ~10 % au lieu
+de multiplier la charge sur des services déjà en difficulté.
+Seuls les GET sont concernés : POST/PUT/DELETE ne sont jamais relancés.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .circuit_breaker import get_breaker, CB_LATENCY_MIN_SAMPLES
+from .metrics import registry, COUNTER
+from .tracing import bind
+
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '2'))
+RETRY_BACKOFF_BASE = float(os.getenv('RETRY_BACKOFF_BASE', '0.05'))
+RETRY_BACKOFF_MAX = float(os.getenv('RETRY_BACKOFF_MAX', '1'))
+RETRY_BUDGET_RATIO = float(os.getenv('RETRY_BUDGET_RATIO', '0.1'))
+RETRY_BUDGET_MAX_TOKENS = float(os.getenv('RETRY_BUDGET_MAX_TOKENS', '10'))
+RETRYABLE_STATUSES = (502, 503, 504)
+
+HEDGE_GETS = os.getenv('HEDGE_GETS', '0') == '1'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '0.95'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '0.005'))
+# Le délai (p95) est recalculé au plus une fois par intervalle
+HEDGE_DELAY_REFRESH = float(os.getenv('HEDGE_DELAY_REFRESH', '1'))
+HEDGE_MAX_WORKERS = int(os.getenv('HEDGE_MAX_WORKERS', '32'))
+
+# Pool dédié : les appels lancés depuis fanout_executor ne doivent pas attendre ce même pool
+hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix='hedge')
+
+registry.define('upstream_retries_total', COUNTER, 'GET amont relancés après un échec')
+registry.define('upstream_hedges_total', COUNTER, 'Requêtes couvertes (hedging) envoyées, et gagnées')
+registry.define('upstream_retry_budget_exhausted_total', COUNTER, 'Relances ou hedges refusés faute de budget')
+
+
+class RetryBudget:
+    """Budget global de requêtes supplémentaires (relances et hedges)"""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, max_tokens=RETRY_BUDGET_MAX_TOKENS):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+        self.withdrawn = 0
+        self.exhausted = 0
+
+    def deposit(self):
+        """Appelé pour chaque requête d'origine"""
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """Autorise une requête supplémentaire (False : budget épuisé)"""
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.withdrawn += 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tokens': round(self.tokens, 2),
+                'max_tokens': self.max_tokens,
+                'ratio': self.ratio,
+                'withdrawn': self.withdrawn,
+                'exhausted': self.exhausted
+            }
+
+
+retry_budget = RetryBudget()
+
+_hedge_delays = {}
+
+
+def is_failure(result):
+    _, error, status = result
+    return error is not None or status >= 500
+
+
+def is_retryable(result):
+    _, error, status = result
+    return status in RETRYABLE_STATUSES
+
+
+def discard(result):
+    """Libère la connexion d'une réponse qui ne sera pas utilisée"""
+    response = result[0]
+    if response is not None:
+        response.close()
+
+
+def backoff(attempt):
+    """Backoff exponentiel avec jitter complet (attempt >= 1)"""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def hedge_delay(upstream, route=None):
+    """p95 des latences récentes de la route sur toutes les instances du service (None : pas assez de mesures)"""
+    now = time.monotonic()
+    key = (upstream.name, route)
+    cached = _hedge_delays.get(key)
+    if cached is not None and now - cached[0] < HEDGE_DELAY_REFRESH:
+        return cached[1]
+
+    samples = sorted(s for instance in upstream.instances for s in get_breaker(instance.url).latency_samples(route))
+    if len(samples) < CB_LATENCY_MIN_SAMPLES:
+        delay = None
+    else:
+        delay = max(samples[min(int(len(samples) * HEDGE_PERCENTILE), len(samples) - 1)], HEDGE_MIN_DELAY)
+    _hedge_delays[key] = (now, delay)
+    return delay
+
+
+def budget_allows(kind, upstream):
+    if retry_budget.withdraw():
+        return True
+    registry.inc('upstream_retry_budget_exhausted_total', (('kind', kind), ('upstream', upstream.name)))
+    return False
+
+
+def hedged_call(call, upstream, route=None):
+    """
+    Exécute call() (un GET amont, retournant (response, error, status)),
+    avec une seconde requête si la première tarde au-delà du p95 de sa route
+    """
+    delay = hedge_delay(upstream, route) if HEDGE_GETS else None
+    if delay is None:
+        return call()
+
+    first = hedge_executor.submit(bind(call))
+    done, _ = wait([first], timeout=delay)
+    if done or not budget_allows('hedge', upstream):
+        return first.result()
+
+    registry.inc('upstream_hedges_total', (('outcome', 'sent'), ('upstream', upstream.name)))
+    second = hedge_executor.submit(bind(call))
+    pending = {first, second}
+    result = None
+    while pending and result is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        # Une réponse valable passe avant un échec terminé en même temps
+        for future in sorted(done, key=lambda f: is_failure(f.result())):
+            candidate = future.result()
+            if result is None and (not is_failure(candidate) or not pending):
+                result = candidate
+                if future is second:
+                    registry.inc('upstream_hedges_total', (('outcome', 'won'), ('upstream', upstream.name)))
+            else:
+                discard(candidate)
+
+    # La requête perdante est fermée dès qu'elle se termine
+    for future in pending:
+        future.add_done_callback(lambda f: discard(f.result()))
+    return result
+
+
+def call_with_retries(call, upstream, route=None):
+    """GET amont avec hedging éventuel et relances bornées par le budget global"""
+    retry_budget.deposit()
+    attempt = 1
+    while True:
+        result = hedged_call(call, upstream, route)
+        if (attempt >= RETRY_MAX_ATTEMPTS or not is_retryable(result)
+                or not budget_allows('retry', upstream)):
+            return result
+        discard(result)
+        registry.inc('upstream_retries_total', (('upstream', upstream.name),))
+        time.sleep(backoff(attempt))
+        attempt += 1
@@ -2,8 +2,17 @@
 Routes pour l'API Gateway
 """
 from flask import Blueprint, request, jsonify, g
-from .auth_middleware import token_required, AUTH_SERVICE_URL, USER_SERVICE_URL, ORDERS_SERVICE_URL
-from .service_client import ServiceClient
+from .auth_middleware import token_required, claims_cache, AUTH_SERVICE_URL, USER_SERVICE_URL, ORDERS_SERVICE_URL
+from .service_client import ServiceClient, get_coalescer
+from .upstream_pool import pool_stats
+from .response_cache import caches, cache_stats
+from .passthrough import passthrough_response
+from .circuit_breaker import breaker_stats, any_open
+from .load_balancer import upstream_stats
+from .batch import run_batch, BATCH_MAX_SIZE
+from .overview import build_overview, OVERVIEW_MAX_ORDERS
+from .rate_limit import rate_limit, rate_limit_stats
+from .retry import retry_budget
 
 bp = Blueprint('gateway', __name__)
 
@@ -11,69 +20,68 @@ bp = Blueprint('gateway', __name__)
 def health():
     """Health check endpoint"""
     return jsonify({
-        'status': 'healthy',
+        'status': 'degraded' if any_open() else 'healthy',
         'service': 'api-gateway',
         'services': {
             'auth': AUTH_SERVICE_URL,
             'user': USER_SERVICE_URL,
             'orders': ORDERS_SERVICE_URL
-        }
+        },
+        'instances': upstream_stats(),
+        'pools': pool_stats(),
+        'token_cache': claims_cache.stats(),
+        'response_cache': cache_stats(),
+        'coalescing': get_coalescer.stats(),
+        'circuit_breakers': breaker_stats(),
+        'rate_limits': rate_limit_stats(),
+        'retry_budget': retry_budget.stats()
     }), 200
 
 # ========== Routes Auth Service (pas de protection) ==========
 @bp.route('/auth/login', methods=['POST'])
+@rate_limit('login')
 def auth_login():
     """Forward vers Auth Service - Login"""
     data = request.get_json(silent=True) or {}
-    result, error, status = ServiceClient.forward_to_auth('/auth/login', 'POST', data)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_auth('/auth/login', 'POST', data, stream=True)
+    return passthrough_response(response, error, status)
 
 @bp.route('/auth/refresh', methods=['POST'])
+@rate_limit('auth')
 def auth_refresh():
     """Forward vers Auth Service - Refresh"""
     data = request.get_json(silent=True) or {}
-    result, error, status = ServiceClient.forward_to_auth('/auth/refresh', 'POST', data)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_auth('/auth/refresh', 'POST', data, stream=True)
+    return passthrough_response(response, error, status)
 
 @bp.route('/auth/verify', methods=['POST'])
+@rate_limit('auth')
 def auth_verify():
     """Forward vers Auth Service - Verify"""
     data = request.get_json(silent=True) or {}
-    result, error, status = ServiceClient.forward_to_auth('/auth/verify', 'POST', data)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_auth('/auth/verify', 'POST', data, stream=True)
+    return passthrough_response(response, error, status)
 
 @bp.route('/auth/logout', methods=['POST'])
+@rate_limit('auth')
 @token_required
 def auth_logout():
     """Forward vers Auth Service - Logout"""
     data = request.get_json(silent=True) or {}
-    result, error, status = ServiceClient.forward_to_auth('/auth/logout', 'POST', data)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_auth('/auth/logout', 'POST', data, stream=True)
+    return passthrough_response(response, error, status)
 
 @bp.route('/auth/register', methods=['POST'])
+@rate_limit('login')
 def auth_register():
     """Forward vers Auth Service - Création d'utilisateur"""
     data = request.get_json(silent=True) or {}
-    result, error, status = ServiceClient.forward_to_auth('/auth/register', 'POST', data)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_auth('/auth/register', 'POST', data, stream=True)
+    return passthrough_response(response, error, status)
 
 # ========== Routes User Service (protégées) ==========
 @bp.route('/users', methods=['GET', 'POST'])
+@rate_limit('api')
 @token_required
 def users():
     """Forward vers User Service"""
@@ -83,13 +91,11 @@ def users():
     # Ajouter l'utilisateur courant dans les headers
     headers = {'X-User-Id': g.current_user}
     
-    result, error, status = ServiceClient.forward_to_user('/users', method, data, headers)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_user('/users', method, data, headers, stream=True)
+    return passthrough_response(response, error, status)
 
 @bp.route('/users/<int:user_id>', methods=['GET', 'PUT', 'DELETE'])
+@rate_limit('api')
 @token_required
 def user_detail(user_id):
     """Forward vers User Service - Détails utilisateur"""
@@ -98,44 +104,46 @@ def user_detail(user_id):
     
     headers = {'X-User-Id': g.current_user}
     
-    result, error, status = ServiceClient.forward_to_user(f'/users/{user_id}', method, data, headers)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_user(f'/users/{user_id}', method, data, headers, stream=True)
+    return passthrough_response(response, error, status)
 
 @bp.route('/users/profile', methods=['GET'])
+@rate_limit('api')
 @token_required
 def user_profile():
     """Forward vers User Service - Profil utilisateur"""
     headers = {'X-User-Id': g.current_user}
     
-    result, error, status = ServiceClient.forward_to_user('/users/profile', 'GET', None, headers)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_user('/users/profile', 'GET', None, headers, stream=True)
+    return passthrough_response(response, error, status)
 
 # ========== Routes Orders Service ==========
+def cached_orders_get(cache_name, path):
+    """GET public vers Orders Service, servi depuis le cache de réponses de la gateway"""
+    cache = caches[cache_name]
+    
+    def fetch(headers):
+        return ServiceClient.send_request(ORDERS_SERVICE_URL, path, 'GET', None, headers)
+    
+    entry, state, response, error, status = cache.lookup(path, fetch)
+    if entry is not None:
+        return cache.to_response(entry, state)
+    return passthrough_response(response, error, status)
+
 @bp.route('/products', methods=['GET'])
+@rate_limit('catalog')
 def products():
-    """Forward vers Orders Service - Liste des produits (public)"""
-    result, error, status = ServiceClient.forward_to_orders('/products', 'GET')
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    """Forward vers Orders Service - Liste des produits (public, mis en cache)"""
+    return cached_orders_get('products', '/products')
 
 @bp.route('/products/<int:product_id>', methods=['GET'])
+@rate_limit('catalog')
 def product_detail(product_id):
-    """Forward vers Orders Service - Détails produit (public)"""
-    result, error, status = ServiceClient.forward_to_orders(f'/products/{product_id}', 'GET')
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    """Forward vers Orders Service - Détails produit (public, mis en cache)"""
+    return cached_orders_get('product_detail', f'/products/{product_id}')
 
 @bp.route('/orders', methods=['GET', 'POST'])
+@rate_limit('api')
 @token_required
 def orders():
     """Forward vers Orders Service - Commandes (protégé)"""
@@ -144,13 +152,11 @@ def orders():
     
     headers = {'X-User-Id': g.current_user}
     
-    result, error, status = ServiceClient.forward_to_orders('/orders', method, data, headers)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_orders('/orders', method, data, headers, stream=True)
+    return passthrough_response(response, error, status)
 
 @bp.route('/orders/<int:order_id>', methods=['GET', 'PUT'])
+@rate_limit('api')
 @token_required
 def order_detail(order_id):
     """Forward vers Orders Service - Détails commande (protégé)"""
@@ -159,9 +165,68 @@ def order_detail(order_id):
     
     headers = {'X-User-Id': g.current_user}
     
-    result, error, status = ServiceClient.forward_to_orders(f'/orders/{order_id}', method, data, headers)
-    
-    if error:
-        return jsonify({'success': False, 'error': error}), status
-    return jsonify(result), status
+    response, error, status = ServiceClient.send_to_orders(f'/orders/{order_id}', method, data, headers, stream=True)
+    return passthrough_response(response, error, status)
+
+
+# ========== Batch ==========
+@bp.route('/batch', methods=['POST'])
+@rate_limit('batch')
+@token_required
+def batch():
+    """Exécute plusieurs sous-requêtes (users/orders/products) en parallèle, avec une seule authentification"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('requests')
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'INVALID_BATCH',
+                'message': 'Le champ requests doit être une liste non vide.'
+            }
+        }), 400
+    
+    if len(items) > BATCH_MAX_SIZE:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'BATCH_TOO_LARGE',
+                'message': f'Un batch est limité à {BATCH_MAX_SIZE} sous-requêtes.'
+            }
+        }), 400
+    
+    results = run_batch(items, g.current_user)
+    return jsonify({
+        'success': True,
+        'data': results,
+        'count': len(results)
+    }), 200
+
+# ========== Agrégation ==========
+@bp.route('/me/overview', methods=['GET'])
+@rate_limit('batch')
+@token_required
+def me_overview():
+    """Profil + commandes (avec lignes) + produits référencés, appelés en parallèle"""
+    limit = request.args.get('orders_limit', str(OVERVIEW_MAX_ORDERS))
+    if not limit.isdecimal() or int(limit) > OVERVIEW_MAX_ORDERS:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'INVALID_ORDERS_LIMIT',
+                'message': f'orders_limit doit être un entier entre 0 et {OVERVIEW_MAX_ORDERS}.'
+            }
+        }), 400
 
+    overview, errors = build_overview(g.current_user, int(limit))
+    
+    response = {
+        'success': True,
+        'data': overview,
+        'partial': bool(errors)
+    }
+    if errors:
+        # Réponse partielle : les sections en échec valent null et sont détaillées ici
+        response['errors'] = errors
+    return jsonify(response), 200
@@ -1,12 +1,146 @@
 """
 Client HTTP pour communiquer avec les autres microservices
 """
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from .auth_middleware import AUTH_SERVICE_URL, USER_SERVICE_URL, ORDERS_SERVICE_URL
+from .upstream_pool import get_pool
+from .singleflight import SingleFlight
+from .circuit_breaker import get_breaker, route_key, CB_MAX_TIMEOUT
+from .load_balancer import get_upstream, register_upstream
+from .metrics import registry, COUNTER, GAUGE, HISTOGRAM
+from .tracing import REQUEST_ID_HEADER, current_request_id, current_trace, span
+from .retry import call_with_retries
+
+# Timeout maximal d'un appel amont (le disjoncteur l'adapte aux latences observées)
+UPSTREAM_TIMEOUT = CB_MAX_TIMEOUT
+# Regrouper les GET identiques et simultanés en un seul appel amont
+COALESCE_GETS = os.getenv('COALESCE_GETS', '1') == '1'
+
+get_coalescer = SingleFlight()
+
+# Threads partagés pour les appels amont lancés en parallèle (batch, agrégation)
+FANOUT_MAX_WORKERS = int(os.getenv('FANOUT_MAX_WORKERS', '32'))
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix='fanout')
+
+# Chaque service peut avoir plusieurs instances (URLs séparées par des virgules)
+register_upstream('auth', AUTH_SERVICE_URL, '/auth/health')
+register_upstream('user', USER_SERVICE_URL, '/health')
+register_upstream('orders', ORDERS_SERVICE_URL, '/health')
+
+registry.define('upstream_requests_total', COUNTER, 'Appels vers les services amont, par issue')
+registry.define('upstream_request_duration_seconds', HISTOGRAM, 'Durée des appels vers les services amont')
+registry.define('upstream_requests_in_flight', GAUGE, 'Appels vers les services amont en cours')
 
 class ServiceClient:
     """Client pour communiquer avec les microservices"""
     
+    @staticmethod
+    def send_request(service_url, path, method='GET', data=None, headers=None, stream=False):
+        """
+        Envoie une requête vers un service et retourne la réponse brute
+        
+        Avec stream=True le corps n'est pas lu (sauf pour les GET regroupés,
+        dont la réponse est partagée et donc toujours lue en entier).
+        
+        Retourne: (response, error, status) où response est un requests.Response
+        """
+        request_headers = {'Content-Type': 'application/json'}
+        
+        if headers:
+            request_headers.update(headers)
+        
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+            return None, {'error': 'Méthode HTTP non supportée'}, 405
+        
+        if method == 'GET' and COALESCE_GETS:
+            # La clé inclut tous les headers (X-User-Id notamment) : jamais de partage entre utilisateurs
+            key = (service_url, path, tuple(sorted(request_headers.items())))
+            # L'identifiant de requête n'entre pas dans la clé : l'appel partagé porte celui du premier demandeur
+            ServiceClient._add_request_id(request_headers)
+            return get_coalescer.do(key, lambda: ServiceClient._send_get(service_url, path, request_headers))
+        
+        ServiceClient._add_request_id(request_headers)
+        
+        if method == 'GET':
+            return ServiceClient._send_get(service_url, path, request_headers, stream)
+        # Jamais de relance pour les méthodes non idempotentes
+        return ServiceClient._send(service_url, path, method, data, request_headers, stream)
+    
+    @staticmethod
+    def _add_request_id(request_headers):
+        """Propage l'identifiant de la requête en cours vers le service appelé"""
+        request_id = current_request_id()
+        if request_id is not None:
+            request_headers.setdefault(REQUEST_ID_HEADER, request_id)
+    
+    @staticmethod
+    def _send_get(service_url, path, request_headers, stream=False):
+        """GET idempotent : hedging éventuel et relances (voir retry.py)"""
+        return call_with_retries(
+            lambda: ServiceClient._send(service_url, path, 'GET', None, request_headers, stream),
+            get_upstream(service_url), route_key('GET', path))
+    
+    @staticmethod
+    def _send(service_url, path, method, data, request_headers, stream=False):
+        """Effectue l'appel HTTP vers une instance du service, derrière son disjoncteur"""
+        upstream = get_upstream(service_url)
+        route = route_key(method, path)
+        instance, allowed = upstream.acquire(route)
+        labels = (('instance', instance.url), ('upstream', upstream.name))
+        latency = None
+        try:
+            breaker = get_breaker(instance.url)
+            if not allowed:
+                # Aucun circuit n'accepte l'appel : échec immédiat au lieu d'attendre le timeout
+                registry.inc('upstream_requests_total', labels + (('outcome', 'circuit_open'),))
+                return None, {'error': 'Service temporairement indisponible (circuit ouvert)'}, 503
+            
+            pool = get_pool(instance.url)
+            # Issue enregistrée quoi qu'il arrive (None : exception côté gateway)
+            outcome = None
+            try:
+                registry.inc('upstream_requests_in_flight', labels, 1)
+                start = time.monotonic()
+                try:
+                    with span(f'upstream.{upstream.name}', instance=instance.url, method=method, path=path) as attrs:
+                        if method in ('POST', 'PUT'):
+                            response = pool.request(method, path, json=data, headers=request_headers,
+                                                    timeout=breaker.timeout(route), stream=stream)
+                        else:
+                            response = pool.request(method, path, headers=request_headers,
+                                                    timeout=breaker.timeout(route), stream=stream)
+                        attrs['status'] = response.status_code
+                except requests.exceptions.ReadTimeout as e:
+                    outcome = 'timeout'
+                    return None, {'error': f'Le service n\'a pas répondu à temps: {str(e)}'}, 504
+                except requests.exceptions.RequestException as e:
+                    outcome = 'network_error'
+                    return None, {'error': f'Erreur de communication avec le service: {str(e)}'}, 503
+                finally:
+                    elapsed = time.monotonic() - start
+                    registry.inc('upstream_requests_in_flight', labels, -1)
+                    registry.observe('upstream_request_duration_seconds', labels, elapsed)
+                
+                trace = current_trace()
+                if trace is not None and 'Server-Timing' in response.headers:
+                    trace.add_upstream_timing(upstream.name, response.headers['Server-Timing'])
+                
+                if response.status_code >= 500:
+                    outcome = 'server_error'
+                else:
+                    outcome = 'success'
+                    latency = elapsed
+                return response, None, response.status_code
+            finally:
+                breaker.record(outcome, route, latency)
+                if outcome is not None:
+                    registry.inc('upstream_requests_total', labels + (('outcome', outcome),))
+        finally:
+            upstream.release(instance, latency)
+    
     @staticmethod
     def forward_request(service_url, path, method='GET', data=None, headers=None):
         """
@@ -19,24 +153,11 @@ class ServiceClient:
             data: Données à envoyer (pour POST/PUT)
             headers: Headers additionnels
         """
-        url = f"{service_url}{path}"
-        request_headers = {'Content-Type': 'application/json'}
-        
-        if headers:
-            request_headers.update(headers)
+        response, error, status = ServiceClient.send_request(service_url, path, method, data, headers)
+        if error:
+            return None, error, status
         
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=request_headers, timeout=5)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=request_headers, timeout=5)
-            elif method == 'PUT':
-                response = requests.put(url, json=data, headers=request_headers, timeout=5)
-            elif method == 'DELETE':
-                response = requests.delete(url, headers=request_headers, timeout=5)
-            else:
-                return None, {'error': 'Méthode HTTP non supportée'}, 405
-            
             return response.json(), None, response.status_code
         except requests.exceptions.RequestException as e:
             return None, {'error': f'Erreur de communication avec le service: {str(e)}'}, 503
@@ -55,4 +176,18 @@ class ServiceClient:
     def forward_to_orders(path, method='GET', data=None, headers=None):
         """Forward vers Orders Service"""
         return ServiceClient.forward_request(ORDERS_SERVICE_URL, path, method, data, headers)
-
+    
+    @staticmethod
+    def send_to_auth(path, method='GET', data=None, headers=None, stream=False):
+        """Envoie vers Auth Service (réponse brute)"""
+        return ServiceClient.send_request(AUTH_SERVICE_URL, path, method, data, headers, stream)
+    
+    @staticmethod
+    def send_to_user(path, method='GET', data=None, headers=None, stream=False):
+        """Envoie vers User Service (réponse brute)"""
+        return ServiceClient.send_request(USER_SERVICE_URL, path, method, data, headers, stream)
+    
+    @staticmethod
+    def send_to_orders(path, method='GET', data=None, headers=None, stream=False):
+        """Envoie vers Orders Service (réponse brute)"""
+        return ServiceClient.send_request(ORDERS_SERVICE_URL, path, method, data, headers, stream)
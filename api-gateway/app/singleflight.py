@@ -0,0 +1,60 @@
+"""
+Regroupement (single-flight) des requêtes amont identiques et simultanées
+"""
+import threading
+
+
+class _Call:
+    """Appel amont en cours, partagé par toutes les requêtes identiques"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight:
+    """Un seul appel par clé à la fois; les appelants concurrents partagent son résultat"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.collapsed = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.collapsed += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executed': self.executed,
+                'collapsed': self.collapsed,
+                'in_flight': len(self._calls)
+            }
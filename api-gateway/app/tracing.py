@@ -0,0 +1,182 @@
+"""
+Traçage des requêtes : identifiant de requête, spans et header Server-Timing
+
+L'identifiant (X-Request-Id) est créé par la gateway et transmis aux services
+par ServiceClient. Chaque tier enregistre ses spans; si TRACE_FILE est défini,
+ils sont ajoutés à ce fichier JSONL (une ligne par span), qui peut être partagé
+par tous les services pour reconstruire la cascade d'une requête
+(tools/trace_waterfall.py).
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, has_app_context, request
+from flask.json.provider import DefaultJSONProvider
+
+# Fichier JSONL des spans (vide : pas de collecte, seul Server-Timing est renvoyé)
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+
+REQUEST_ID_HEADER = 'X-Request-Id'
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_local = threading.local()
+_file_lock = threading.Lock()
+_file_fd = None
+
+
+class Trace:
+    """Spans d'une requête sur ce service"""
+
+    def __init__(self, request_id, service):
+        self.request_id = request_id
+        self.service = service
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        # Entrées Server-Timing renvoyées par les services appelés
+        self.upstream_timings = []
+
+    def add_span(self, name, start, duration, attrs=None):
+        self.spans.append((name, start, duration, attrs or {}))
+
+    def add_upstream_timing(self, prefix, header):
+        """Reprend les entrées Server-Timing d'un service appelé, préfixées par son nom"""
+        for entry in header.split(','):
+            entry = entry.strip()
+            if entry:
+                self.upstream_timings.append(f'{prefix}.{entry}')
+
+    def server_timing(self, total):
+        entries = [f'{_metric_name(name)};dur={duration * 1000:.2f}' for name, _, duration, _ in self.spans]
+        entries.extend(self.upstream_timings)
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+    def records(self, total, attrs):
+        """Spans au format du collecteur (le span "request" couvre toute la requête)"""
+        base = {'request_id': self.request_id, 'service': self.service}
+        yield dict(base, name='request', start=self.started_at,
+                   duration_ms=round(total * 1000, 3), attrs=attrs)
+        for name, start, duration, span_attrs in self.spans:
+            yield dict(base, name=name, start=self.started_at + (start - self.start),
+                       duration_ms=round(duration * 1000, 3), attrs=span_attrs)
+
+
+def _metric_name(name):
+    # Server-Timing n'accepte que des "tokens" comme nom de métrique
+    return re.sub(r'[^A-Za-z0-9._-]', '_', name)
+
+
+def current_trace():
+    """Trace de la requête en cours (ou propagée dans ce thread par bind())"""
+    trace = getattr(_local, 'trace', None)
+    if trace is None and has_app_context():
+        trace = g.get('trace')
+    return trace
+
+
+def current_request_id():
+    trace = current_trace()
+    return trace.request_id if trace is not None else None
+
+
+def bind(fn):
+    """Propage la trace courante dans le thread qui exécutera fn (fan-out)"""
+    trace = current_trace()
+
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, 'trace', None)
+        _local.trace = trace
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace = previous
+    return wrapper
+
+
+@contextmanager
+def span(name, **attrs):
+    """Mesure un bloc et l'ajoute aux spans de la requête en cours"""
+    trace = current_trace()
+    if trace is None:
+        yield attrs
+        return
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        trace.add_span(name, start, time.perf_counter() - start, attrs)
+
+
+def traced(name):
+    """Décorateur : span autour d'une fonction"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _write_records(records):
+    """Ajoute les spans au fichier (une seule écriture O_APPEND par requête)"""
+    global _file_fd
+    data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode()
+    with _file_lock:
+        if _file_fd is None:
+            _file_fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(_file_fd, data)
+
+
+class TracedJSONProvider(DefaultJSONProvider):
+    """Sérialisation JSON de Flask, mesurée dans un span "json.encode" """
+
+    def dumps(self, obj, **kwargs):
+        with span('json.encode'):
+            return super().dumps(obj, **kwargs)
+
+
+def init_tracing(app, service):
+    """Active l'identifiant de requête, les spans et Server-Timing sur l'application"""
+    app.json = TracedJSONProvider(app)
+
+    @app.before_request
+    def _start_trace():
+        g.trace = start_trace(request.headers.get(REQUEST_ID_HEADER, ''), service)
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = g.get('trace')
+        if trace is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else None
+        response.headers[REQUEST_ID_HEADER] = trace.request_id
+        response.headers['Server-Timing'] = finish_trace(trace, request.method, request.path, route,
+                                                         response.status_code)
+        return response
+
+
+def start_trace(request_id, service):
+    """Trace d'une requête entrante (identifiant repris du client s'il est valide)"""
+    if not _VALID_REQUEST_ID.match(request_id):
+        request_id = uuid.uuid4().hex
+    return Trace(request_id, service)
+
+
+def finish_trace(trace, method, path, route, status):
+    """Collecte les spans (si TRACE_FILE est défini) et retourne le header Server-Timing"""
+    total = time.perf_counter() - trace.start
+    if TRACE_FILE:
+        _write_records(trace.records(total, {
+            'method': method,
+            'path': path,
+            'route': route,
+            'status': status
+        }))
+    return trace.server_timing(total)
@@ -0,0 +1,214 @@
+"""
+Pools de connexions HTTP keep-alive vers les microservices
+"""
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Taille des pools (configurable par variables d'environnement)
+UPSTREAM_POOL_CONNECTIONS = int(os.getenv('UPSTREAM_POOL_CONNECTIONS', '4'))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv('UPSTREAM_POOL_MAXSIZE', '32'))
+UPSTREAM_POOL_BLOCK = os.getenv('UPSTREAM_POOL_BLOCK', '0') == '1'
+# Durée (secondes) après laquelle un pool inutilisé ferme ses connexions
+UPSTREAM_POOL_IDLE_TIMEOUT = float(os.getenv('UPSTREAM_POOL_IDLE_TIMEOUT', '60'))
+
+
+class UpstreamPool:
+    """Session keep-alive partagée vers un service, avec éviction des connexions inactives"""
+
+    def __init__(self, base_url, pool_connections=UPSTREAM_POOL_CONNECTIONS,
+                 pool_maxsize=UPSTREAM_POOL_MAXSIZE, pool_block=UPSTREAM_POOL_BLOCK,
+                 idle_timeout=UPSTREAM_POOL_IDLE_TIMEOUT):
+        self.base_url = base_url
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._last_used = time.monotonic()
+        self._in_flight = 0
+
+        # Compteurs d'utilisation
+        self.requests_total = 0
+        self.errors_total = 0
+        self.evictions = 0
+        self._closed_connections = 0
+        self._closed_requests = 0
+
+    def _new_session(self):
+        """Crée une session avec un adaptateur dimensionné pour ce service"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block,
+                              max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _connection_pools(self, session):
+        """Pools urllib3 actuellement ouverts par la session"""
+        pools = []
+        for adapter in session.adapters.values():
+            manager = getattr(adapter, 'poolmanager', None)
+            if manager is None:
+                continue
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is not None and pool not in pools:
+                    pools.append(pool)
+        return pools
+
+    def _evict(self):
+        """Ferme la session courante (appelé sous verrou, sans requête en cours)"""
+        for pool in self._connection_pools(self._session):
+            self._closed_connections += pool.num_connections
+            self._closed_requests += pool.num_requests
+        self._session.close()
+        self._session = None
+        self.evictions += 1
+
+    def _acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            if (self._session is not None and self._in_flight == 0
+                    and now - self._last_used > self.idle_timeout):
+                self._evict()
+            if self._session is None:
+                self._session = self._new_session()
+            self._in_flight += 1
+            self.requests_total += 1
+            return self._session
+
+    def _release(self, failed=False):
+        with self._lock:
+            self._in_flight -= 1
+            self._last_used = time.monotonic()
+            if failed:
+                self.errors_total += 1
+
+    def _release_on_close(self, response):
+        """
+        Reporte _release à la libération de la connexion de la réponse
+
+        urllib3 appelle raw.release_conn à la fin de la lecture du corps,
+        requests à la fermeture de la réponse (plusieurs fois parfois) : le
+        premier appel libère. False si la connexion est déjà libre.
+        """
+        raw = response.raw
+        release_conn = getattr(raw, 'release_conn', None)
+        if release_conn is None or raw.closed:
+            return False
+        pending = [True]
+
+        def release():
+            try:
+                release_conn()
+            finally:
+                try:
+                    # list.pop est atomique : un seul appel passe
+                    pending.pop()
+                except IndexError:
+                    pass
+                else:
+                    self._release()
+
+        raw.release_conn = release
+        return True
+
+    def request(self, method, path, **kwargs):
+        """
+        Envoie une requête sur la session partagée
+
+        Avec stream=True, la requête reste en cours (in_flight, pas
+        d'éviction) jusqu'à la lecture complète du corps ou la fermeture de
+        la réponse.
+        """
+        session = self._acquire()
+        failed = False
+        deferred = False
+        try:
+            response = session.request(method, f"{self.base_url}{path}", **kwargs)
+            deferred = kwargs.get('stream', False) and self._release_on_close(response)
+            return response
+        except requests.exceptions.RequestException:
+            failed = True
+            raise
+        finally:
+            if not deferred:
+                self._release(failed)
+
+    def evict_idle(self):
+        """Ferme les connexions si le pool est inactif depuis trop longtemps"""
+        with self._lock:
+            if (self._session is not None and self._in_flight == 0
+                    and time.monotonic() - self._last_used > self.idle_timeout):
+                self._evict()
+                return True
+        return False
+
+    def stats(self):
+        """Compteurs d'utilisation du pool"""
+        with self._lock:
+            connections = self._closed_connections
+            requests_sent = self._closed_requests
+            available = 0
+            if self._session is not None:
+                for pool in self._connection_pools(self._session):
+                    connections += pool.num_connections
+                    requests_sent += pool.num_requests
+                    available += pool.pool.qsize() if pool.pool is not None else 0
+            return {
+                'pool_maxsize': self.pool_maxsize,
+                'requests': self.requests_total,
+                'errors': self.errors_total,
+                'in_flight': self._in_flight,
+                'connections_opened': connections,
+                'connections_reused': max(requests_sent - connections, 0),
+                'available_slots': available,
+                'evictions': self.evictions
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(base_url):
+    """Retourne le pool partagé associé à une URL de service"""
+    pool = _pools.get(base_url)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(base_url)
+            if pool is None:
+                pool = UpstreamPool(base_url)
+                _pools[base_url] = pool
+    return pool
+
+
+def evict_idle_pools():
+    """Ferme les connexions de tous les pools inactifs"""
+    return [url for url, pool in list(_pools.items()) if pool.evict_idle()]
+
+
+def pool_stats():
+    """Statistiques de tous les pools, indexées par URL de service"""
+    return {url: pool.stats() for url, pool in list(_pools.items())}
+
+
+def start_idle_reaper(interval=None):
+    """Démarre un thread qui ferme périodiquement les pools inactifs"""
+    interval = interval or max(UPSTREAM_POOL_IDLE_TIMEOUT / 2, 1)
+
+    def reap():
+        while True:
+            time.sleep(interval)
+            evict_idle_pools()
+
+    thread = threading.Thread(target=reap, name='upstream-pool-reaper', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,12 @@
+"""
+Point d'entrée WSGI de production
+
+    gunicorn -c gunicorn.conf.py app.wsgi:app
+"""
+from .main import create_app, start_background_tasks
+
+# Les threads d'arrière-plan ne survivent pas au fork : gunicorn les démarre
+# dans chaque worker (post_worker_init dans gunicorn.conf.py). Sans
+# -c gunicorn.conf.py, ils démarrent à la première requête de chaque worker.
+app = create_app(background_tasks=False)
+app.before_request(start_background_tasks)
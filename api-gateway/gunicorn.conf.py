@@ -0,0 +1,40 @@
+"""
+Configuration gunicorn du API Gateway (serveur de production)
+
+    gunicorn -c gunicorn.conf.py app.wsgi:app
+
+Un seul worker par défaut, avec beaucoup de threads (GUNICORN_THREADS) :
+la gateway attend surtout les services. Limites de débit, disjoncteurs,
+caches, regroupement des GET et métriques vivent dans le processus; avec
+WEB_CONCURRENCY workers, chacun a les siens (limites de débit
+WEB_CONCURRENCY fois plus permissives, disjoncteurs et caches qui
+chauffent séparément). Avec GUNICORN_PRELOAD=1, l'application est chargée
+une fois dans le processus maître avant le fork.
+
+Signaux : TERM arrête proprement (les requêtes en cours se terminent dans
+la limite de GUNICORN_GRACEFUL_TIMEOUT). HUP relit la configuration, démarre
+de nouveaux workers puis arrête les anciens; avec GUNICORN_PRELOAD=1, les
+nouveaux workers sont forkés du maître et gardent le code qu'il a chargé :
+pour déployer une nouvelle version, redémarrer le maître (ou USR2, puis
+TERM à l'ancien maître). Avec GUNICORN_PRELOAD=0, HUP recharge aussi le code.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+worker_class = 'gthread'
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Recyclage périodique des workers (fuites mémoire), décalé pour ne pas tous les redémarrer ensemble
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+
+
+def post_worker_init(worker):
+    """Démarre les threads d'arrière-plan de la gateway dans chaque worker"""
+    from app.main import start_background_tasks
+    start_background_tasks()
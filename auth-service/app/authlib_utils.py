@@ -1,12 +1,26 @@
 """
 Utilitaires pour la gestion des tokens Authlib
+
+Refresh tokens (REFRESH_TOKEN_MODE) :
+- opaque (défaut) : chaîne aléatoire, vérifiée et tournée dans refresh_tokens
+- signed : JWT portant sa famille et sa génération, vérifié par la signature;
+  seul l'état des familles est consulté, en mémoire (voir refresh_families)
+Les deux formats restent acceptés au refresh et au logout quel que soit le
+mode : changer de mode ne déconnecte personne.
 """
+import os
 import time
+import uuid
 from authlib.jose import jwt, JoseError
 
 SECRET_KEY = 'votre-cle-secrete-super-secure-2024-microservices'
 JWT_HEADER = {'alg': 'HS256', 'typ': 'JWT'}
 
+REFRESH_TOKEN_MODE = os.getenv('REFRESH_TOKEN_MODE', 'opaque')
+# Clé distincte : un refresh token signé ne doit jamais passer pour un access token
+REFRESH_SECRET_KEY = os.getenv('REFRESH_SECRET_KEY', SECRET_KEY + '-refresh')
+REFRESH_TOKEN_DAYS = 30
+
 def generate_access_token(username):
     """Génère un access token JWT valable une heure"""
     current_time = int(time.time())
@@ -28,15 +42,103 @@ def verify_token(token):
     except JoseError:
         return None
 
-def generate_token_pair(username):
+def generate_signed_refresh_token(username, family, generation):
+    """Génère un refresh token JWT de la famille; retourne (token, expires_at)"""
+    current_time = int(time.time())
+    expires_at = current_time + REFRESH_TOKEN_DAYS * 86400
+    payload = {
+        'sub': username,
+        'fam': family,
+        'gen': generation,
+        'iat': current_time,
+        'exp': expires_at,
+        'type': 'refresh'
+    }
+    token = jwt.encode(JWT_HEADER, payload, REFRESH_SECRET_KEY)
+    return (token.decode('utf-8') if isinstance(token, bytes) else token), expires_at
+
+def verify_signed_refresh_token(token):
+    """Vérifie la signature et l'expiration d'un refresh token JWT"""
+    try:
+        claims = jwt.decode(token, REFRESH_SECRET_KEY)
+        claims.validate()
+    except (JoseError, ValueError):
+        return None
+    if claims.get('type') != 'refresh' or not isinstance(claims.get('gen'), int):
+        return None
+    return claims
+
+def is_signed_refresh_token(token):
+    # Les tokens opaques (token_urlsafe) ne contiennent jamais de point
+    return '.' in token
+
+def generate_token_pair(username, mode=None):
     """
     Génère une paire de tokens (access + refresh)
+    mode: 'opaque' ou 'signed' (défaut : REFRESH_TOKEN_MODE)
     Retourne: (access_token, refresh_token, expires_at)
     """
-    from .database import create_refresh_token
-    
     access_token = generate_access_token(username)
-    refresh_token, expires_at = create_refresh_token(username, expiration_days=30)
+    
+    if (mode or REFRESH_TOKEN_MODE) == 'signed':
+        from .refresh_families import families
+        
+        family = uuid.uuid4().hex
+        refresh_token, expires_at = generate_signed_refresh_token(username, family, 0)
+        families.open(family, username, expires_at)
+    else:
+        from .database import create_refresh_token
+        
+        refresh_token, expires_at = create_refresh_token(username, expiration_days=REFRESH_TOKEN_DAYS)
     
     return access_token, refresh_token, expires_at
 
+
+def rotate_token_pair(refresh_token):
+    """
+    Échange un refresh token contre une nouvelle paire (rotation atomique)
+    Retourne: (username, access_token, refresh_token, expires_at), ou None si
+    le refresh token est invalide, expiré ou déjà utilisé
+    
+    Un refresh token signé déjà utilisé révoque toute sa famille : le
+    voleur comme l'utilisateur légitime devront se reconnecter.
+    """
+    if is_signed_refresh_token(refresh_token):
+        return _rotate_signed(refresh_token)
+    
+    from .database import rotate_refresh_token
+    
+    rotated = rotate_refresh_token(refresh_token, expiration_days=REFRESH_TOKEN_DAYS)
+    if rotated is None:
+        return None
+    username, new_refresh_token, expires_at = rotated
+    
+    return username, generate_access_token(username), new_refresh_token, expires_at
+
+def _rotate_signed(refresh_token):
+    from .refresh_families import families, ACCEPTED
+    
+    claims = verify_signed_refresh_token(refresh_token)
+    if claims is None:
+        return None
+    username, family, generation = claims['sub'], claims['fam'], claims['gen']
+    
+    new_refresh_token, expires_at = generate_signed_refresh_token(username, family, generation + 1)
+    if families.advance(family, username, generation, expires_at) != ACCEPTED:
+        return None
+    
+    return username, generate_access_token(username), new_refresh_token, expires_at
+
+def revoke_refresh(refresh_token):
+    """Révoque un refresh token (logout); un token signé révoque toute sa famille"""
+    if not is_signed_refresh_token(refresh_token):
+        from .database import revoke_refresh_token
+        
+        revoke_refresh_token(refresh_token)
+        return
+    
+    from .refresh_families import families
+    
+    claims = verify_signed_refresh_token(refresh_token)
+    if claims is not None:
+        families.revoke(claims['fam'], claims['sub'], claims['exp'])
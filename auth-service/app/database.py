@@ -1,17 +1,27 @@
 """
 Gestion de la base de données SQLite pour l'authentification
 """
+import hashlib
 import sqlite3
 import secrets
 import time
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
+from .metrics import registry, timed_query
+from .password_hashing import check_password, hash_password, kdf_method, needs_rehash
 
 DB_PATH = 'auth_service.db'
 
+def token_digest(token):
+    """Empreinte stockée à la place du refresh token (32 octets, quelle que soit sa longueur)"""
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
 def init_db():
     """Initialise la base de données avec les tables users et refresh_tokens"""
-    conn = sqlite3.connect(DB_PATH)
+    # Transaction exclusive : si plusieurs workers démarrent en même temps, un seul
+    # crée le schéma et les données par défaut, les autres attendent puis ne trouvent rien à faire
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     cursor = conn.cursor()
+    cursor.execute('BEGIN EXCLUSIVE')
     
     # Créer la table users
     cursor.execute('''
@@ -24,11 +34,12 @@ def init_db():
         )
     ''')
     
-    # Créer la table refresh_tokens
+    # Créer la table refresh_tokens (empreinte SHA-256 du token, jamais le token lui-même)
+    _migrate_refresh_tokens(cursor)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS refresh_tokens (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            token TEXT UNIQUE NOT NULL,
+            token_hash BLOB NOT NULL,
             username TEXT NOT NULL,
             expires_at INTEGER NOT NULL,
             created_at INTEGER NOT NULL,
@@ -36,14 +47,33 @@ def init_db():
         )
     ''')
     
-    # Index pour améliorer les performances
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_token ON refresh_tokens(token)')
+    # Index partiel : seuls les tokens non révoqués y figurent, les lignes
+    # révoquées ne le font plus grossir (les expirées en sortent à la compaction)
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_refresh_tokens_live
+        ON refresh_tokens(token_hash) WHERE revoked = 0
+    ''')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_username ON refresh_tokens(username)')
     
+    # Familles de refresh tokens signés (REFRESH_TOKEN_MODE=signed) : dernière
+    # génération émise et révocation, copie persistée de l'état en mémoire
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS refresh_families (
+            family TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            generation INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
+            revoked BOOLEAN DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_refresh_families_updated ON refresh_families(updated_at)')
+    
     # Créer l'utilisateur admin par défaut
     cursor.execute('SELECT COUNT(*) FROM users WHERE username = ?', ('admin',))
     if cursor.fetchone()[0] == 0:
-        password_hash = generate_password_hash('admin')
+        # Hors pool : init_db s'exécute avant le fork des workers gunicorn
+        password_hash = generate_password_hash('admin', kdf_method)
         cursor.execute('INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
                      ('admin', password_hash, 'admin@example.com'))
         print("[Auth Service] Utilisateur 'admin' créé avec le mot de passe 'admin'")
@@ -51,16 +81,52 @@ def init_db():
     conn.commit()
     conn.close()
 
+def _migrate_refresh_tokens(cursor):
+    """
+    Ancien schéma (token en clair, UNIQUE + idx_token redondant) : les tokens
+    encore valides sont recopiés sous forme d'empreinte, les autres abandonnés
+    """
+    cursor.execute('PRAGMA table_info(refresh_tokens)')
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'token' not in columns:
+        return
+    cursor.connection.create_function('token_digest', 1, token_digest, deterministic=True)
+    cursor.execute('''
+        CREATE TABLE refresh_tokens_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token_hash BLOB NOT NULL,
+            username TEXT NOT NULL,
+            expires_at INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            revoked BOOLEAN DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO refresh_tokens_new (id, token_hash, username, expires_at, created_at, revoked)
+        SELECT id, token_digest(token), username, expires_at, created_at, revoked
+        FROM refresh_tokens WHERE revoked = 0 AND expires_at >= ?
+    ''', (int(time.time()),))
+    migrated = cursor.rowcount
+    cursor.execute('DROP TABLE refresh_tokens')  # supprime aussi idx_token et idx_username
+    cursor.execute('ALTER TABLE refresh_tokens_new RENAME TO refresh_tokens')
+    print(f"[Auth Service] refresh_tokens migrée vers les empreintes ({migrated} tokens valides conservés; "
+          "VACUUM pour rendre l'espace libéré au système)")
+
+@timed_query
 def create_user(username, password, email=''):
-    """Crée un nouvel utilisateur avec mot de passe hashé"""
+    """
+    Crée un nouvel utilisateur avec mot de passe hashé
+    (HashingBusy si la file de hachage est pleine)
+    """
     if not username or not password:
         return False, None, "Username et password requis"
     
+    # Hash calculé avant d'ouvrir la connexion : pas de connexion gardée pendant le calcul
+    password_hash = hash_password(password)
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     try:
-        password_hash = generate_password_hash(password)
         cursor.execute('INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
                      (username, password_hash, email))
         conn.commit()
@@ -74,8 +140,14 @@ def create_user(username, password, email=''):
         conn.close()
         return False, None, f"Erreur: {str(e)}"
 
+@timed_query
 def verify_user(username, password):
-    """Vérifie les identifiants d'un utilisateur"""
+    """
+    Vérifie les identifiants d'un utilisateur (HashingBusy si la file de hachage est pleine)
+    
+    Un mot de passe haché avec d'anciens paramètres du KDF est rehaché
+    avec les paramètres courants une fois vérifié.
+    """
     if not username or not password:
         return False
     
@@ -88,25 +160,90 @@ def verify_user(username, password):
     if user is None:
         return False
     
-    return check_password_hash(user[0], password)
+    if not check_password(user[0], password):
+        return False
+    
+    if needs_rehash(user[0]):
+        rehash_password(username, user[0], password)
+    return True
 
-def create_refresh_token(username, expiration_days=30):
-    """Crée un refresh token pour un utilisateur"""
+def rehash_password(username, old_hash, password):
+    """Remplace le hash par un hash aux paramètres courants (best effort : le login est déjà validé)"""
+    try:
+        new_hash = hash_password(password)
+    except Exception:
+        return
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    # Conditionnel : un changement de mot de passe concurrent n'est pas écrasé
+    cursor.execute('UPDATE users SET password = ? WHERE username = ? AND password = ?',
+                 (new_hash, username, old_hash))
+    conn.commit()
+    conn.close()
+    registry.inc('password_rehash_total')
+
+def _insert_refresh_token(cursor, username, expiration_days):
+    """Ajoute un refresh token (dans la transaction de l'appelant)"""
     token = secrets.token_urlsafe(64)
     current_time = int(time.time())
     expires_at = current_time + (expiration_days * 24 * 3600)
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     cursor.execute('''
-        INSERT INTO refresh_tokens (token, username, expires_at, created_at)
+        INSERT INTO refresh_tokens (token_hash, username, expires_at, created_at)
         VALUES (?, ?, ?, ?)
-    ''', (token, username, expires_at, current_time))
+    ''', (token_digest(token), username, expires_at, current_time))
+    return token, expires_at
+
+@timed_query
+def create_refresh_token(username, expiration_days=30):
+    """Crée un refresh token pour un utilisateur"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    token, expires_at = _insert_refresh_token(cursor, username, expiration_days)
     conn.commit()
     conn.close()
     
     return token, expires_at
 
+@timed_query
+def rotate_refresh_token(token, expiration_days=30):
+    """
+    Remplace un refresh token valide par un nouveau, de façon atomique
+    Retourne: (username, nouveau_token, expires_at), ou None si le token est
+    invalide, expiré ou déjà utilisé
+    
+    Révocation conditionnelle et insertion dans une seule transaction : de deux
+    refresh concurrents avec le même token, un seul révoque la ligne, l'autre
+    échoue au lieu d'obtenir lui aussi un nouveau token.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    try:
+        # Verrou d'écriture pris dès le début : pas d'échec "database is locked"
+        # à la promotion d'un verrou de lecture en écriture
+        cursor.execute('BEGIN IMMEDIATE')
+        digest = token_digest(token)
+        # RETURNING : une fois révoquée, la ligne sort de l'index partiel
+        # idx_refresh_tokens_live; la relire ensuite parcourrait toute la table
+        cursor.execute('''
+            UPDATE refresh_tokens SET revoked = 1
+            WHERE token_hash = ? AND revoked = 0 AND expires_at >= ?
+            RETURNING username
+        ''', (digest, int(time.time())))
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        username = row[0]
+        new_token, expires_at = _insert_refresh_token(cursor, username, expiration_days)
+        conn.commit()
+        return username, new_token, expires_at
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@timed_query
 def verify_refresh_token(token):
     """Vérifie si un refresh token est valide"""
     conn = sqlite3.connect(DB_PATH)
@@ -116,8 +253,8 @@ def verify_refresh_token(token):
     cursor.execute('''
         SELECT username, expires_at, revoked
         FROM refresh_tokens
-        WHERE token = ? AND revoked = 0
-    ''', (token,))
+        WHERE token_hash = ? AND revoked = 0
+    ''', (token_digest(token),))
     
     result = cursor.fetchone()
     conn.close()
@@ -132,11 +269,131 @@ def verify_refresh_token(token):
     
     return username
 
+@timed_query
 def revoke_refresh_token(token):
     """Révoque un refresh token"""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute('UPDATE refresh_tokens SET revoked = 1 WHERE token = ?', (token,))
+    cursor.execute('UPDATE refresh_tokens SET revoked = 1 WHERE token_hash = ? AND revoked = 0',
+                 (token_digest(token),))
     conn.commit()
     conn.close()
 
+@timed_query
+def purge_refresh_tokens(batch_size):
+    """
+    Supprime au plus batch_size tokens révoqués ou expirés
+    Retourne le nombre de lignes supprimées (< batch_size : plus rien à purger)
+    
+    Petits lots, une transaction courte chacun : le verrou d'écriture n'est
+    jamais gardé longtemps face aux login/refresh.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM refresh_tokens WHERE id IN (
+            SELECT id FROM refresh_tokens
+            WHERE revoked = 1 OR expires_at < ?
+            LIMIT ?
+        )
+    ''', (int(time.time()), batch_size))
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+def refresh_tokens_storage():
+    """Lignes de refresh_tokens et octets occupés par la table et chacun de ses index"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM refresh_tokens')
+    rows = cursor.fetchone()[0]
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'refresh_tokens'")
+    names = ['refresh_tokens'] + [row[0] for row in cursor.fetchall()]
+    try:
+        # dbstat : table virtuelle de SQLite (SQLITE_ENABLE_DBSTAT_VTAB)
+        cursor.execute(f"SELECT name, SUM(pgsize), SUM(pgsize - unused) FROM dbstat "
+                       f"WHERE name IN ({','.join('?' * len(names))}) GROUP BY name", names)
+        sizes = {name: (allocated, used) for name, allocated, used in cursor.fetchall()}
+    except sqlite3.OperationalError:
+        sizes = {}
+    cursor.execute('PRAGMA freelist_count')
+    free_pages = cursor.fetchone()[0]
+    cursor.execute('PRAGMA page_size')
+    page_size = cursor.fetchone()[0]
+    conn.close()
+    return {
+        'rows': rows,
+        # Octets alloués (pages) et réellement occupés, par table/index
+        'bytes': {name: sizes.get(name, (None, None))[0] for name in names},
+        'used_bytes': {name: sizes.get(name, (None, None))[1] for name in names},
+        'free_bytes': free_pages * page_size
+    }
+
+
+@timed_query
+def save_refresh_families(families):
+    """
+    Fusionne l'état de familles modifiées en mémoire : (family, username, generation, expires_at, revoked)
+    
+    La génération la plus haute et la révocation l'emportent, quel que soit
+    le processus qui écrit en dernier.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    now = time.time()
+    cursor.executemany('''
+        INSERT INTO refresh_families (family, username, generation, expires_at, revoked, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(family) DO UPDATE SET
+            generation = MAX(generation, excluded.generation),
+            expires_at = MAX(expires_at, excluded.expires_at),
+            revoked = MAX(revoked, excluded.revoked),
+            updated_at = excluded.updated_at
+    ''', [(*family, now) for family in families])
+    conn.commit()
+    conn.close()
+
+@timed_query
+def load_refresh_families(since=0):
+    """Familles non expirées modifiées depuis `since` (horodatage), et l'horodatage le plus récent"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT family, username, generation, expires_at, revoked, updated_at
+        FROM refresh_families
+        WHERE updated_at > ? AND expires_at >= ?
+    ''', (since, int(time.time())))
+    rows = cursor.fetchall()
+    conn.close()
+    latest = max((row[5] for row in rows), default=since)
+    return [row[:5] for row in rows], latest
+
+@timed_query
+def load_refresh_family(family):
+    """État persisté d'une famille (family, username, generation, expires_at, revoked), ou None"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT family, username, generation, expires_at, revoked
+        FROM refresh_families
+        WHERE family = ? AND expires_at >= ?
+    ''', (family, int(time.time())))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+@timed_query
+def purge_refresh_families(batch_size):
+    """Supprime au plus batch_size familles expirées; retourne le nombre de lignes supprimées"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM refresh_families WHERE family IN (
+            SELECT family FROM refresh_families WHERE expires_at < ? LIMIT ?
+        )
+    ''', (int(time.time()), batch_size))
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
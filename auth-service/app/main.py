@@ -1,12 +1,39 @@
 """
 Point d'entrée principal du Auth Service
 """
+import os
+import threading
 from flask import Flask
 from .routes import bp
 from .database import init_db
+from .metrics import init_metrics
+from .tracing import init_tracing
+from .token_compaction import start_token_compaction
+from .refresh_families import start_family_sync
 
-def create_app():
-    """Factory pour créer l'application Flask"""
+_background_pid = None
+_background_lock = threading.Lock()
+
+def start_background_tasks():
+    """Threads d'arrière-plan, démarrés une seule fois dans chaque processus qui sert des requêtes"""
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+    # Purge périodique des refresh tokens révoqués ou expirés
+    start_token_compaction()
+    # État des familles de refresh tokens signés partagé entre processus (aussi en
+    # mode opaque : les tokens signés déjà émis restent valables)
+    start_family_sync()
+
+def create_app(background_tasks=True):
+    """
+    Factory pour créer l'application Flask
+    
+    background_tasks=False : les threads d'arrière-plan ne sont pas démarrés
+    (gunicorn les démarre dans chaque worker, les threads ne survivant pas au fork)
+    """
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'auth-service-secret-key'
     
@@ -17,16 +44,28 @@ def create_app():
     # Enregistrer les routes
     app.register_blueprint(bp, url_prefix='/auth')
     
+    # Métriques Prometheus (GET /metrics)
+    init_metrics(app)
+    
+    # X-Request-Id, spans et Server-Timing (collecte dans TRACE_FILE si défini)
+    init_tracing(app, 'auth-service')
+    
+    if background_tasks:
+        start_background_tasks()
+    
     return app
 
 if __name__ == '__main__':
     app = create_app()
-    print("[Auth Service] Démarrage sur le port 8001")
+    # PORT permet de lancer plusieurs instances derrière la gateway
+    port = int(os.getenv('PORT', '8001'))
+    print(f"[Auth Service] Démarrage sur le port {port}")
     print("[Auth Service] Endpoints disponibles:")
     print("  - POST /auth/login")
     print("  - POST /auth/refresh")
     print("  - POST /auth/verify")
+    print("  - POST /auth/verify/batch")
     print("  - POST /auth/logout")
     print("  - GET  /auth/health")
-    app.run(debug=True, host='0.0.0.0', port=8001)
+    app.run(debug=True, host='0.0.0.0', port=port)
 
@@ -0,0 +1,286 @@
+"""
+Hachage des mots de passe dans un pool de processus dédié
+
+scrypt/pbkdf2 sont volontairement coûteux en CPU. Exécutés sur les threads
+de requête, une vague de logins occupe tous les workers et bloque
+/auth/refresh et /auth/verify, qui ne coûtent presque rien. Ici, le calcul
+part dans un pool de processus. HASH_SERVICE_WORKERS processus et
+HASH_SERVICE_MAX_PENDING calculs en attente sont le budget du service entier,
+partagé entre les WEB_CONCURRENCY workers gunicorn (un processus par CPU et
+8 calculs par processus par défaut). Quand la file est pleine, ou que
+l'attente estimée (file / processus × durée moyenne d'un hash) dépasse
+HASH_MAX_WAIT, la requête est refusée tout de suite (HashingBusy) au lieu
+d'expirer à la gateway (CB_MAX_TIMEOUT, 5 s). Un calcul qui dépasse
+HASH_TIMEOUT, ou un pool dont un processus est mort, donne aussi
+HashingBusy : jamais d'erreur 500.
+
+Paramètres du KDF : KDF_METHOD, sinon le fichier KDF_PARAMS_FILE produit par
+la calibration, sinon le défaut de werkzeug. Les mots de passe hachés avec
+d'autres paramètres sont rehachés au login suivant.
+
+Calibration (sur la machine de production) :
+    python -m app.password_hashing --target-ms 250 --write
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+from .metrics import registry, COUNTER, GAUGE, HISTOGRAM
+
+# Budget du service entier, réparti entre les workers gunicorn (voir worker_share)
+HASH_SERVICE_WORKERS = int(os.getenv('HASH_SERVICE_WORKERS', str(os.cpu_count() or 1)))
+HASH_SERVICE_MAX_PENDING = int(os.getenv('HASH_SERVICE_MAX_PENDING', str(HASH_SERVICE_WORKERS * 16)))
+# Part fixe par worker, prioritaire sur le budget du service (vide : dérivée du budget)
+HASH_POOL_WORKERS = os.getenv('HASH_POOL_WORKERS', '')
+HASH_MAX_PENDING = os.getenv('HASH_MAX_PENDING', '')
+# Attente estimée au-delà de laquelle un calcul est refusé, et délai maximal d'un calcul :
+# tous deux sous le timeout de la gateway (CB_MAX_TIMEOUT, 5 s), pour répondre 429 avant son 504
+HASH_MAX_WAIT = float(os.getenv('HASH_MAX_WAIT', '2'))
+HASH_TIMEOUT = float(os.getenv('HASH_TIMEOUT', '4'))
+KDF_PARAMS_FILE = os.getenv('KDF_PARAMS_FILE', 'kdf_params.json')
+KDF_METHOD = os.getenv('KDF_METHOD', '')
+
+registry.define('password_hash_pending', GAUGE, 'Calculs de hash en attente ou en cours')
+registry.define('password_hash_rejected_total', COUNTER,
+                'Calculs de hash refusés ou abandonnés (file pleine, timeout, pool cassé)')
+registry.define('password_hash_duration_seconds', HISTOGRAM, 'Durée des calculs de hash (attente, calcul)')
+registry.define('password_rehash_total', COUNTER, 'Mots de passe rehachés avec les paramètres courants')
+
+
+class HashingBusy(Exception):
+    """Hachage impossible pour l'instant (file pleine, timeout, pool cassé) : la requête doit être refusée"""
+
+
+def normalize_method(method):
+    """Méthode werkzeug complète, telle qu'elle apparaît en tête des hashs stockés"""
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return 'scrypt:32768:8:1'
+    if name == 'pbkdf2' and len(args) < 2:
+        hash_name = args[0] if args else 'sha256'
+        return f'pbkdf2:{hash_name}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+def _load_method():
+    if KDF_METHOD:
+        return normalize_method(KDF_METHOD)
+    try:
+        with open(KDF_PARAMS_FILE, encoding='utf-8') as f:
+            return normalize_method(json.load(f)['method'])
+    except FileNotFoundError:
+        return normalize_method('scrypt')
+
+
+kdf_method = _load_method()
+
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != kdf_method
+
+
+def _timed(fn, *args):
+    """Exécuté dans le pool : résultat et durée du calcul seul"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def _watch_parent(parent_pid):
+    """
+    Initialisation de chaque processus du pool : il s'arrête avec son parent
+
+    Un worker tué (SIGKILL, SIGTERM sans atexit) ne ferme pas son pool, et
+    les processus du pool, qui gardent les deux bouts de leur file, ne
+    verraient jamais la fin de celle-ci.
+    """
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(1)
+        os._exit(0)
+
+    threading.Thread(target=watch, name='hash-pool-parent-watch', daemon=True).start()
+
+
+def worker_share():
+    """
+    (processus, calculs en attente) revenant à ce worker gunicorn
+
+    WEB_CONCURRENCY est exporté par gunicorn.conf.py après le fork; lu au
+    premier calcul, pas à l'import (fait par le maître avec preload_app).
+    Au moins un processus, et au moins un calcul en attente par processus.
+    """
+    web_concurrency = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+    workers = int(HASH_POOL_WORKERS or max(1, HASH_SERVICE_WORKERS // web_concurrency))
+    max_pending = int(HASH_MAX_PENDING or max(workers, -(-HASH_SERVICE_MAX_PENDING // web_concurrency)))
+    return workers, max_pending
+
+
+class HashPool:
+    """Pool de processus borné, créé à la première utilisation dans chaque processus"""
+
+    def __init__(self, workers=None, max_pending=None):
+        # None : part de ce worker dans le budget du service (worker_share), au premier calcul
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        # Durée moyenne (EWMA) d'un calcul, pour estimer l'attente dans la file
+        self.compute_avg = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        # Un pool hérité du maître gunicorn (fork) n'est pas utilisable
+        if self._executor is None or self._pid != os.getpid():
+            if self.workers is None or self.max_pending is None:
+                workers, max_pending = worker_share()
+                self.workers = self.workers or workers
+                self.max_pending = self.max_pending or max_pending
+            # spawn : un fork d'un processus multi-thread peut hériter de verrous pris
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_watch_parent, initargs=(os.getpid(),))
+            self._pid = os.getpid()
+        return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.pending -= 1
+        registry.inc('password_hash_pending', (), -1)
+
+    def _discard(self, executor):
+        # Processus du pool tué (OOM...) : un nouveau pool sera créé au prochain appel
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def run(self, operation, fn, *args):
+        # Pool cassé (processus tué) : une seconde tentative sur un pool neuf
+        for attempt in (1, 2):
+            try:
+                return self._run(operation, fn, *args)
+            except BrokenProcessPool as e:
+                if attempt == 2:
+                    registry.inc('password_hash_rejected_total', (('operation', operation), ('reason', 'broken')))
+                    raise HashingBusy(f'Pool de hachage indisponible : {e}') from e
+
+    def _run(self, operation, fn, *args):
+        with self._lock:
+            executor = self._get_executor()
+            if self.pending >= self.max_pending:
+                registry.inc('password_hash_rejected_total', (('operation', operation), ('reason', 'queue_full')))
+                raise HashingBusy(f'{self.pending} calculs de hash en cours')
+            wait = self.estimated_wait()
+            if wait > HASH_MAX_WAIT:
+                registry.inc('password_hash_rejected_total', (('operation', operation), ('reason', 'queue_wait')))
+                raise HashingBusy(f'Attente estimée de {wait:.1f} s pour le calcul de hash')
+            self.pending += 1
+        registry.inc('password_hash_pending', (), 1)
+        start = time.perf_counter()
+        try:
+            future = executor.submit(_timed, fn, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+            self._release()
+            raise
+        # Libéré à la fin du calcul, même si l'appelant abandonne sur timeout
+        future.add_done_callback(self._release)
+        try:
+            result, compute = future.result(timeout=HASH_TIMEOUT)
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+        except FutureTimeout as e:
+            registry.inc('password_hash_rejected_total', (('operation', operation), ('reason', 'timeout')))
+            raise HashingBusy(f'Calcul de hash non terminé après {HASH_TIMEOUT} s') from e
+        total = time.perf_counter() - start
+        with self._lock:
+            self.compute_avg = compute if self.compute_avg is None else 0.8 * self.compute_avg + 0.2 * compute
+        registry.observe('password_hash_duration_seconds', (('operation', operation), ('phase', 'compute')), compute)
+        registry.observe('password_hash_duration_seconds', (('operation', operation), ('phase', 'queue')),
+                         max(0.0, total - compute))
+        return result
+
+    def estimated_wait(self):
+        """Attente (s) d'un nouveau calcul : tours de file devant lui plus le sien (0 avant la première mesure)"""
+        if self.compute_avg is None:
+            return 0.0
+        return (self.pending // self.workers + 1) * self.compute_avg
+
+    def stats(self):
+        return {'workers': self.workers, 'max_pending': self.max_pending, 'pending': self.pending,
+                'estimated_wait_ms': round(self.estimated_wait() * 1000, 1)}
+
+
+pool = HashPool()
+
+
+def hash_password(password):
+    """Hash avec les paramètres courants (peut lever HashingBusy)"""
+    return pool.run('hash', generate_password_hash, password, kdf_method)
+
+
+def check_password(password_hash, password):
+    """Vérifie un mot de passe (peut lever HashingBusy)"""
+    return pool.run('verify', check_password_hash, password_hash, password)
+
+
+# ========== Calibration ==========
+def measure(method, rounds=3):
+    """Durée médiane (s) d'un hash avec cette méthode"""
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash('calibration-password', method)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def calibrate(target, algorithm='scrypt'):
+    """Paramètres les plus coûteux dont la durée reste sous la cible (s)"""
+    if algorithm == 'scrypt':
+        candidates = [f'scrypt:{2 ** k}:8:1' for k in range(12, 21)]
+    else:
+        candidates = [f'pbkdf2:sha256:{n}' for n in (100000, 200000, 400000, 600000, 800000,
+                                                   1000000, 1500000, 2000000, 3000000)]
+    chosen, measured = None, None
+    for method in candidates:
+        duration = measure(method)
+        print(f'  {method:<24} {duration * 1000:8.1f} ms')
+        # Le candidat le moins coûteux est gardé même s'il dépasse la cible
+        if duration > target and chosen is not None:
+            break
+        chosen, measured = method, duration
+    return chosen, measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibration des paramètres du KDF des mots de passe')
+    parser.add_argument('--target-ms', type=float, default=250, help='durée visée pour un hash')
+    parser.add_argument('--algorithm', choices=('scrypt', 'pbkdf2'), default='scrypt')
+    parser.add_argument('--write', action='store_true', help=f'enregistrer dans {KDF_PARAMS_FILE}')
+    args = parser.parse_args()
+
+    print(f'[Auth Service] Calibration {args.algorithm}, cible {args.target_ms} ms')
+    method, measured = calibrate(args.target_ms / 1000, args.algorithm)
+    print(f'[Auth Service] Paramètres retenus : {method} ({measured * 1000:.1f} ms), actuels : {kdf_method}')
+    if args.write:
+        with open(KDF_PARAMS_FILE, 'w', encoding='utf-8') as f:
+            json.dump({
+                'method': method,
+                'target_ms': args.target_ms,
+                'measured_ms': round(measured * 1000, 1),
+                'calibrated_at': int(time.time())
+            }, f, indent=2)
+        print(f'[Auth Service] Enregistré dans {KDF_PARAMS_FILE} (rehash des mots de passe au prochain login)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+État des familles de refresh tokens signés (REFRESH_TOKEN_MODE=signed)
+
+Un refresh token signé porte l'identifiant de sa famille (créée au login) et
+son numéro de génération (incrémenté à chaque refresh). Sa validité se
+vérifie par la signature; il suffit de garder en mémoire, par famille, la
+dernière génération émise et la révocation éventuelle :
+- génération courante : accepté, la famille passe à la génération suivante
+- génération ancienne : token rejoué (volé ?), toute la famille est révoquée
+- famille révoquée (logout, rejeu) : refusé
+- famille inconnue (ni en mémoire, ni en base) : refusé
+
+Une famille est écrite dans la table refresh_families dès sa création (login);
+un processus qui ne la connaît pas encore la lit en base avant de décider.
+Les générations et révocations sont ensuite fusionnées toutes les
+REFRESH_FAMILIES_SYNC_INTERVAL secondes avec la table (génération la plus
+haute et révocation gagnent), ce qui les partage entre workers et instances
+et les conserve au redémarrage. Entre deux synchronisations, un rejeu vers un
+autre worker peut passer inaperçu : la détection entre processus est à
+REFRESH_FAMILIES_SYNC_INTERVAL près.
+"""
+import atexit
+import os
+import threading
+import time
+from . import database
+from .metrics import registry, COUNTER
+
+REFRESH_FAMILIES_SYNC_INTERVAL = float(os.getenv('REFRESH_FAMILIES_SYNC_INTERVAL', '5'))
+# Recouvrement des lectures : tolère un léger décalage d'horloge entre instances
+SYNC_OVERLAP = 2 * REFRESH_FAMILIES_SYNC_INTERVAL
+
+ACCEPTED = 'accepted'
+REUSED = 'reused'
+REVOKED = 'revoked'
+UNKNOWN = 'unknown'
+
+registry.define('refresh_token_reuse_total', COUNTER, 'Refresh tokens signés rejoués (famille révoquée)')
+registry.define('refresh_token_unknown_family_total', COUNTER,
+                'Refresh tokens signés refusés : famille absente de la mémoire et de la base')
+registry.define('refresh_families_sync_total', COUNTER, 'Synchronisations des familles avec la base')
+
+
+class FamilyStore:
+    """Dernière génération et révocation de chaque famille, en mémoire"""
+
+    def __init__(self):
+        # famille -> [username, génération valide (dernière émise), expires_at, révoquée]
+        self._families = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._synced_at = 0.0
+
+    def _ensure_loaded(self):
+        # Chaque processus (worker gunicorn après le fork) part de l'état persisté
+        if self._pid == os.getpid():
+            return
+        rows, latest = database.load_refresh_families()
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._families = {}
+            self._dirty = set()
+            self._merge(rows)
+            self._synced_at = latest
+            self._pid = os.getpid()
+
+    def _merge(self, rows):
+        for family, username, generation, expires_at, revoked in rows:
+            entry = self._families.get(family)
+            if entry is None:
+                self._families[family] = [username, generation, expires_at, bool(revoked)]
+            else:
+                entry[1] = max(entry[1], generation)
+                entry[2] = max(entry[2], expires_at)
+                entry[3] = entry[3] or bool(revoked)
+
+    def open(self, family, username, expires_at):
+        """Nouvelle famille (login) : la génération 0 vient d'être émise"""
+        self._ensure_loaded()
+        # Écrite tout de suite : les autres processus doivent la trouver dès le premier refresh
+        database.save_refresh_families([(family, username, 0, expires_at, 0)])
+        with self._lock:
+            self._families[family] = [username, 0, expires_at, False]
+
+    def advance(self, family, username, generation, expires_at):
+        """Présentation du token `generation` de la famille : ACCEPTED, REUSED, REVOKED ou UNKNOWN"""
+        self._ensure_loaded()
+        with self._lock:
+            known = family in self._families
+        if not known:
+            # Ouverte par un autre processus depuis la dernière synchronisation ?
+            row = database.load_refresh_family(family)
+            if row is not None:
+                with self._lock:
+                    self._merge([row])
+        with self._lock:
+            entry = self._families.get(family)
+            if entry is None:
+                # Signature valide mais famille inconnue (base perdue, purgée...) : refus
+                registry.inc('refresh_token_unknown_family_total')
+                return UNKNOWN
+            if entry[3]:
+                return REVOKED
+            if generation < entry[1]:
+                entry[3] = True
+                self._dirty.add(family)
+                registry.inc('refresh_token_reuse_total')
+                return REUSED
+            entry[1] = generation + 1
+            entry[2] = max(entry[2], expires_at)
+            self._dirty.add(family)
+            return ACCEPTED
+
+    def revoke(self, family, username, expires_at):
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._families.setdefault(family, [username, 0, expires_at, True])
+            entry[3] = True
+            self._dirty.add(family)
+
+    def sync(self):
+        """Écrit les familles modifiées, relit celles des autres processus, oublie les expirées"""
+        self._ensure_loaded()
+        with self._lock:
+            dirty = [(family, *self._families[family]) for family in self._dirty if family in self._families]
+            self._dirty = set()
+        try:
+            if dirty:
+                database.save_refresh_families(
+                    [(family, username, generation, expires_at, int(revoked))
+                     for family, username, generation, expires_at, revoked in dirty])
+            rows, latest = database.load_refresh_families(self._synced_at - SYNC_OVERLAP)
+        except Exception:
+            # Réessayé à la prochaine synchronisation
+            with self._lock:
+                self._dirty.update(family for family, *_ in dirty)
+            raise
+        now = int(time.time())
+        with self._lock:
+            self._merge(rows)
+            self._synced_at = max(self._synced_at, latest)
+            for family in [f for f, entry in self._families.items() if entry[2] < now]:
+                del self._families[family]
+                self._dirty.discard(family)
+        registry.inc('refresh_families_sync_total')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'families': len(self._families),
+                'revoked': sum(1 for entry in self._families.values() if entry[3]),
+                'pending_sync': len(self._dirty)
+            }
+
+
+families = FamilyStore()
+
+
+def start_family_sync(interval=REFRESH_FAMILIES_SYNC_INTERVAL):
+    """Démarre la synchronisation périodique (dans chaque processus qui sert des requêtes)"""
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                families.sync()
+            except Exception as e:
+                print(f"[Auth Service] Synchronisation des familles de refresh tokens impossible : {e}")
+
+    thread = threading.Thread(target=run, name='refresh-families-sync', daemon=True)
+    thread.start()
+    atexit.register(families.sync)
+    return thread
@@ -1,16 +1,42 @@
 """
 Routes pour le service d'authentification
 """
+import os
 from flask import Blueprint, request, jsonify
-from .database import verify_user, verify_refresh_token, revoke_refresh_token
-from .authlib_utils import generate_token_pair, verify_token
+from .database import verify_user
+from .authlib_utils import generate_token_pair, rotate_token_pair, revoke_refresh, verify_token
+from .password_hashing import HashingBusy, pool as hash_pool
+from .refresh_families import families as refresh_families
 
 bp = Blueprint('auth', __name__)
 
+# Nombre maximal de tokens par appel à /auth/verify/batch
+VERIFY_BATCH_MAX = int(os.getenv('VERIFY_BATCH_MAX', '100'))
+
+def hashing_busy_response():
+    """
+    Hachage impossible (file pleine, timeout, pool cassé) : refus immédiat
+    
+    429 plutôt que 503 : la gateway compte les 5xx comme des pannes du service,
+    et ouvrirait le disjoncteur pour /auth/refresh et /auth/verify aussi
+    """
+    response = jsonify({
+        'success': False,
+        'error': {
+            'code': 'AUTH_BUSY',
+            'message': 'Trop de connexions en cours, réessayez dans un instant.'
+        }
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+
 @bp.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'auth-service'}), 200
+    return jsonify({'status': 'healthy', 'service': 'auth-service',
+                    'password_hashing': hash_pool.stats(),
+                    'refresh_families': refresh_families.stats()}), 200
 
 @bp.route('/login', methods=['POST'])
 def login():
@@ -28,7 +54,12 @@ def login():
             }
         }), 400
 
-    if not verify_user(username, password):
+    try:
+        valid = verify_user(username, password)
+    except HashingBusy:
+        return hashing_busy_response()
+
+    if not valid:
         return jsonify({
             'success': False,
             'error': {
@@ -66,10 +97,10 @@ def refresh():
             }
         }), 400
 
-    # Vérifier le refresh token
-    username = verify_refresh_token(refresh_token)
+    # Rotation : l'ancien refresh token est révoqué et le nouveau créé en une transaction
+    rotated = rotate_token_pair(refresh_token)
     
-    if not username:
+    if not rotated:
         return jsonify({
             'success': False,
             'error': {
@@ -78,11 +109,7 @@ def refresh():
             }
         }), 401
 
-    # Révoquer l'ancien refresh token (rotation)
-    revoke_refresh_token(refresh_token)
-    
-    # Générer une nouvelle paire de tokens
-    access_token, new_refresh_token, refresh_expires_at = generate_token_pair(username)
+    _, access_token, new_refresh_token, refresh_expires_at = rotated
     
     return jsonify({
         'success': True,
@@ -129,6 +156,57 @@ def verify():
         }
     }), 200
 
+@bp.route('/verify/batch', methods=['POST'])
+def verify_batch():
+    """
+    Vérifie plusieurs tokens en un seul appel (jobs internes, gateways)
+    
+    Un résultat par token, dans l'ordre de la requête; un token répété n'est
+    vérifié qu'une fois. Un token invalide n'empêche pas de vérifier les autres.
+    """
+    data = request.get_json(silent=True) or {}
+    tokens = data.get('tokens')
+
+    if not isinstance(tokens, list) or not tokens:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'MISSING_TOKENS',
+                'message': 'Le champ tokens (liste non vide) est requis.'
+            }
+        }), 400
+
+    if len(tokens) > VERIFY_BATCH_MAX:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'BATCH_TOO_LARGE',
+                'message': f'Au plus {VERIFY_BATCH_MAX} tokens par appel.'
+            }
+        }), 400
+
+    verified = {}
+    results = []
+    for token in tokens:
+        if not isinstance(token, str) or not token:
+            results.append({'valid': False, 'error': {'code': 'MISSING_TOKEN', 'message': 'Le token est requis.'}})
+            continue
+        if token not in verified:
+            payload = verify_token(token)
+            verified[token] = ({'valid': True, 'username': payload.get('sub'), 'expires_at': payload.get('exp')}
+                               if payload else
+                               {'valid': False, 'error': {'code': 'INVALID_TOKEN', 'message': 'Token invalide ou expiré.'}})
+        results.append(verified[token])
+
+    return jsonify({
+        'success': True,
+        'data': {
+            'results': results,
+            'count': len(results),
+            'unique': len(verified)
+        }
+    }), 200
+
 @bp.route('/logout', methods=['POST'])
 def logout():
     """Révoque un refresh token"""
@@ -136,7 +214,7 @@ def logout():
     refresh_token = data.get('refresh_token')
     
     if refresh_token:
-        revoke_refresh_token(refresh_token)
+        revoke_refresh(refresh_token)
     
     return jsonify({
         'success': True,
@@ -161,7 +239,10 @@ def register():
         }), 400
 
     from .database import create_user
-    success, user_id, error = create_user(username, password, email)
+    try:
+        success, user_id, error = create_user(username, password, email)
+    except HashingBusy:
+        return hashing_busy_response()
     
     if not success:
         return jsonify({
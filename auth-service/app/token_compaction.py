@@ -0,0 +1,100 @@
+"""
+Compaction de la table refresh_tokens
+
+Les tokens révoqués (rotation, logout) et expirés ne servent plus à rien
+mais restaient indéfiniment dans la table (de même pour les familles
+expirées de refresh_families). Un thread les supprime toutes les
+TOKEN_COMPACTION_INTERVAL secondes, par lots de TOKEN_COMPACTION_BATCH lignes
+séparés d'une courte pause, et journalise la taille de la table et de ses
+index avant et après.
+
+Exécution ponctuelle :
+    python -m app.token_compaction
+"""
+import os
+import random
+import threading
+import time
+from . import database
+from .metrics import registry, COUNTER, GAUGE
+
+# 0 : pas de compaction automatique
+TOKEN_COMPACTION_INTERVAL = float(os.getenv('TOKEN_COMPACTION_INTERVAL', '3600'))
+TOKEN_COMPACTION_BATCH = int(os.getenv('TOKEN_COMPACTION_BATCH', '500'))
+# Pause entre deux lots : laisse passer les écritures des requêtes
+TOKEN_COMPACTION_PAUSE = float(os.getenv('TOKEN_COMPACTION_PAUSE', '0.05'))
+
+registry.define('refresh_tokens_purged_total', COUNTER, 'Refresh tokens révoqués ou expirés supprimés')
+registry.define('refresh_tokens_storage_bytes', GAUGE, 'Octets occupés par refresh_tokens et ses index')
+
+_storage_reported = {}
+
+
+def _format(storage):
+    parts = [f"{storage['rows']} lignes"]
+    for name, size in storage['bytes'].items():
+        used = storage['used_bytes'][name]
+        parts.append(f"{name} {size / 1024:.0f} Ko (utilisés {used / 1024:.0f} Ko)"
+                     if size is not None else f"{name} ?")
+    parts.append(f"pages libres {storage['free_bytes'] / 1024:.0f} Ko")
+    return ', '.join(parts)
+
+
+def _report(storage):
+    # Jauge : on ajoute l'écart avec la dernière valeur publiée par ce processus
+    for name, size in storage['bytes'].items():
+        if size is not None:
+            labels = (('name', name),)
+            registry.inc('refresh_tokens_storage_bytes', labels, size - _storage_reported.get(name, 0))
+            _storage_reported[name] = size
+
+
+def compact(batch_size=TOKEN_COMPACTION_BATCH, pause=TOKEN_COMPACTION_PAUSE):
+    """Purge complète par petits lots; retourne (supprimées, taille avant, taille après)"""
+    before = database.refresh_tokens_storage()
+    deleted = 0
+    while True:
+        count = database.purge_refresh_tokens(batch_size)
+        deleted += count
+        registry.inc('refresh_tokens_purged_total', (), count)
+        if count < batch_size:
+            break
+        time.sleep(pause)
+    families = 0
+    while True:
+        count = database.purge_refresh_families(batch_size)
+        families += count
+        if count < batch_size:
+            break
+        time.sleep(pause)
+    after = database.refresh_tokens_storage()
+    _report(after)
+    print(f"[Auth Service] Compaction refresh_tokens : {deleted} lignes supprimées "
+          f"({families} familles expirées)")
+    print(f"[Auth Service]   avant : {_format(before)}")
+    print(f"[Auth Service]   après : {_format(after)}")
+    return deleted, before, after
+
+
+def start_token_compaction(interval=TOKEN_COMPACTION_INTERVAL):
+    """Démarre le thread de compaction (dans chaque processus qui sert des requêtes)"""
+    if interval <= 0:
+        return None
+
+    def run():
+        # Décalage aléatoire : les workers ne compactent pas tous au même moment
+        time.sleep(random.uniform(0, interval))
+        while True:
+            try:
+                compact()
+            except Exception as e:
+                print(f"[Auth Service] Compaction refresh_tokens impossible : {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='token-compaction', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    compact()
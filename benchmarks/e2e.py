@@ -0,0 +1,269 @@
+"""
+Benchmark de bout en bout : gateway + trois services sur des bases SQLite temporaires
+
+Scénarios (chaque itération = un utilisateur virtuel qui déroule le script) :
+- login_storm : POST /auth/login
+- catalog     : GET /products puis GET /products/<id>
+- checkout    : GET /products/<id>, POST /orders, GET /orders/<id>
+- profile     : GET /users/profile
+
+Résultat JSON : RPS et p50/p95/p99 par route, pour chaque scénario. Avec
+--baseline, les résultats sont comparés à une référence enregistrée et le
+code de sortie vaut 1 en cas de régression au-delà de --tolerance.
+Tout tourne en local (aucun accès réseau), utilisable en CI.
+
+Usage :
+    python benchmarks/e2e.py --iterations 200 --concurrency 20 --output e2e.json
+    python benchmarks/e2e.py --baseline benchmarks/baselines/e2e.json
+    python benchmarks/e2e.py --baseline benchmarks/baselines/e2e.json --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from loadgen import Connection, summarize
+from stack import LocalStack
+
+SCENARIOS = ('login_storm', 'catalog', 'checkout', 'profile')
+PRODUCT_IDS = range(1, 6)
+CREDENTIALS = {'username': 'admin', 'password': 'admin'}
+
+
+class Recorder:
+    """Latences et erreurs par route"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, latency, ok):
+        self.latencies[route].append(latency)
+        if not ok:
+            self.errors[route] += 1
+
+    def summary(self, elapsed):
+        return {route: summarize(latencies, elapsed, self.errors[route])
+                for route, latencies in sorted(self.latencies.items())}
+
+
+class Session:
+    """Utilisateur virtuel : une connexion keep-alive vers la gateway"""
+
+    def __init__(self, host, port, token, recorder, rng):
+        self.connection = Connection(host, port)
+        self.token = token
+        self.recorder = recorder
+        self.rng = rng
+
+    async def request(self, route, method, path, body=None, auth=False):
+        headers = {'Authorization': f'Bearer {self.token}'} if auth else None
+        start = time.perf_counter()
+        try:
+            response = await self.connection.request(method, path, body, headers)
+        except (OSError, asyncio.IncompleteReadError):
+            self.connection.close()
+            response = None
+        ok = response is not None and response.status < 400
+        self.recorder.record(route, time.perf_counter() - start, ok)
+        return response if ok else None
+
+    def close(self):
+        self.connection.close()
+
+
+# ========== Scénarios ==========
+async def login_storm(session):
+    await session.request('POST /auth/login', 'POST', '/auth/login', CREDENTIALS)
+
+
+async def catalog(session):
+    await session.request('GET /products', 'GET', '/products')
+    product_id = session.rng.choice(PRODUCT_IDS)
+    await session.request('GET /products/<id>', 'GET', f'/products/{product_id}')
+
+
+async def checkout(session):
+    product_id = session.rng.choice(PRODUCT_IDS)
+    await session.request('GET /products/<id>', 'GET', f'/products/{product_id}')
+    response = await session.request('POST /orders', 'POST', '/orders',
+                                     {'items': [{'product_id': product_id, 'quantity': 1}]}, auth=True)
+    if response is not None:
+        order_id = response.json()['data']['id']
+        await session.request('GET /orders/<id>', 'GET', f'/orders/{order_id}', auth=True)
+
+
+async def profile(session):
+    await session.request('GET /users/profile', 'GET', '/users/profile', auth=True)
+
+
+SCENARIO_FUNCTIONS = {
+    'login_storm': login_storm,
+    'catalog': catalog,
+    'checkout': checkout,
+    'profile': profile,
+}
+
+
+async def run_scenario(gateway_url, token, scenario, iterations, concurrency, seed):
+    """Déroule `iterations` fois le scénario avec `concurrency` utilisateurs virtuels"""
+    parts = urlsplit(gateway_url)
+    recorder = Recorder()
+    counter = iter(range(iterations))
+    script = SCENARIO_FUNCTIONS[scenario]
+
+    async def user(index):
+        session = Session(parts.hostname, parts.port, token, recorder, random.Random(seed + index))
+        try:
+            for _ in counter:
+                await script(session)
+        finally:
+            session.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'iterations': iterations,
+        'elapsed_s': round(elapsed, 3),
+        'routes': recorder.summary(elapsed)
+    }
+
+
+async def login(gateway_url):
+    parts = urlsplit(gateway_url)
+    connection = Connection(parts.hostname, parts.port)
+    try:
+        response = await connection.request('POST', '/auth/login', CREDENTIALS)
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError(f'Login impossible ({response.status}) : {response.body[:200]!r}')
+    return response.json()['data']['access_token']
+
+
+def restock(stack):
+    """Stock illimité : le scénario checkout ne doit pas échouer faute de stock"""
+    conn = sqlite3.connect(stack.db_path('orders'), timeout=30)
+    conn.execute('UPDATE products SET stock = 1000000000')
+    conn.commit()
+    conn.close()
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Liste des régressions (RPS en baisse ou p95 en hausse au-delà de la tolérance)"""
+    regressions = []
+    for scenario, current in results['scenarios'].items():
+        reference = baseline.get('scenarios', {}).get(scenario)
+        if reference is None:
+            continue
+        for route, stats in current['routes'].items():
+            ref = reference['routes'].get(route)
+            if ref is None:
+                continue
+            if stats['rps'] < ref['rps'] * (1 - tolerance):
+                regressions.append(f"{scenario} {route} : RPS {ref['rps']} -> {stats['rps']}")
+            if (stats['p95_ms'] > ref['p95_ms'] * (1 + tolerance)
+                    and stats['p95_ms'] - ref['p95_ms'] > min_delta_ms):
+                regressions.append(f"{scenario} {route} : p95 {ref['p95_ms']} ms -> {stats['p95_ms']} ms")
+            if stats['errors'] > ref['errors']:
+                regressions.append(f"{scenario} {route} : erreurs {ref['errors']} -> {stats['errors']}")
+    return regressions
+
+
+def print_table(results, baseline=None):
+    print(f"{'scénario':<12} {'route':<22} {'req':>6} {'err':>4} {'rps':>9} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for scenario, data in results['scenarios'].items():
+        reference = (baseline or {}).get('scenarios', {}).get(scenario, {}).get('routes', {})
+        for route, s in data['routes'].items():
+            line = (f"{scenario:<12} {route:<22} {s['requests']:>6} {s['errors']:>4} {s['rps']:>9} "
+                    f"{s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8}")
+            ref = reference.get(route)
+            if ref:
+                line += f"   (réf. rps {ref['rps']}, p95 {ref['p95_ms']})"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=200, help='itérations par scénario')
+    parser.add_argument('--concurrency', type=int, default=20, help='utilisateurs virtuels')
+    parser.add_argument('--warmup', type=int, default=20, help="itérations d'échauffement (non mesurées)")
+    parser.add_argument('--server', choices=('dev', 'gunicorn'), default='dev')
+    parser.add_argument('--workers', type=int, default=2, help='workers gunicorn par service')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='fichier JSON des résultats')
+    parser.add_argument('--baseline', help='référence JSON à comparer')
+    parser.add_argument('--save-baseline', action='store_true', help='écrire les résultats dans --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='écart relatif toléré (0.25 = 25 %%)')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                        help='hausse minimale du p95 (ms) pour compter comme régression')
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Scénarios inconnus : {', '.join(sorted(unknown))}")
+
+    results = {
+        'meta': {
+            'server': args.server,
+            'workers': args.workers if args.server == 'gunicorn' else 1,
+            'concurrency': args.concurrency,
+            'iterations': args.iterations,
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': int(time.time())
+        },
+        'scenarios': {}
+    }
+
+    with LocalStack(server=args.server, workers=args.workers) as stack:
+        restock(stack)
+        token = asyncio.run(login(stack.gateway_url))
+        for scenario in scenarios:
+            if args.warmup:
+                asyncio.run(run_scenario(stack.gateway_url, token, scenario,
+                                         args.warmup, min(args.concurrency, args.warmup), args.seed))
+            results['scenarios'][scenario] = asyncio.run(run_scenario(
+                stack.gateway_url, token, scenario, args.iterations, args.concurrency, args.seed))
+            print(f"[{scenario}] {results['scenarios'][scenario]['elapsed_s']} s", file=sys.stderr)
+
+    baseline = None
+    if args.baseline and not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        if not args.baseline:
+            parser.error('--save-baseline nécessite --baseline')
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'Référence enregistrée dans {args.baseline}')
+        return
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print('\nRégressions :')
+            for line in regressions:
+                print(f'  - {line}')
+            sys.exit(1)
+        print('\nAucune régression par rapport à la référence.')
+
+
+if __name__ == '__main__':
+    main()
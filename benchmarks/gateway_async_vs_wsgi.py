@@ -0,0 +1,141 @@
+"""
+Benchmark : débit de l'API Gateway en mode Flask/WSGI vs mode ASGI
+
+Démarre un faux Orders Service (latence simulée, même liste de commandes
+quel que soit le chemin), puis la gateway dans chacun des deux modes, et
+envoie des GET /orders concurrents : route protégée, relayée par Flask en
+WSGI et servie nativement en ASGI. Le token est généré localement avec la
+clé de la gateway.
+
+Usage :
+    python benchmarks/gateway_async_vs_wsgi.py --requests 2000 --concurrency 200 --delay 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from loadgen import run_load
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY_DIR = os.path.join(ROOT, 'api-gateway')
+
+ORDERS = json.dumps({
+    'success': True,
+    'data': [{'id': i, 'user_id': 'bench', 'total': 10.0 * i, 'status': 'pending',
+              'date_creation': '2024-01-01 00:00:00'} for i in range(1, 21)],
+    'count': 20
+}).encode('utf-8')
+
+
+def access_token():
+    """Access token valable une heure, signé avec la clé partagée de la gateway"""
+    sys.path.insert(0, GATEWAY_DIR)
+    from authlib.jose import jwt
+    from app.auth_middleware import SECRET_KEY
+    now = int(time.time())
+    token = jwt.encode({'alg': 'HS256', 'typ': 'JWT'},
+                       {'sub': 'bench', 'iat': now, 'exp': now + 3600, 'type': 'access'}, SECRET_KEY)
+    return token.decode('utf-8')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def fake_upstream_app(delay):
+    """Faux Orders Service (ASGI) : la même liste de commandes, pour tout chemin, après `delay` secondes"""
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        await asyncio.sleep(delay)
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': ORDERS})
+    return app
+
+
+def start_fake_upstream(port, delay):
+    """Lance le faux service dans un processus séparé (hors du GIL du générateur de charge)"""
+    code = ("import sys, uvicorn; sys.path.insert(0, %r); import gateway_async_vs_wsgi as b; "
+            "uvicorn.run(b.fake_upstream_app(%r), host='127.0.0.1', port=%d, log_level='warning', "
+            "backlog=4096)") % (os.path.dirname(os.path.abspath(__file__)), delay, port)
+    proc = subprocess.Popen([sys.executable, '-c', code],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_ready(proc, f'http://127.0.0.1:{port}/health', 'faux service')
+    return proc
+
+
+def wait_ready(proc, url, name):
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            with urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'{name} ne démarre pas')
+
+
+def start_gateway(mode, port, upstream_url):
+    # La limitation de débit refuserait l'essentiel des requêtes et fausserait la mesure
+    env = dict(os.environ, ORDERS_SERVICE_URL=upstream_url, PYTHONPATH=GATEWAY_DIR, RATE_LIMIT_ENABLED='0')
+    if mode == 'wsgi':
+        code = ("from werkzeug.serving import run_simple; from app.main import create_app; "
+                f"run_simple('127.0.0.1', {port}, create_app(), threaded=True)")
+        cmd = [sys.executable, '-c', code]
+    else:
+        cmd = [sys.executable, '-m', 'uvicorn', 'app.asgi_app:app',
+               '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    proc = subprocess.Popen(cmd, cwd=GATEWAY_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_ready(proc, f'http://127.0.0.1:{port}/health', f'La gateway ({mode})')
+    return proc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.05, help='latence simulée du service (s)')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    args = parser.parse_args()
+
+    token = access_token()
+    upstream_port = free_port()
+    upstream = start_fake_upstream(upstream_port, args.delay)
+    results = {}
+
+    try:
+        for mode in args.modes.split(','):
+            port = free_port()
+            proc = start_gateway(mode, port, f'http://127.0.0.1:{upstream_port}')
+            try:
+                url = f'http://127.0.0.1:{port}/orders'
+                headers = {'Authorization': f'Bearer {token}'}
+                asyncio.run(run_load(url, min(50, args.requests), min(10, args.concurrency),
+                                     headers=headers))  # échauffement
+                results[mode] = asyncio.run(run_load(url, args.requests, args.concurrency, headers=headers))
+            finally:
+                proc.terminate()
+                proc.wait()
+            print(f"[{mode}] {results[mode]}")
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Générateur de charge HTTP minimal (asyncio, HTTP/1.1 keep-alive)
+
+Volontairement sans dépendance : les clients HTTP asynchrones complets
+deviennent eux-mêmes le goulot d'étranglement à forte concurrence, ce qui
+fausse la mesure du serveur testé.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Connection:
+    """Connexion keep-alive vers un hôte, rouverte si le serveur la ferme"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def _open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None, headers=None):
+        for attempt in (0, 1):
+            if self.writer is None:
+                await self._open()
+            try:
+                return await self._send(method, path, body, headers)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Connexion fermée par le serveur entre deux requêtes : on réessaie une fois
+                self.close()
+                if attempt:
+                    raise
+
+    async def _send(self, method, path, body, headers):
+        payload = b''
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}']
+        if body is not None:
+            payload = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+            lines.append('Content-Type: application/json')
+        lines.append(f'Content-Length: {len(payload)}')
+        for name, value in (headers or {}).items():
+            lines.append(f'{name}: {value}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+        await self.writer.drain()
+
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')
+        status = int(status_line.split(' ', 2)[1])
+        response_headers = {}
+        for line in header_lines:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                response_headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).strip().split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            data = b''.join(chunks)
+        else:
+            data = await self.reader.read()
+            self.close()
+            return Response(status, response_headers, data)
+
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return Response(status, response_headers, data)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Résumé RPS + percentiles (latences en secondes, résultat en ms)"""
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'rps': round(count / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+async def run_load(url, total, concurrency, method='GET', body=None, headers=None):
+    """Envoie `total` requêtes identiques avec `concurrency` connexions"""
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    counter = iter(range(total))
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        connection = Connection(parts.hostname, parts.port)
+        try:
+            for _ in counter:
+                start = time.perf_counter()
+                try:
+                    response = await connection.request(method, path, body, headers)
+                    if response.status >= 400:
+                        errors += 1
+                except (OSError, asyncio.IncompleteReadError):
+                    connection.close()
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
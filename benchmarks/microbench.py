@@ -0,0 +1,356 @@
+"""
+Microbenchmarks des fonctions de database.py, sans HTTP ni Flask
+
+Chaque service est importé tel quel (son propre paquet app), sa base est
+créée par son init_db() dans un répertoire temporaire puis remplie avec des
+volumes réalistes (10k utilisateurs, 100k commandes par défaut). Chaque
+fonction est ensuite appelée seule, en boucle, et sa latence médiane
+comparée à une référence : le code de sortie vaut 1 si une fonction régresse
+au-delà de --tolerance. Un changement de connexion, d'index ou de requête se
+mesure ainsi directement.
+
+Usage :
+    python benchmarks/microbench.py
+    python benchmarks/microbench.py --only verify_refresh_token,get_order_by_id
+    python benchmarks/microbench.py --baseline micro-baseline.json --save-baseline
+    python benchmarks/microbench.py --baseline micro-baseline.json --tolerance 0.3
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import secrets
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from loadgen import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = {
+    'auth': ('auth-service', 'auth_service.db'),
+    'user': ('user-service', 'user_service.db'),
+    'orders': ('orders-service', 'orders_service.db'),
+}
+
+PASSWORD = 'password'
+
+
+def load_database(service, workdir):
+    """Importe app.database d'un service et le fait pointer vers une base temporaire"""
+    directory, db_name = SERVICES[service]
+    # Les trois services ont un paquet "app" : on repart d'un import propre
+    for name in [m for m in sys.modules if m == 'app' or m.startswith('app.')]:
+        del sys.modules[name]
+    # Le chemin reste dans sys.path : les processus du pool de hachage (auth) réimportent app
+    for other, _ in SERVICES.values():
+        if os.path.join(ROOT, other) in sys.path:
+            sys.path.remove(os.path.join(ROOT, other))
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    database = importlib.import_module('app.database')
+    database.DB_PATH = os.path.join(workdir, db_name)
+    database.init_db()
+    return database
+
+
+def username(n):
+    return f'user{n:05d}'
+
+
+# ========== Données ==========
+def seed_auth(database, args, rng):
+    """Utilisateurs et refresh tokens (actifs, expirés et révoqués)"""
+    # Un seul hash pour tous : le calculer 10k fois prendrait plusieurs minutes
+    password_hash = database.hash_password(PASSWORD)
+    now = int(time.time())
+    tokens = []
+    rotation_tokens = []
+    rows = []
+    for n in range(args.users):
+        for _ in range(args.tokens_per_user):
+            token = secrets.token_urlsafe(64)
+            state = rng.random()
+            if state < 0.2:  # expiré
+                rows.append((token, username(n), now - 3600, now - 31 * 86400, 0))
+            elif state < 0.3:  # révoqué
+                rows.append((token, username(n), now + 86400, now - 86400, 1))
+            else:
+                rows.append((token, username(n), now + 30 * 86400, now, 0))
+                # Une partie est réservée à la rotation, qui les révoque
+                (rotation_tokens if state > 0.9 else tokens).append(token)
+
+    conn = sqlite3.connect(database.DB_PATH)
+    conn.executemany('INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
+                     [(username(n), password_hash, f'{username(n)}@example.com') for n in range(args.users)])
+    conn.executemany('''
+        INSERT INTO refresh_tokens (token_hash, username, expires_at, created_at, revoked)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(database.token_digest(token), *rest) for token, *rest in rows])
+    conn.commit()
+    conn.close()
+    return {'tokens': tokens, 'rotation_tokens': rotation_tokens}
+
+
+def seed_user(database, args, rng):
+    conn = sqlite3.connect(database.DB_PATH)
+    conn.executemany('''
+        INSERT INTO users (username, email, first_name, last_name, phone, address)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(username(n), f'{username(n)}@example.com', 'Prénom', f'Nom {n}',
+           f'06{n:08d}', f'{n} rue de la Paix, Paris') for n in range(args.users)])
+    conn.commit()
+    conn.close()
+    return {}
+
+
+def seed_orders(database, args, rng):
+    """Catalogue de --products produits et --orders commandes de 1 à 3 articles"""
+    conn = sqlite3.connect(database.DB_PATH)
+    existing = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+    conn.executemany('INSERT INTO products (name, price, description, stock) VALUES (?, ?, ?, ?)',
+                     [(f'Produit {n}', round(rng.uniform(5, 2000), 2), f'Description du produit {n}', 10 ** 9)
+                      for n in range(existing, args.products)])
+    conn.execute('UPDATE products SET stock = ?', (10 ** 9,))
+    product_count = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    orders = []
+    items = []
+    for order_id in range(1, args.orders + 1):
+        lines = [(order_id, rng.randint(1, product_count), rng.randint(1, 3), round(rng.uniform(5, 2000), 2))
+                 for _ in range(rng.randint(1, 3))]
+        items.extend(lines)
+        orders.append((order_id, username(rng.randrange(args.users)),
+                       round(sum(q * p for _, _, q, p in lines), 2), rng.choice(('pending', 'shipped', 'delivered'))))
+    conn.executemany('INSERT INTO orders (id, user_id, total, status) VALUES (?, ?, ?, ?)', orders)
+    conn.executemany('INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)', items)
+    conn.commit()
+    conn.close()
+    return {'orders': orders, 'product_count': product_count}
+
+
+SEEDERS = {'auth': seed_auth, 'user': seed_user, 'orders': seed_orders}
+
+
+# ========== Cas mesurés ==========
+# nom -> (service, itérations, fabrique(database, data, args, rng) -> appel sans argument)
+def _verify_user(database, data, args, rng):
+    return lambda: database.verify_user(username(rng.randrange(args.users)), PASSWORD)
+
+
+def _create_refresh_token(database, data, args, rng):
+    return lambda: database.create_refresh_token(username(rng.randrange(args.users)))
+
+
+def _verify_refresh_token(database, data, args, rng):
+    tokens = data['tokens']
+    return lambda: database.verify_refresh_token(rng.choice(tokens))
+
+
+def _rotate_refresh_token(database, data, args, rng):
+    # Chaque rotation consomme un token et en remet un neuf dans la réserve
+    tokens = list(data['rotation_tokens'])
+
+    def call():
+        result = database.rotate_refresh_token(tokens.pop(rng.randrange(len(tokens))))
+        if result is not None:
+            tokens.append(result[1])
+        return result
+    return call
+
+
+def _get_all_users(database, data, args, rng):
+    return database.get_all_users
+
+
+def _get_user_by_username(database, data, args, rng):
+    return lambda: database.get_user_by_username(username(rng.randrange(args.users)))
+
+
+def _get_all_products(database, data, args, rng):
+    return database.get_all_products
+
+
+def _get_order_by_id(database, data, args, rng):
+    orders = data['orders']
+
+    def call():
+        order_id, user_id, _, _ = rng.choice(orders)
+        return database.get_order_by_id(order_id, user_id)
+    return call
+
+
+def _create_order(database, data, args, rng):
+    count = data['product_count']
+
+    def call():
+        items = [{'product_id': rng.randint(1, count), 'quantity': 1} for _ in range(2)]
+        return database.create_order(username(rng.randrange(args.users)), items)
+    return call
+
+
+CASES = {
+    'verify_user': ('auth', 20, _verify_user),
+    'create_refresh_token': ('auth', 300, _create_refresh_token),
+    'verify_refresh_token': ('auth', 1000, _verify_refresh_token),
+    'rotate_refresh_token': ('auth', 300, _rotate_refresh_token),
+    'get_all_users': ('user', 20, _get_all_users),
+    'get_user_by_username': ('user', 1000, _get_user_by_username),
+    'get_all_products': ('orders', 1000, _get_all_products),
+    'get_order_by_id': ('orders', 1000, _get_order_by_id),
+    'create_order': ('orders', 300, _create_order),
+}
+
+# Résultat attendu d'un appel réussi : on ne mesure pas un chemin d'erreur
+CHECKS = {
+    'verify_user': lambda r: r is True,
+    'verify_refresh_token': lambda r: r is not None,
+    'rotate_refresh_token': lambda r: r is not None,
+    'get_user_by_username': lambda r: r is not None,
+    'get_order_by_id': lambda r: r is not None and r['items'],
+    'create_order': lambda r: r[0],
+}
+
+
+def measure(call, iterations, warmup):
+    for _ in range(warmup):
+        call()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'median_us': round(statistics.median(latencies) * 1e6, 1),
+        'mean_us': round(statistics.fmean(latencies) * 1e6, 1),
+        'p95_us': round(percentile(latencies, 0.95) * 1e6, 1),
+        'min_us': round(latencies[0] * 1e6, 1)
+    }
+
+
+def run(args, names):
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='microshop-microbench-')
+    try:
+        for service in SERVICES:
+            selected = [name for name in names if CASES[name][0] == service]
+            if not selected:
+                continue
+            rng = random.Random(args.seed)
+            database = load_database(service, workdir)
+            start = time.perf_counter()
+            data = SEEDERS[service](database, args, rng)
+            print(f'[{service}] données créées en {time.perf_counter() - start:.1f} s', file=sys.stderr)
+
+            for name in selected:
+                _, iterations, factory = CASES[name]
+                call = factory(database, data, args, random.Random(args.seed))
+                check = CHECKS.get(name)
+                if check is not None and not check(call()):
+                    raise RuntimeError(f'{name} : résultat inattendu, la mesure porterait sur un chemin d\'erreur')
+                iterations = max(1, int(iterations * args.scale))
+                results[name] = dict(measure(call, iterations, min(args.warmup, iterations)), service=service)
+                print(f"[{service}] {name} : médiane {results[name]['median_us']} µs", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_us):
+    """Fonctions dont la médiane dépasse la référence au-delà de la tolérance"""
+    regressions = []
+    for name, stats in results['functions'].items():
+        ref = baseline.get('functions', {}).get(name)
+        if ref is None:
+            continue
+        if (stats['median_us'] > ref['median_us'] * (1 + tolerance)
+                and stats['median_us'] - ref['median_us'] > min_delta_us):
+            regressions.append(f"{name} : médiane {ref['median_us']} µs -> {stats['median_us']} µs")
+    return regressions
+
+
+def print_table(results, baseline=None):
+    reference = (baseline or {}).get('functions', {})
+    print(f"{'fonction':<24} {'service':<8} {'n':>6} {'médiane':>10} {'p95':>10} {'min':>10}")
+    for name, s in results['functions'].items():
+        line = (f"{name:<24} {s['service']:<8} {s['iterations']:>6} {s['median_us']:>10} "
+                f"{s['p95_us']:>10} {s['min_us']:>10}")
+        ref = reference.get(name)
+        if ref:
+            line += f"   (réf. {ref['median_us']}, {(s['median_us'] / ref['median_us'] - 1) * 100:+.0f} %)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', help='fonctions à mesurer, séparées par des virgules')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--tokens-per-user', type=int, default=3)
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplicateur du nombre d'itérations")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='fichier JSON des résultats')
+    parser.add_argument('--baseline', help='référence JSON à comparer')
+    parser.add_argument('--save-baseline', action='store_true', help='écrire les résultats dans --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='hausse relative tolérée (0.3 = 30 %%)')
+    parser.add_argument('--min-delta-us', type=float, default=20.0,
+                        help='hausse minimale de la médiane (µs) pour compter comme régression')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(CASES)
+    unknown = set(names) - set(CASES)
+    if unknown:
+        parser.error(f"Fonctions inconnues : {', '.join(sorted(unknown))}")
+    if args.save_baseline and not args.baseline:
+        parser.error('--save-baseline nécessite --baseline')
+
+    results = {
+        'meta': {
+            'users': args.users,
+            'orders': args.orders,
+            'products': args.products,
+            'tokens_per_user': args.tokens_per_user,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'timestamp': int(time.time())
+        },
+        'functions': run(args, names)
+    }
+
+    baseline = None
+    if args.baseline and not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'Référence enregistrée dans {args.baseline}')
+        return
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_us)
+        if regressions:
+            print('\nRégressions :')
+            for line in regressions:
+                print(f'  - {line}')
+            sys.exit(1)
+        print('\nAucune régression par rapport à la référence.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Rotation des refresh tokens sous concurrence (Auth Service seul, base temporaire)
+
+- Débit : --sessions sessions, chacune avec sa propre chaîne de refresh tokens,
+  enchaînent --rounds rotations; --concurrency requêtes en vol
+- Course : --race requêtes simultanées avec le MÊME refresh token;
+  une seule doit réussir (rotation atomique)
+  (refresh tokens signés avec plusieurs workers : la détection entre workers
+  étant à REFRESH_FAMILIES_SYNC_INTERVAL près, des succès multiples sont possibles)
+
+Usage :
+    python benchmarks/refresh_rotation.py --sessions 50 --rounds 20 --concurrency 50
+    python benchmarks/refresh_rotation.py --server gunicorn --workers 2 --race 20
+    python benchmarks/refresh_rotation.py --refresh-mode signed
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from urllib.parse import urlsplit
+
+from loadgen import Connection, summarize
+from stack import LocalStack
+
+CREDENTIALS = {'username': 'admin', 'password': 'admin'}
+
+
+async def login_many(host, port, count):
+    """Un refresh token par session (logins séquentiels : le hachage est coûteux)"""
+    connection = Connection(host, port)
+    tokens = []
+    try:
+        for _ in range(count):
+            response = await connection.request('POST', '/auth/login', CREDENTIALS)
+            if response.status != 200:
+                raise RuntimeError(f'Login impossible ({response.status}) : {response.body[:200]!r}')
+            tokens.append(response.json()['data']['refresh_token'])
+    finally:
+        connection.close()
+    return tokens
+
+
+async def throughput(host, port, tokens, rounds, concurrency):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def session(token):
+        nonlocal errors
+        connection = Connection(host, port)
+        try:
+            for _ in range(rounds):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await connection.request('POST', '/auth/refresh', {'refresh_token': token})
+                    latencies.append(time.perf_counter() - start)
+                if response.status != 200:
+                    errors += 1
+                    return
+                token = response.json()['data']['refresh_token']
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(token) for token in tokens))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def race(host, port, token, count):
+    """Refresh simultanés du même token : nombre de succès (1 attendu)"""
+    connections = [Connection(host, port) for _ in range(count)]
+    try:
+        # Connexions ouvertes d'abord, pour que les requêtes partent ensemble
+        await asyncio.gather(*(c._open() for c in connections))
+        responses = await asyncio.gather(*(c.request('POST', '/auth/refresh', {'refresh_token': token})
+                                           for c in connections))
+    finally:
+        for connection in connections:
+            connection.close()
+    return sum(1 for r in responses if r.status == 200)
+
+
+async def run(url, args):
+    parts = urlsplit(url)
+    tokens = await login_many(parts.hostname, parts.port, args.sessions + args.race_rounds)
+    result = {'throughput': await throughput(parts.hostname, parts.port, tokens[:args.sessions],
+                                             args.rounds, args.concurrency)}
+    successes = [await race(parts.hostname, parts.port, token, args.race) for token in tokens[args.sessions:]]
+    result['race'] = {
+        'concurrent_requests': args.race,
+        'rounds': args.race_rounds,
+        'successes_per_token': successes,
+        'double_spends': sum(1 for s in successes if s > 1)
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=20, help='rotations par session')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--race', type=int, default=10, help='refresh simultanés du même token')
+    parser.add_argument('--race-rounds', type=int, default=10, help='nombre de tokens soumis à la course')
+    parser.add_argument('--server', choices=('dev', 'gunicorn'), default='dev')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--refresh-mode', choices=('opaque', 'signed'), default='opaque',
+                        help='REFRESH_TOKEN_MODE du Auth Service')
+    parser.add_argument('--output', help='fichier JSON des résultats')
+    args = parser.parse_args()
+
+    env = {'REFRESH_TOKEN_MODE': args.refresh_mode}
+    with LocalStack(server=args.server, workers=args.workers, env=env) as stack:
+        result = asyncio.run(run(stack.urls['auth'], args))
+    result['meta'] = {'server': args.server, 'sessions': args.sessions, 'rounds': args.rounds,
+                      'concurrency': args.concurrency, 'refresh_mode': args.refresh_mode}
+
+    t = result['throughput']
+    print(f"Rotation : {t['requests']} refresh, {t['errors']} erreurs, {t['rps']} req/s, "
+          f"p50 {t['p50_ms']} ms, p95 {t['p95_ms']} ms, p99 {t['p99_ms']} ms")
+    r = result['race']
+    print(f"Course : {r['concurrent_requests']} refresh simultanés du même token, succès par token "
+          f"{r['successes_per_token']} -> {r['double_spends']} token(s) utilisé(s) plusieurs fois")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    return 1 if r['double_spends'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
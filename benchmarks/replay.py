@@ -0,0 +1,301 @@
+"""
+Rejeu d'une capture de la gateway (CAPTURE_FILE) contre une pile locale
+
+Les requêtes sont renvoyées dans l'ordre de la capture :
+- --speed 1  : au rythme d'origine (mêmes écarts entre requêtes)
+- --speed 10 : dix fois plus vite
+- --speed max : sans attente, avec --concurrency requêtes en vol
+
+Les secrets masqués à la capture sont remplacés : mots de passe et username
+du login par --username/--password, tokens par ceux d'une session ouverte au
+démarrage (les refresh tokens renvoyés pendant le rejeu sont réutilisés).
+
+Rapport par route : durée côté gateway capturée vs rejouée (p50/p95, lue
+dans Server-Timing), latence côté client et nombre de statuts différents
+de la capture (ex. commandes inexistantes dans la base locale).
+
+Usage :
+    python benchmarks/replay.py capture.jsonl                       # pile locale temporaire
+    python benchmarks/replay.py capture.jsonl --speed max --concurrency 50
+    python benchmarks/replay.py capture.jsonl --target http://localhost:5000 --speed 5
+"""
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import sys
+import time
+import uuid
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+
+from loadgen import Connection, percentile
+from stack import LocalStack
+
+REDACTED = '<redacted>'
+_SERVER_TOTAL = re.compile(r'(?:^|,)\s*total;dur=([\d.]+)')
+
+
+def load_capture(path, routes=None, limit=None):
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if routes and entry['route'] not in routes:
+                continue
+            entries.append(entry)
+    entries.sort(key=lambda e: e['ts'])
+    return entries[:limit] if limit else entries
+
+
+def server_duration(response):
+    """Durée totale côté gateway (ms), d'après Server-Timing"""
+    match = _SERVER_TOTAL.search(response.headers.get('server-timing', ''))
+    return float(match.group(1)) if match else None
+
+
+class ReplayContext:
+    """Identifiants substitués aux valeurs masquées de la capture"""
+
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+        self.run_id = uuid.uuid4().hex[:8]
+        self.access_token = None
+        self.refresh_tokens = deque()
+        self.fallback_refresh_token = None
+
+    def take_refresh_token(self):
+        return self.refresh_tokens.popleft() if self.refresh_tokens else self.fallback_refresh_token
+
+    def keep_tokens(self, response):
+        """Les refresh tokens émis pendant le rejeu servent aux refresh suivants"""
+        if response.status != 200:
+            return
+        try:
+            data = response.json().get('data') or {}
+        except ValueError:
+            return
+        if isinstance(data, dict) and data.get('refresh_token'):
+            self.refresh_tokens.append(data['refresh_token'])
+
+    def substitute(self, value, route, key=None):
+        if isinstance(value, dict):
+            return {k: self.substitute(v, route, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.substitute(v, route) for v in value]
+        if key == 'password' and value == REDACTED:
+            return self.password
+        if key == 'refresh_token' and value == REDACTED:
+            return self.take_refresh_token()
+        if key in ('token', 'access_token') and value == REDACTED:
+            return self.access_token
+        if key == 'username' and route == '/auth/login':
+            return self.username
+        if key == 'username' and route == '/auth/register':
+            # Unique par rejeu : l'inscription ne doit pas échouer sur un doublon d'un rejeu précédent
+            return f'{value}-{self.run_id}'
+        return value
+
+
+class ConnectionPool:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._idle = []
+
+    def acquire(self):
+        return self._idle.pop() if self._idle else Connection(self.host, self.port)
+
+    def release(self, connection):
+        self._idle.append(connection)
+
+    def close(self):
+        for connection in self._idle:
+            connection.close()
+
+
+class Results:
+    def __init__(self):
+        self.captured = defaultdict(list)
+        self.server = defaultdict(list)
+        self.client = defaultdict(list)
+        self.status_mismatches = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.lag = []
+
+    def report(self, elapsed):
+        def stats(values):
+            values = sorted(v for v in values if v is not None)
+            return {
+                'p50_ms': round(percentile(values, 0.50), 2),
+                'p95_ms': round(percentile(values, 0.95), 2)
+            }
+
+        routes = {}
+        for route in sorted(self.client):
+            captured, replayed = stats(self.captured[route]), stats(self.server[route])
+            routes[route] = {
+                'requests': len(self.client[route]),
+                'errors': self.errors[route],
+                'status_mismatches': self.status_mismatches[route],
+                'captured': captured,
+                'replayed': replayed,
+                'client': stats(self.client[route]),
+                'delta_p50_ms': round(replayed['p50_ms'] - captured['p50_ms'], 2),
+                'delta_p95_ms': round(replayed['p95_ms'] - captured['p95_ms'], 2)
+            }
+        lag = sorted(self.lag)
+        return {
+            'elapsed_s': round(elapsed, 3),
+            'requests': sum(len(v) for v in self.client.values()),
+            'schedule_lag_p95_ms': round(percentile(lag, 0.95) * 1000, 2),
+            'routes': routes
+        }
+
+
+async def send(pool, ctx, results, entry):
+    headers = {'Authorization': f'Bearer {ctx.access_token}'} if entry.get('auth') else None
+    body = ctx.substitute(entry['body'], entry['route']) if entry.get('body') is not None else None
+    route = f"{entry['method']} {entry['route']}"
+    connection = pool.acquire()
+    start = time.perf_counter()
+    try:
+        response = await connection.request(entry['method'], entry['path'], body, headers)
+    except (OSError, asyncio.IncompleteReadError):
+        connection.close()
+        results.client[route].append((time.perf_counter() - start) * 1000)
+        results.errors[route] += 1
+        return
+    results.client[route].append((time.perf_counter() - start) * 1000)
+    pool.release(connection)
+
+    results.captured[route].append(entry.get('duration_ms'))
+    results.server[route].append(server_duration(response))
+    if response.status // 100 != entry['status'] // 100:
+        results.status_mismatches[route] += 1
+    if entry['route'] in ('/auth/login', '/auth/refresh'):
+        ctx.keep_tokens(response)
+
+
+async def replay(entries, base_url, ctx, speed, concurrency):
+    parts = urlsplit(base_url)
+    pool = ConnectionPool(parts.hostname, parts.port)
+    results = Results()
+    start = time.perf_counter()
+
+    if speed is None:  # débit maximal
+        pending = iter(entries)
+
+        async def worker():
+            for entry in pending:
+                await send(pool, ctx, results, entry)
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    else:
+        origin = entries[0]['ts'] if entries else 0
+        tasks = []
+        for entry in entries:
+            scheduled = start + (entry['ts'] - origin) / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            results.lag.append(max(0.0, time.perf_counter() - scheduled))
+            tasks.append(asyncio.create_task(send(pool, ctx, results, entry)))
+        await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return results.report(elapsed)
+
+
+async def open_session(base_url, ctx, refresh_tokens):
+    """Access token et refresh tokens initiaux (un login par refresh token)"""
+    parts = urlsplit(base_url)
+    connection = Connection(parts.hostname, parts.port)
+    try:
+        for i in range(max(1, refresh_tokens)):
+            response = await connection.request('POST', '/auth/login',
+                                                {'username': ctx.username, 'password': ctx.password})
+            if response.status != 200:
+                raise RuntimeError(f'Login impossible ({response.status}) : {response.body[:200]!r}')
+            data = response.json()['data']
+            ctx.access_token = data['access_token']
+            if i == 0:
+                ctx.fallback_refresh_token = data['refresh_token']
+            else:
+                ctx.refresh_tokens.append(data['refresh_token'])
+    finally:
+        connection.close()
+
+
+def print_report(report):
+    print(f"{'route':<34} {'req':>6} {'err':>4} {'stat≠':>6} {'capt p50':>9} {'rej p50':>8} "
+          f"{'Δp50':>8} {'capt p95':>9} {'rej p95':>8} {'Δp95':>8}")
+    for route, r in report['routes'].items():
+        print(f"{route:<34} {r['requests']:>6} {r['errors']:>4} {r['status_mismatches']:>6} "
+              f"{r['captured']['p50_ms']:>9} {r['replayed']['p50_ms']:>8} {r['delta_p50_ms']:>+8} "
+              f"{r['captured']['p95_ms']:>9} {r['replayed']['p95_ms']:>8} {r['delta_p95_ms']:>+8}")
+    print(f"\n{report['requests']} requêtes en {report['elapsed_s']} s "
+          f"(retard p95 sur le planning : {report['schedule_lag_p95_ms']} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='fichier JSONL produit par CAPTURE_FILE')
+    parser.add_argument('--speed', default='1', help="facteur d'accélération (1, 10...) ou 'max'")
+    parser.add_argument('--concurrency', type=int, default=20, help='requêtes en vol avec --speed max')
+    parser.add_argument('--target', help='URL de la gateway (par défaut : pile locale temporaire)')
+    parser.add_argument('--server', choices=('dev', 'gunicorn'), default='dev')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--routes', help='routes à rejouer, séparées par des virgules (ex. /products)')
+    parser.add_argument('--limit', type=int, help='nombre maximal de requêtes')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--max-refresh-tokens', type=int, default=10,
+                        help='refresh tokens ouverts au démarrage pour les /auth/refresh et /auth/logout')
+    parser.add_argument('--output', help='fichier JSON du rapport')
+    args = parser.parse_args()
+
+    if args.speed == 'max':
+        speed = None
+    else:
+        speed = float(args.speed)
+        if speed <= 0:
+            parser.error('--speed doit être positif')
+
+    entries = load_capture(args.capture, set(args.routes.split(',')) if args.routes else None, args.limit)
+    if not entries:
+        parser.error('Aucune requête à rejouer')
+    refresh_needed = sum(1 for e in entries if e['route'] in ('/auth/refresh', '/auth/logout'))
+
+    ctx = ReplayContext(args.username, args.password)
+
+    def run(base_url):
+        asyncio.run(open_session(base_url, ctx, min(refresh_needed, args.max_refresh_tokens) + 1))
+        return asyncio.run(replay(entries, base_url, ctx, speed, args.concurrency))
+
+    if args.target:
+        report = run(args.target.rstrip('/'))
+    else:
+        with LocalStack(server=args.server, workers=args.workers) as stack:
+            # Stock illimité : les commandes rejouées ne doivent pas échouer faute de stock
+            conn = sqlite3.connect(stack.db_path('orders'), timeout=30)
+            conn.execute('UPDATE products SET stock = 1000000000')
+            conn.commit()
+            conn.close()
+            report = run(stack.gateway_url)
+
+    report['capture'] = args.capture
+    report['speed'] = args.speed
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Pile locale pour les benchmarks : les trois services et la gateway,
+chacun dans un processus et un répertoire temporaire (bases SQLite neuves)
+
+    with LocalStack(server='dev') as stack:
+        stack.gateway_url  # http://127.0.0.1:<port>
+
+server='dev'      : serveur Werkzeug multi-thread (comme python -m app.main, sans reloader)
+server='gunicorn' : configuration de production (gunicorn.conf.py de chaque service)
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# nom -> (répertoire, route de santé, fichier SQLite)
+SERVICES = {
+    'auth': ('auth-service', '/auth/health', 'auth_service.db'),
+    'user': ('user-service', '/health', 'user_service.db'),
+    'orders': ('orders-service', '/health', 'orders_service.db'),
+}
+GATEWAY = ('api-gateway', '/health', None)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(proc, url, name, log_path=None, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            with urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    proc.kill()
+    hint = f' (voir {log_path})' if log_path else ''
+    raise RuntimeError(f'{name} ne démarre pas{hint}')
+
+
+class LocalStack:
+    """Démarre la pile complète; arrêtée et nettoyée à la sortie du bloc with"""
+
+    def __init__(self, server='dev', workers=2, threads=8, env=None, keep=False):
+        self.server = server
+        self.workers = workers
+        self.threads = threads
+        self.env = env or {}
+        self.keep = keep
+        self.workdir = None
+        self.urls = {}
+        self._procs = []
+
+    def db_path(self, name):
+        return os.path.join(self.workdir, name, SERVICES[name][2])
+
+    @property
+    def gateway_url(self):
+        return self.urls['gateway']
+
+    def _command(self, directory, port):
+        source = os.path.join(ROOT, directory)
+        if self.server == 'gunicorn':
+            return [sys.executable, '-m', 'gunicorn', '-c', os.path.join(source, 'gunicorn.conf.py'),
+                    '--pythonpath', source, '--bind', f'127.0.0.1:{port}',
+                    '--workers', str(self.workers), '--threads', str(self.threads), 'app.wsgi:app']
+        code = ("from werkzeug.serving import run_simple; from app.main import create_app; "
+                f"run_simple('127.0.0.1', {port}, create_app(), threaded=True)")
+        return [sys.executable, '-c', code]
+
+    def _start(self, name, directory, health_path, extra_env):
+        port = free_port()
+        cwd = os.path.join(self.workdir, name)
+        os.makedirs(cwd, exist_ok=True)
+        env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, directory), PORT=str(port),
+                   GUNICORN_ACCESSLOG='/dev/null', **extra_env, **self.env)
+        log_path = os.path.join(self.workdir, f'{name}.log')
+        with open(log_path, 'wb') as log:
+            proc = subprocess.Popen(self._command(directory, port), cwd=cwd, env=env,
+                                    stdout=log, stderr=subprocess.STDOUT)
+        self._procs.append(proc)
+        self.urls[name] = f'http://127.0.0.1:{port}'
+        wait_ready(proc, self.urls[name] + health_path, name, log_path)
+
+    def __enter__(self):
+        self.workdir = tempfile.mkdtemp(prefix='microshop-bench-')
+        try:
+            for name, (directory, health_path, _) in SERVICES.items():
+                self._start(name, directory, health_path, {})
+            self._start('gateway', GATEWAY[0], GATEWAY[1], {
+                'AUTH_SERVICE_URL': self.urls['auth'],
+                'USER_SERVICE_URL': self.urls['user'],
+                'ORDERS_SERVICE_URL': self.urls['orders'],
+                # La limitation de débit fausserait la mesure
+                'RATE_LIMIT_ENABLED': '0',
+            })
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        for proc in reversed(self._procs):
+            proc.terminate()
+        for proc in self._procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self._procs = []
+        if self.workdir and not self.keep:
+            shutil.rmtree(self.workdir, ignore_errors=True)
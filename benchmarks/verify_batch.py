@@ -0,0 +1,140 @@
+"""
+Vérification de tokens : /auth/verify (un token par appel) contre
+/auth/verify/batch (plusieurs tokens par appel), sur le Auth Service seul
+
+Les access tokens sont générés localement avec authlib_utils du service
+(même clé), un sujet différent par token : pas de logins coûteux. Pour
+chaque taille de lot, --total tokens sont vérifiés avec --concurrency
+requêtes en vol; la latence par token d'un lot est celle de l'appel divisée
+par la taille du lot.
+
+Usage :
+    python benchmarks/verify_batch.py
+    python benchmarks/verify_batch.py --batch-sizes 10,50,100 --duplicates 0.5
+    python benchmarks/verify_batch.py --server gunicorn --workers 2 --output verify.json
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+from loadgen import Connection, summarize
+from stack import LocalStack, ROOT
+
+
+def mint_tokens(count, duplicates, rng):
+    """count tokens, dont une proportion `duplicates` répète des tokens déjà tirés"""
+    sys.path.insert(0, os.path.join(ROOT, 'auth-service'))
+    authlib_utils = importlib.import_module('app.authlib_utils')
+    distinct = [authlib_utils.generate_access_token(f'user{n:05d}')
+                for n in range(max(1, round(count * (1 - duplicates))))]
+    tokens = distinct + [rng.choice(distinct) for _ in range(count - len(distinct))]
+    rng.shuffle(tokens)
+    return tokens
+
+
+def check(response, size):
+    """Réponse complète et tous les tokens valides (les tokens générés le sont tous)"""
+    if response.status != 200:
+        return False
+    if size is None:
+        return response.json()['success']
+    results = response.json()['data']['results']
+    return len(results) == size and all(r['valid'] for r in results)
+
+
+async def run_mode(host, port, tokens, size, concurrency):
+    """size None : /auth/verify, sinon /auth/verify/batch par lots de size tokens"""
+    step = size or 1
+    chunks = [tokens[i:i + step] for i in range(0, len(tokens), step)]
+    queue = iter(chunks)
+    latencies = []
+    per_token = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        connection = Connection(host, port)
+        try:
+            for chunk in queue:
+                if size is None:
+                    path, body = '/auth/verify', {'token': chunk[0]}
+                else:
+                    path, body = '/auth/verify/batch', {'tokens': chunk}
+                start = time.perf_counter()
+                response = await connection.request('POST', path, body)
+                elapsed = time.perf_counter() - start
+                latencies.append(elapsed)
+                per_token.extend([elapsed / len(chunk)] * len(chunk))
+                if not check(response, None if size is None else len(chunk)):
+                    errors += 1
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    result = summarize(latencies, elapsed, errors)
+    tokens_summary = summarize(per_token, elapsed)
+    result['tokens'] = len(per_token)
+    result['tokens_per_s'] = tokens_summary['rps']
+    result['per_token_p50_ms'] = tokens_summary['p50_ms']
+    result['per_token_p95_ms'] = tokens_summary['p95_ms']
+    return result
+
+
+async def run(url, tokens, args):
+    parts = urlsplit(url)
+    results = {}
+    for size in [None] + args.batch_sizes:
+        name = 'single' if size is None else f'batch_{size}'
+        # Chauffe : connexions, imports paresseux, caches
+        await run_mode(parts.hostname, parts.port, tokens[:args.warmup], size, args.concurrency)
+        results[name] = await run_mode(parts.hostname, parts.port, tokens, size, args.concurrency)
+    return results
+
+
+def print_table(results):
+    print(f"{'mode':<12} {'appels':>7} {'erreurs':>7} {'tokens/s':>9} {'appel p50':>10} {'appel p95':>10} "
+          f"{'token p50':>10} {'token p95':>10} {'gain':>6}")
+    single = results['single']['per_token_p50_ms']
+    for name, r in results.items():
+        gain = single / r['per_token_p50_ms'] if r['per_token_p50_ms'] else 0.0
+        print(f"{name:<12} {r['requests']:>7} {r['errors']:>7} {r['tokens_per_s']:>9} {r['p50_ms']:>8} ms "
+              f"{r['p95_ms']:>7} ms {r['per_token_p50_ms']:>7} ms {r['per_token_p95_ms']:>7} ms {gain:>5.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--total', type=int, default=5000, help='tokens vérifiés par mode')
+    parser.add_argument('--batch-sizes', default='10,50,100', help='tailles de lot (VERIFY_BATCH_MAX au plus)')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='proportion de tokens répétés')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=200, help='tokens vérifiés avant chaque mesure')
+    parser.add_argument('--server', choices=('dev', 'gunicorn'), default='dev')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='fichier JSON des résultats')
+    args = parser.parse_args()
+    args.batch_sizes = [int(size) for size in args.batch_sizes.split(',') if size]
+
+    tokens = mint_tokens(args.total, args.duplicates, random.Random(args.seed))
+    with LocalStack(server=args.server, workers=args.workers) as stack:
+        results = asyncio.run(run(stack.urls['auth'], tokens, args))
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'results': results,
+                       'meta': {'server': args.server, 'total': args.total, 'duplicates': args.duplicates,
+                                'concurrency': args.concurrency}}, f, indent=2)
+    return 1 if any(r['errors'] for r in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
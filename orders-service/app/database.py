@@ -3,13 +3,17 @@ Gestion de la base de données SQLite pour les produits et commandes
 """
 import sqlite3
 import time
+from .metrics import timed_query
 
 DB_PATH = 'orders_service.db'
 
 def init_db():
     """Initialise la base de données avec les tables products, orders et order_items"""
-    conn = sqlite3.connect(DB_PATH)
+    # Transaction exclusive : si plusieurs workers démarrent en même temps, un seul
+    # crée le schéma et les données par défaut, les autres attendent puis ne trouvent rien à faire
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     cursor = conn.cursor()
+    cursor.execute('BEGIN EXCLUSIVE')
     
     # Table products
     cursor.execute('''
@@ -66,6 +70,7 @@ def init_db():
     conn.commit()
     conn.close()
 
+@timed_query
 def get_all_products():
     """Récupère tous les produits"""
     conn = sqlite3.connect(DB_PATH)
@@ -76,6 +81,7 @@ def get_all_products():
     conn.close()
     return products
 
+@timed_query
 def get_product_by_id(product_id):
     """Récupère un produit par son ID"""
     conn = sqlite3.connect(DB_PATH)
@@ -86,6 +92,7 @@ def get_product_by_id(product_id):
     conn.close()
     return dict(product) if product else None
 
+@timed_query
 def get_orders_by_user(user_id):
     """Récupère toutes les commandes d'un utilisateur"""
     conn = sqlite3.connect(DB_PATH)
@@ -96,6 +103,7 @@ def get_orders_by_user(user_id):
     conn.close()
     return orders
 
+@timed_query
 def get_order_by_id(order_id, user_id=None):
     """Récupère une commande par son ID"""
     conn = sqlite3.connect(DB_PATH)
@@ -122,8 +130,9 @@ def get_order_by_id(order_id, user_id=None):
         order_dict['items'] = items
     
     conn.close()
-    return dict(order) if order else None
+    return order_dict if order else None
 
+@timed_query
 def create_order(user_id, items):
     """Crée une nouvelle commande"""
     conn = sqlite3.connect(DB_PATH)
@@ -170,6 +179,7 @@ def create_order(user_id, items):
         conn.close()
         return False, None, f"Erreur: {str(e)}"
 
+@timed_query
 def update_order_status(order_id, status, user_id=None):
     """Met à jour le statut d'une commande"""
     conn = sqlite3.connect(DB_PATH)
@@ -14,6 +14,11 @@ def get_current_user_id():
     """Récupère l'ID de l'utilisateur depuis les headers"""
     return request.headers.get('X-User-Id')
 
+def conditional(response):
+    """Ajoute un ETag à la réponse et répond 304 si If-None-Match correspond"""
+    response.add_etag()
+    return response.make_conditional(request)
+
 @bp.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -24,11 +29,11 @@ def health():
 def list_products():
     """Liste tous les produits"""
     products = get_all_products()
-    return jsonify({
+    return conditional(jsonify({
         'success': True,
         'data': products,
         'count': len(products)
-    }), 200
+    }))
 
 @bp.route('/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
@@ -43,10 +48,10 @@ def get_product(product_id):
             }
         }), 404
     
-    return jsonify({
+    return conditional(jsonify({
         'success': True,
         'data': product
-    }), 200
+    }))
 
 # ========== Routes Orders (protégées) ==========
 @bp.route('/orders', methods=['GET'])
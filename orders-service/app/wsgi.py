@@ -0,0 +1,8 @@
+"""
+Point d'entrée WSGI de production
+
+    gunicorn -c gunicorn.conf.py app.wsgi:app
+"""
+from .main import create_app
+
+app = create_app()
@@ -0,0 +1,31 @@
+"""
+Configuration gunicorn du Orders Service (serveur de production)
+
+    gunicorn -c gunicorn.conf.py app.wsgi:app
+
+Workers pré-forkés (WEB_CONCURRENCY) avec plusieurs threads chacun
+(GUNICORN_THREADS). Avec GUNICORN_PRELOAD=1, l'application (et init_db)
+est chargée une fois dans le processus maître avant le fork.
+
+Signaux : TERM arrête proprement (les requêtes en cours se terminent dans
+la limite de GUNICORN_GRACEFUL_TIMEOUT). HUP relit la configuration, démarre
+de nouveaux workers puis arrête les anciens; avec GUNICORN_PRELOAD=1, les
+nouveaux workers sont forkés du maître et gardent le code qu'il a chargé :
+pour déployer une nouvelle version, redémarrer le maître (ou USR2, puis
+TERM à l'ancien maître). Avec GUNICORN_PRELOAD=0, HUP recharge aussi le code.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8003')}"
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Recyclage périodique des workers (fuites mémoire), décalé pour ne pas tous les redémarrer ensemble
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
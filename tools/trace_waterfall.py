@@ -0,0 +1,109 @@
+"""
+Cascade (waterfall) des spans d'une requête, à partir des fichiers TRACE_FILE
+
+Les spans de la gateway et des services partagent le même X-Request-Id; ils
+sont regroupés par identifiant et affichés sur un axe de temps commun.
+
+Usage :
+    TRACE_FILE=/tmp/traces.jsonl  (pour la gateway et chaque service)
+    python tools/trace_waterfall.py /tmp/traces.jsonl                  # dernière requête
+    python tools/trace_waterfall.py /tmp/traces.jsonl --slowest 5      # 5 plus lentes
+    python tools/trace_waterfall.py /tmp/traces.jsonl --request-id <id>
+    python tools/trace_waterfall.py /tmp/traces.jsonl --route "/orders" --method POST
+"""
+import argparse
+import json
+from collections import defaultdict
+
+BAR_WIDTH = 50
+
+
+def load_spans(paths):
+    """Spans groupés par identifiant de requête"""
+    requests = defaultdict(list)
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Dernière ligne tronquée si un service écrit encore
+                    continue
+                requests[record['request_id']].append(record)
+    return requests
+
+
+def root_span(spans):
+    """Span "request" le plus englobant (celui de la gateway en général)"""
+    roots = [s for s in spans if s['name'] == 'request']
+    if not roots:
+        return None
+    return min(roots, key=lambda s: (s['start'], -s['duration_ms']))
+
+
+def render(request_id, spans):
+    spans = sorted(spans, key=lambda s: s['start'])
+    origin = min(s['start'] for s in spans)
+    end = max(s['start'] + s['duration_ms'] / 1000 for s in spans)
+    total_ms = max((end - origin) * 1000, 0.001)
+
+    root = root_span(spans)
+    attrs = root['attrs'] if root else {}
+    lines = [f"Requête {request_id}  {attrs.get('method', '?')} {attrs.get('path', '?')} "
+             f"-> {attrs.get('status', '?')}  ({total_ms:.2f} ms)"]
+
+    name_width = max(len(f"{s['service']} {s['name']}") for s in spans)
+    for s in spans:
+        offset_ms = (s['start'] - origin) * 1000
+        first = int(offset_ms / total_ms * BAR_WIDTH)
+        length = max(1, int(round(s['duration_ms'] / total_ms * BAR_WIDTH)))
+        bar = ' ' * first + '█' * min(length, BAR_WIDTH - first)
+        label = f"{s['service']} {s['name']}".ljust(name_width)
+        lines.append(f"  {label} |{bar.ljust(BAR_WIDTH)}| +{offset_ms:8.2f} ms {s['duration_ms']:8.2f} ms")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='+', help='Fichiers JSONL de spans (TRACE_FILE)')
+    parser.add_argument('--request-id', help='Identifiant de requête à afficher')
+    parser.add_argument('--slowest', type=int, default=0, help='Afficher les N requêtes les plus lentes')
+    parser.add_argument('--route', help='Ne garder que cette route (ex: /orders/<int:order_id>)')
+    parser.add_argument('--method', help='Ne garder que cette méthode HTTP')
+    args = parser.parse_args()
+
+    requests = load_spans(args.files)
+
+    if args.request_id:
+        if args.request_id not in requests:
+            parser.error(f'Aucun span pour la requête {args.request_id}')
+        print(render(args.request_id, requests[args.request_id]))
+        return
+
+    candidates = []
+    for request_id, spans in requests.items():
+        root = root_span(spans)
+        if root is None:
+            continue
+        if args.route and root['attrs'].get('route') != args.route:
+            continue
+        if args.method and root['attrs'].get('method') != args.method.upper():
+            continue
+        candidates.append((root, request_id))
+
+    if not candidates:
+        parser.error('Aucune requête ne correspond')
+
+    if args.slowest:
+        selected = sorted(candidates, key=lambda c: c[0]['duration_ms'], reverse=True)[:args.slowest]
+    else:
+        selected = [max(candidates, key=lambda c: c[0]['start'])]
+
+    print('\n\n'.join(render(request_id, requests[request_id]) for _, request_id in selected))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,17 @@ Gestion de la base de données SQLite pour les profils utilisateurs
 """
 import sqlite3
 from werkzeug.security import generate_password_hash
+from .metrics import timed_query
 
 DB_PATH = 'user_service.db'
 
 def init_db():
     """Initialise la base de données avec la table users"""
-    conn = sqlite3.connect(DB_PATH)
+    # Transaction exclusive : si plusieurs workers démarrent en même temps, un seul
+    # crée le schéma et les données par défaut, les autres attendent puis ne trouvent rien à faire
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     cursor = conn.cursor()
+    cursor.execute('BEGIN EXCLUSIVE')
     
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -37,6 +41,7 @@ def init_db():
     conn.commit()
     conn.close()
 
+@timed_query
 def get_all_users():
     """Récupère tous les utilisateurs"""
     conn = sqlite3.connect(DB_PATH)
@@ -47,6 +52,7 @@ def get_all_users():
     conn.close()
     return users
 
+@timed_query
 def get_user_by_id(user_id):
     """Récupère un utilisateur par son ID"""
     conn = sqlite3.connect(DB_PATH)
@@ -57,6 +63,7 @@ def get_user_by_id(user_id):
     conn.close()
     return dict(user) if user else None
 
+@timed_query
 def get_user_by_username(username):
     """Récupère un utilisateur par son username"""
     conn = sqlite3.connect(DB_PATH)
@@ -67,6 +74,7 @@ def get_user_by_username(username):
     conn.close()
     return dict(user) if user else None
 
+@timed_query
 def create_user(username, email=None, first_name=None, last_name=None, phone=None, address=None):
     """Crée un nouvel utilisateur"""
     conn = sqlite3.connect(DB_PATH)
@@ -87,6 +95,7 @@ def create_user(username, email=None, first_name=None, last_name=None, phone=Non
         conn.close()
         return False, None, f"Erreur: {str(e)}"
 
+@timed_query
 def update_user(user_id, email=None, first_name=None, last_name=None, phone=None, address=None):
     """Met à jour un utilisateur"""
     conn = sqlite3.connect(DB_PATH)
@@ -123,6 +132,7 @@ def update_user(user_id, email=None, first_name=None, last_name=None, phone=None
     conn.close()
     return True, None
 
+@timed_query
 def delete_user(user_id):
     """Supprime un utilisateur"""
     conn = sqlite3.connect(DB_PATH)
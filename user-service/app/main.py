@@ -1,9 +1,12 @@
 """
 Point d'entrée principal du User Service
 """
+import os
 from flask import Flask
 from .routes import bp
 from .database import init_db
+from .metrics import init_metrics
+from .tracing import init_tracing
 
 def create_app():
     """Factory pour créer l'application Flask"""
@@ -17,11 +20,19 @@ def create_app():
     # Enregistrer les routes
     app.register_blueprint(bp)
     
+    # Métriques Prometheus (GET /metrics)
+    init_metrics(app)
+    
+    # X-Request-Id, spans et Server-Timing (collecte dans TRACE_FILE si défini)
+    init_tracing(app, 'user-service')
+    
     return app
 
 if __name__ == '__main__':
     app = create_app()
-    print("[User Service] Démarrage sur le port 8002")
+    # PORT permet de lancer plusieurs instances derrière la gateway
+    port = int(os.getenv('PORT', '8002'))
+    print(f"[User Service] Démarrage sur le port {port}")
     print("[User Service] Endpoints disponibles:")
     print("  - GET    /users")
     print("  - GET    /users/{id}")
@@ -30,5 +41,5 @@ if __name__ == '__main__':
     print("  - DELETE /users/{id}")
     print("  - GET    /users/profile")
     print("  - GET    /health")
-    app.run(debug=True, host='0.0.0.0', port=8002)
+    app.run(debug=True, host='0.0.0.0', port=port)
 